@@ -0,0 +1,195 @@
+import os
+import pickle
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from export import DAY_PARTITIONING
+
+PUNCTUATION_RE = r"[^\w\s]"
+GROUP_COLUMNS = {"user": "owner_id", "day": "day"}
+
+
+def tokenize(texts: pd.Series, lowercase: bool = True) -> pd.Series:
+    """
+    Splits texts into alphabetic words with vectorized string ops.
+    The result keeps the index of the source text, one row per token.
+    """
+    texts = texts.fillna("").str.replace(PUNCTUATION_RE, "", regex=True)
+    if lowercase:
+        texts = texts.str.lower()
+    tokens = texts.str.split().explode()
+    return tokens[tokens.str.isalpha().fillna(False).astype(bool)]
+
+
+class TermCounter:
+    """
+    Streaming term frequency counter over chunks of posts.
+
+    Memory depends on the vocabulary (times number of users or days for
+    grouped counters), not on the number of posts. `last_id` is the highest
+    post id counted so far. `files` are the exported Parquet files already
+    counted, so a saved counter can later be updated with the files written
+    by new exports only (see `count_exported_terms`).
+    """
+
+    by: str | None
+    counts: Counter
+    last_id: int
+    posts: int
+    files: set[str]
+
+    def __init__(self, by: str | None = None, stopwords: set[str] | None = None):
+        if by is not None and by not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group terms by {by}")
+        self.by = by
+        self.stopwords = stopwords or set()
+        self.counts = Counter()
+        self.last_id = 0
+        self.posts = 0
+        self.files = set()
+
+    def update(self, chunk: pd.DataFrame | pa.RecordBatch | pa.Table):
+        """Counts terms of a chunk with `post_text` (and grouping) columns."""
+        if not isinstance(chunk, pd.DataFrame):
+            chunk = chunk.to_pandas()
+        if not len(chunk):
+            return
+        tokens = tokenize(chunk["post_text"])
+        if self.stopwords:
+            tokens = tokens[~tokens.isin(self.stopwords)]
+
+        if self.by is None:
+            self.counts.update(tokens.value_counts().to_dict())
+        else:
+            keys = self._group_keys(chunk).loc[tokens.index]
+            pairs = pd.DataFrame({"key": keys.to_numpy(), "term": tokens.to_numpy()})
+            self.counts.update(pairs.value_counts().to_dict())
+
+        if "id" in chunk:
+            self.last_id = max(self.last_id, int(chunk["id"].max()))
+        self.posts += len(chunk)
+
+    def _group_keys(self, chunk: pd.DataFrame) -> pd.Series:
+        column = GROUP_COLUMNS[self.by]  # type: ignore
+        if column == "day" and "day" not in chunk:
+            return pd.to_datetime(chunk["creation_date"]).dt.date
+        return chunk[column]
+
+    def merge(self, other: "TermCounter"):
+        self.counts.update(other.counts)
+        self.last_id = max(self.last_id, other.last_id)
+        self.posts += other.posts
+        self.files |= other.files
+
+    def most_common(self, n: int = 20, key=None) -> list[tuple[str, int]]:
+        """Top terms overall, or for one user id / day of a grouped counter."""
+        return Counter(self.frequencies(key)).most_common(n)
+
+    def frequencies(self, key=None) -> dict[str, int]:
+        """Term -> count mapping, e.g. for `WordCloud.generate_from_frequencies`."""
+        if self.by is None:
+            return dict(self.counts)
+        result = Counter()
+        for (k, term), count in self.counts.items():
+            if key is None or k == key:
+                result[term] += count
+        return dict(result)
+
+    def to_frame(self) -> pd.DataFrame:
+        if self.by is None:
+            frame = pd.DataFrame(self.counts.items(), columns=["term", "count"])
+        else:
+            frame = pd.DataFrame(
+                [(k, term, c) for (k, term), c in self.counts.items()],
+                columns=[self.by, "term", "count"],
+            )
+        return frame.sort_values("count", ascending=False, ignore_index=True)
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path: str) -> "TermCounter":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def _count_chunk(args) -> TermCounter:
+    chunk, by, stopwords = args
+    counter = TermCounter(by, stopwords)
+    counter.update(chunk)
+    return counter
+
+
+def count_terms(
+    chunks,
+    by: str | None = None,
+    stopwords: set[str] | None = None,
+    processes: int = 1,
+    counter: TermCounter | None = None,
+) -> TermCounter:
+    """
+    Counts terms over an iterable of chunks (DataFrames or record batches).
+    With `processes` > 1 chunks are counted in worker processes, at most
+    two chunks per process are in flight so memory stays bounded.
+    """
+    if counter is None:
+        counter = TermCounter(by, stopwords)
+    if processes <= 1:
+        for chunk in chunks:
+            counter.update(chunk)
+        return counter
+
+    with ProcessPoolExecutor(processes) as pool:
+        in_flight = set()
+        for chunk in chunks:
+            task = (chunk, counter.by, counter.stopwords)
+            in_flight.add(pool.submit(_count_chunk, task))
+            if len(in_flight) >= processes * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    counter.merge(future.result())
+        for future in in_flight:
+            counter.merge(future.result())
+    return counter
+
+
+def count_exported_terms(
+    root: str,
+    by: str | None = None,
+    stopwords: set[str] | None = None,
+    counter: TermCounter | None = None,
+    processes: int = 1,
+    batch_size: int = 100_000,
+) -> TermCounter:
+    """
+    Counts terms of the exported posts dataset (see `export.py`).
+    When `counter` is given only the files it has not counted are read:
+    exports only add files, and new files may hold posts of any id.
+    """
+    if counter is None:
+        counter = TermCounter(by, stopwords)
+    directory = os.path.join(root, "posts")
+    files = [
+        path
+        for path in ds.dataset(directory, format="parquet").files
+        if os.path.relpath(path, directory) not in counter.files
+    ]
+    if files:
+        dataset = ds.dataset(
+            files,
+            format="parquet",
+            partitioning=DAY_PARTITIONING,
+            partition_base_dir=directory,
+        )
+        batches = dataset.to_batches(
+            columns=["id", "post_text", "owner_id", "day"], batch_size=batch_size
+        )
+        count_terms(batches, processes=processes, counter=counter)
+    counter.files.update(os.path.relpath(path, directory) for path in files)
+    return counter
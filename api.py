@@ -0,0 +1,504 @@
+"""
+Read-only HTTP query API over the database, so that analysts and dashboards
+do not run ad-hoc queries against the database the crawlers write to:
+
+    GET /users/{username}
+    GET /users/{username}/posts?since=&until=&limit=&cursor=
+    GET /users/{username}/followers?limit=&cursor=
+    GET /posts?since=&until=&limit=&cursor=
+    GET /search?q=&user=&since=&substring=1&limit=&cursor=
+    GET /stats
+
+Responses are JSON. Lists are paged by keyset: a page is `{"items": [...],
+"next": cursor}` where `next` is the opaque cursor of the following page
+(null on the last one), so a deep page costs as much as the first one.
+
+The API opens its own read-only pool, which may point at a replica.
+Response bodies are kept in a bounded LRU cache for `ttl` seconds, and
+entries are dropped as soon as the change feed (see changefeed.py) shows a
+write they were read from. The feed is polled rather than LISTENed to:
+notifications do not reach replicas. Over shards (see sharding.py) the
+feed of every shard is followed.
+"""
+import asyncio
+import base64
+import json
+import logging
+import re
+from collections import Counter, OrderedDict, defaultdict, deque
+from datetime import date, datetime
+from time import monotonic, perf_counter
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+from changefeed import Change
+from database import Database
+from sharding import ShardedDatabase
+from sinks import open_sink
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ResponseCache:
+    """
+    LRU cache of at most `max_entries` response bodies, each kept at most
+    `ttl` seconds. Entries are tagged with the rows they were read from
+    ("user:42", "posts:42", "followers:42", or "posts" for any post) and
+    dropped by `invalidate`.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 60.0, clock=monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        # key -> (expiry, body, tags)
+        self._entries: OrderedDict[str, tuple[float, bytes, tuple[str, ...]]] = (
+            OrderedDict()
+        )
+        self._tagged: dict[str, set[str]] = {}
+        # bumped by every invalidation, see `put`
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= self._clock():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, body: bytes, tags, version: int | None = None):
+        """
+        Caches `body`. With the `version` read before the body was queried,
+        the body is not cached if an invalidation happened in between: it
+        may predate the write.
+        """
+        if version is not None and version != self.version:
+            return
+        if key in self._entries:
+            self._remove(key)
+        tags = tuple(tags)
+        self._entries[key] = (self._clock() + self.ttl, body, tags)
+        for tag in tags:
+            self._tagged.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def invalidate(self, tags) -> int:
+        """Drops the entries with any of `tags`. Returns their number."""
+        self.version += 1
+        removed = 0
+        for tag in tags:
+            for key in self._tagged.pop(tag, ()):
+                if key in self._entries:
+                    self._remove(key)
+                    removed += 1
+        self.invalidated += removed
+        return removed
+
+    def clear(self):
+        self.version += 1
+        self.invalidated += len(self._entries)
+        self._entries.clear()
+        self._tagged.clear()
+
+
+def change_tags(change: Change) -> list[str]:
+    """Cache tags of the responses a change makes stale."""
+    if change.entity == "post":
+        return ["posts", f"posts:{change.payload.get('owner_id')}"]
+    if change.entity == "user":
+        return [f"user:{change.entity_id}"]
+    return [f"followers:{change.entity_id}"]
+
+
+def encode_cursor(values) -> str:
+    data = json.dumps(values, default=_json_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise ApiError(400, "Invalid cursor")
+    if not isinstance(values, list):
+        raise ApiError(400, "Invalid cursor")
+    return values
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ApiServer:
+    """
+    HTTP/1.1 server of the query API with keep-alive connections.
+
+    Identical requests running at the same time share one query. Latencies
+    of the last `window` requests of every route are kept for `/stats`.
+    """
+
+    def __init__(
+        self,
+        db: Database | ShardedDatabase,
+        cache: ResponseCache | None = None,
+        page_size: int = 50,
+        max_page_size: int = 500,
+        poll_interval: float = 1.0,
+        feed_batch_size: int = 1000,
+        window: int = 10_000,
+    ):
+        self.db = db
+        self.cache = cache if cache is not None else ResponseCache()
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.poll_interval = poll_interval
+        self.feed_batch_size = feed_batch_size
+        self.requests = Counter()
+        self.latencies: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+        self._routes = [
+            (re.compile(r"/users/([^/]+)"), "user", self._user),
+            (re.compile(r"/users/([^/]+)/posts"), "user_posts", self._user_posts),
+            (re.compile(r"/users/([^/]+)/followers"), "followers", self._followers),
+            (re.compile(r"/posts"), "posts", self._posts),
+            (re.compile(r"/search"), "search", self._search),
+        ]
+        self._pending: dict[str, asyncio.Task] = {}
+        self._connections: set[asyncio.StreamWriter] = set()
+        self._server: asyncio.Server | None = None
+        self._followers: list[asyncio.Task] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        self._followers = [
+            asyncio.create_task(self._follow_changes(feed))
+            for feed in getattr(self.db, "shards", [self.db])
+        ]
+        logging.info(f"Query API listening on http://{host}:{self.port}")
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        for follower in self._followers:
+            follower.cancel()
+        if self._server is not None:
+            self._server.close()
+            # idle keep-alive connections would keep their handlers waiting
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+
+    async def _follow_changes(self, feed: Database):
+        """
+        Invalidates cached responses by the changes written to `feed` since
+        the server started, every `poll_interval` seconds. When far behind,
+        the whole cache is dropped instead of reading every change.
+        """
+        offset = await feed.get_change_feed_head()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                for _ in range(10):
+                    rows = await feed.fetch_changes(offset, self.feed_batch_size)
+                    changes = [Change(r) for r in rows]
+                    if changes:
+                        offset = changes[-1].offset
+                        tags = {tag for c in changes for tag in change_tags(c)}
+                        self.cache.invalidate(tags)
+                    if len(rows) < self.feed_batch_size:
+                        break
+                else:
+                    self.cache.clear()
+                    offset = await feed.get_change_feed_head()
+            except Exception as e:
+                # unknown writes, whatever was cached may be stale
+                logging.warning(f"Query API: reading the change feed failed: {e!r}")
+                self.cache.clear()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if length := int(headers.get("content-length") or 0):
+                    await reader.readexactly(length)
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    status, body, cache_status = 400, _error("Malformed request"), None
+                    keep_alive = False
+                else:
+                    method, target, version = parts
+                    status, body, cache_status = await self.handle(method, target)
+                    keep_alive = (
+                        version == "HTTP/1.1"
+                        and headers.get("connection", "").lower() != "close"
+                    )
+                head = [
+                    f"HTTP/1.1 {status} {REASONS[status]}",
+                    "Content-Type: application/json",
+                    f"Content-Length: {len(body)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ]
+                if cache_status:
+                    head.append(f"X-Cache: {cache_status}")
+                if parts and parts[0] == "HEAD":
+                    body = b""
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def handle(self, method: str, target: str) -> tuple[int, bytes, str | None]:
+        """(status, JSON body, "HIT"/"MISS" or None) of a request."""
+        if method not in ("GET", "HEAD"):
+            return 405, _error(f"{method} is not supported"), None
+        url = urlsplit(target)
+        path = unquote(url.path).rstrip("/") or "/"
+        params = dict(parse_qsl(url.query))
+        if path == "/stats":
+            return 200, json.dumps(self.stats()).encode(), None
+        for pattern, name, handler in self._routes:
+            match = pattern.fullmatch(path)
+            if match:
+                break
+        else:
+            return 404, _error(f"No route for {path}"), None
+
+        started = perf_counter()
+        key = path + "?" + urlencode(sorted(params.items()))
+        try:
+            body = self.cache.get(key)
+            cache_status = "HIT"
+            if body is None:
+                cache_status = "MISS"
+                task = self._pending.get(key)
+                if task is None:
+                    task = asyncio.create_task(self._load(key, handler, params, match))
+                    self._pending[key] = task
+                    task.add_done_callback(lambda _: self._pending.pop(key, None))
+                body = await asyncio.shield(task)
+            status = 200
+        except ApiError as e:
+            status, body, cache_status = e.status, _error(str(e)), None
+        except Exception:
+            logging.exception(f"Query API: {target} failed")
+            status, body, cache_status = 500, _error("Internal error"), None
+        self.requests[name] += 1
+        self.latencies[name].append(perf_counter() - started)
+        return status, body, cache_status
+
+    async def _load(self, key: str, handler, params: dict, match: re.Match) -> bytes:
+        version = self.cache.version
+        data, tags = await handler(params, *match.groups())
+        body = json.dumps(data, default=_json_default).encode()
+        self.cache.put(key, body, tags, version)
+        return body
+
+    def stats(self) -> dict:
+        routes = {}
+        for name, values in self.latencies.items():
+            ordered = sorted(values)
+            routes[name] = {
+                "requests": self.requests[name],
+                "p50_ms": round(_quantile(ordered, 0.5) * 1000, 3),
+                "p99_ms": round(_quantile(ordered, 0.99) * 1000, 3),
+            }
+        return {
+            "routes": routes,
+            "cache": {
+                "entries": len(self.cache),
+                "hits": self.cache.hits,
+                "misses": self.cache.misses,
+                "invalidated": self.cache.invalidated,
+            },
+        }
+
+    def _limit(self, params: dict) -> int:
+        try:
+            limit = int(params.get("limit", self.page_size))
+        except ValueError:
+            raise ApiError(400, "limit must be a number")
+        if not 1 <= limit <= self.max_page_size:
+            raise ApiError(400, f"limit must be within 1..{self.max_page_size}")
+        return limit
+
+    def _page(self, rows, limit: int, *columns: str) -> dict:
+        """A page of rows, `columns` of the last row make the next cursor."""
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = encode_cursor([rows[-1][c] for c in columns])
+        return {"items": [dict(r) for r in rows], "next": next_cursor}
+
+    async def _get_user(self, username: str):
+        user = await self.db.get_user(username)
+        if user is None:
+            raise ApiError(404, f"Unknown user {username}")
+        return user
+
+    async def _user(self, params: dict, username: str):
+        user = await self._get_user(username)
+        return dict(user), [f"user:{user['id']}"]
+
+    async def _user_posts(self, params: dict, username: str):
+        user = await self._get_user(username)
+        limit = self._limit(params)
+        rows = await self.db.get_user_posts(
+            username,
+            since=_datetime(params, "since"),
+            until=_datetime(params, "until"),
+            before=_date_cursor(params),
+            limit=limit,
+        )
+        return self._page(rows, limit, "creation_date", "id"), [f"posts:{user['id']}"]
+
+    async def _followers(self, params: dict, username: str):
+        user = await self._get_user(username)
+        limit = self._limit(params)
+        values = _cursor(params, int)
+        rows = await self.db.get_followers(
+            username, after_id=values[0] if values else None, limit=limit
+        )
+        return self._page(rows, limit, "id"), [f"followers:{user['id']}"]
+
+    async def _posts(self, params: dict):
+        limit = self._limit(params)
+        rows = await self.db.get_posts_by_date(
+            since=_datetime(params, "since"),
+            until=_datetime(params, "until"),
+            before=_date_cursor(params),
+            limit=limit,
+        )
+        return self._page(rows, limit, "creation_date", "id"), ["posts"]
+
+    async def _search(self, params: dict):
+        if not params.get("q"):
+            raise ApiError(400, "q is required")
+        limit = self._limit(params)
+        values = _cursor(params, (int, float, type(None)), int)
+        rows = await self.db.search_posts(
+            params["q"],
+            user=params.get("user"),
+            since=_datetime(params, "since"),
+            limit=limit,
+            after=tuple(values) if values else None,
+            substring=params.get("substring") in ("1", "true"),
+        )
+        return self._page(rows, limit, "rank", "id"), ["posts"]
+
+
+def _error(message: str) -> bytes:
+    return json.dumps({"error": message}).encode()
+
+
+def _quantile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _cursor(params: dict, *types) -> list | None:
+    """Values of the `cursor` parameter, checked against `types`."""
+    if "cursor" not in params:
+        return None
+    values = decode_cursor(params["cursor"])
+    if len(values) != len(types) or not all(
+        isinstance(v, t) and not isinstance(v, bool) for v, t in zip(values, types)
+    ):
+        raise ApiError(400, "Invalid cursor")
+    return values
+
+
+def _datetime(params: dict, name: str) -> datetime | None:
+    if name not in params:
+        return None
+    try:
+        return datetime.fromisoformat(params[name])
+    except ValueError:
+        raise ApiError(400, f"{name} must be an ISO date or datetime")
+
+
+def _date_cursor(params: dict) -> tuple[datetime, int] | None:
+    """(creation_date, id) of the last post of the previous page."""
+    values = _cursor(params, str, int)
+    if values is None:
+        return None
+    created, post_id = values
+    try:
+        return datetime.fromisoformat(created), post_id
+    except ValueError:
+        raise ApiError(400, "Invalid cursor")
+
+
+async def serve(
+    dsn: str,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    pool_size: int = 10,
+    cache_size: int = 10_000,
+    cache_ttl: float = 60.0,
+):
+    """Runs the query API on read-only pools of `dsn` (or its shards) until cancelled."""
+    db = open_sink(dsn, pool_size, read_only=True)
+    if not isinstance(db, (Database, ShardedDatabase)):
+        raise ValueError(f"The query API needs PostgreSQL, not {dsn}")
+    async with db:
+        async with ApiServer(db, ResponseCache(cache_size, cache_ttl)) as server:
+            await server.start(host, port)
+            await server.serve_forever()
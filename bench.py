@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import aiohttp
+
+from entities import Post, PostBatch
+from media import HttpError
+from sinks import Sink
+
+
+def synthetic_posts(count: int, start_id: int = 1, owners: int = 100) -> list[Post]:
+    """Posts shaped like crawled ones, spread over `owners` users and a month."""
+    start = datetime(2025, 1, 1)
+    return [
+        Post(
+            post_id=start_id + i,
+            owner=f"bench_user_{i % owners}",
+            timestamp=start + timedelta(minutes=i % (31 * 24 * 60)),
+            text=f"benchmark post {i} about #bench",
+            likes=i % 1000,
+            reposts=i % 100,
+            replies=i % 10,
+            hashtags=["bench"],
+        )
+        for i in range(count)
+    ]
+
+
+class BenchResult:
+    """
+    Latencies of one benchmark round: of batch writes, or of requests when
+    they ran concurrently for `elapsed` seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rows: int,
+        latencies: list[float],
+        elapsed: float | None = None,
+        unit: str = "rows",
+        per: str = "batch",
+    ):
+        self.name = name
+        self.rows = rows
+        self.latencies = sorted(latencies)
+        self.elapsed = sum(latencies) if elapsed is None else elapsed
+        self.unit = unit
+        self.per = per
+
+    def _quantile(self, q: float) -> float:
+        return self.latencies[min(int(q * len(self.latencies)), len(self.latencies) - 1)]
+
+    def summary(self) -> str:
+        return (
+            f"{self.name}: {self.rows} {self.unit} in {self.elapsed:.2f}s "
+            f"({self.rows / max(self.elapsed, 1e-9):.0f} {self.unit}/s) "
+            f"{self.per} p50={self._quantile(0.5) * 1000:.1f}ms "
+            f"p99={self._quantile(0.99) * 1000:.1f}ms"
+        )
+
+
+async def bench_sink(
+    sink: Sink, posts: int = 10_000, batch_size: int = 500, start_id: int = 1
+) -> list[BenchResult]:
+    """
+    Writes `posts` synthetic posts to a connected sink in batches of
+    `batch_size` three times: new rows, the same rows again (skipped
+    rewrites) and the same rows with changed counters.
+    """
+    generated = synthetic_posts(posts, start_id)
+    results = []
+    for name in ("insert", "unchanged", "update"):
+        if name == "update":
+            for post in generated:
+                post.likes += 1
+        latencies = []
+        for i in range(0, len(generated), batch_size):
+            batch = PostBatch(generated[i:i + batch_size])
+            started = perf_counter()
+            await sink.save_posts(batch)
+            latencies.append(perf_counter() - started)
+        results.append(BenchResult(name, len(generated), latencies))
+    return results
+
+
+async def bench_api(
+    url: str, paths: list[str], requests: int = 1000, concurrency: int = 16
+) -> list[BenchResult]:
+    """
+    GETs `paths` of the query API (see api.py) at `url` in turn, `requests`
+    in total with `concurrency` of them in flight. Returns the latencies
+    per path, then of all requests.
+    """
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit_per_host=concurrency)
+    )
+    latencies: dict[str, list[float]] = {path: [] for path in paths}
+    numbers = iter(range(requests))
+
+    async def client():
+        for i in numbers:
+            path = paths[i % len(paths)]
+            started = perf_counter()
+            async with session.get(url.rstrip("/") + path) as response:
+                await response.read()
+            if response.status != 200:
+                raise HttpError(response.status, path)
+            latencies[path].append(perf_counter() - started)
+
+    started = perf_counter()
+    try:
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+    finally:
+        await session.close()
+    elapsed = perf_counter() - started
+    results = [
+        BenchResult(path, len(values), values, elapsed, "requests", "request")
+        for path, values in latencies.items()
+    ]
+    every = [latency for values in latencies.values() for latency in values]
+    results.append(BenchResult("all", len(every), every, elapsed, "requests", "request"))
+    return results
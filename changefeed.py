@@ -0,0 +1,128 @@
+import asyncio
+import json
+from datetime import datetime
+
+import asyncpg
+
+from database import Database
+
+CHANNEL = "change_feed"
+
+
+class Change:
+    __slots__ = ("id", "txid", "entity", "op", "entity_id", "payload", "created_at")
+    id: int
+    txid: int
+    entity: str
+    op: str
+    entity_id: int
+    payload: dict
+    created_at: datetime
+
+    def __init__(self, record: asyncpg.Record):
+        self.id = record["id"]
+        self.txid = record["txid"]
+        self.entity = record["entity"]
+        self.op = record["op"]
+        self.entity_id = record["entity_id"]
+        self.payload = json.loads(record["payload"])
+        self.created_at = record["created_at"]
+
+    @property
+    def offset(self) -> tuple[int, int]:
+        return (self.txid, self.id)
+
+    def __repr__(self):
+        return f"Change({self.entity} {self.op} id={self.entity_id}, offset={self.offset})"
+
+
+class ChangeFeedConsumer:
+    """
+    Named consumer of the `change_feed` outbox table.
+
+    Usage:
+        async with ChangeFeedConsumer(db, "search-indexer", ["post"]) as feed:
+            async for change in feed:
+                ...
+
+    The consumer sleeps on LISTEN until the database sends a notification
+    (or `poll_interval` passes) and reads changes after its stored offset.
+    The offset is committed after each batch has been processed, so delivery
+    is at least once. `seek((0, 0))` replays the feed from the beginning,
+    `seek_to_end()` skips the history.
+    """
+
+    _listener: asyncpg.Connection
+    _wakeup: asyncio.Event
+
+    def __init__(
+        self,
+        db: Database,
+        name: str,
+        entities: list[str] | None = None,
+        batch_size: int = 500,
+        poll_interval: float = 5.0,
+    ):
+        self.db = db
+        self.name = name
+        self.entities = entities
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.offset = (0, 0)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._listener = await asyncpg.connect(self.db.dsn)
+        await self._listener.add_listener(CHANNEL, self._notified)
+        self.offset = await self.db.get_consumer_offset(self.name)
+
+    async def stop(self):
+        await self._listener.remove_listener(CHANNEL, self._notified)
+        await self._listener.close()
+
+    def _notified(self, *args):
+        self._wakeup.set()
+
+    async def commit(self):
+        await self.db.set_consumer_offset(self.name, self.offset)
+
+    async def seek(self, offset: tuple[int, int]):
+        self.offset = offset
+        await self.commit()
+
+    async def seek_to_end(self):
+        await self.seek(await self.db.get_change_feed_head())
+
+    async def fetch(self) -> list[Change]:
+        """Reads the next batch without waiting. Advances (not commits) offset."""
+        rows = await self.db.fetch_changes(self.offset, self.batch_size, self.entities)
+        changes = [Change(r) for r in rows]
+        if changes:
+            self.offset = changes[-1].offset
+        return changes
+
+    def __aiter__(self):
+        return self.changes()
+
+    async def changes(self):
+        while True:
+            self._wakeup.clear()
+            changes = await self.fetch()
+            if not changes:
+                # rows of still running transactions become readable later,
+                # so poll even if there is no new notification
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for change in changes:
+                yield change
+            await self.commit()
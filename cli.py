@@ -0,0 +1,351 @@
+"""
+Entry point of the crawler and its tools:
+
+    python cli.py crawl [--browsers 4|auto] [--watch user1,user2] ...
+    python cli.py watch user1,user2
+    python cli.py db create|migrate|drop|export DIR|archive DAYS|build-graph DIR|dedup-index
+    python cli.py db rebalance --dsn postgresql://a/ts,postgresql://b/ts
+    python cli.py replay PATH
+    python cli.py bench [--dsn sqlite:///tmp/bench.db] [--posts 10000]
+    python cli.py api [--read-dsn postgresql://replica/...] [--port 8080]
+    python cli.py bench-api http://127.0.0.1:8080 /posts /users/name ...
+
+Settings are read from flags, then from the TOML file given with
+`--config`, then from the environment (and `.env`), see SETTINGS.
+Heavy dependencies (nodriver, asyncpg, pyquery, pandas, pyarrow) are only
+imported by the commands which use them, so starting a short command or
+a worker takes milliseconds.
+"""
+import argparse
+import os
+import sys
+
+# setting -> (environment variable, default), a setting `name` is the
+# `--name` flag (underscores as dashes) and the `name` key of the config file
+SETTINGS = {
+    "dsn": ("DSN", None),
+    "login_username": ("TS_USERNAME", None),
+    "login_password": ("TS_PASSWORD", None),
+    "proxies": ("TS_PROXIES", "socks5://localhost:2080"),
+    # a number, or "auto" to follow host resources (see scheduler.py)
+    "browsers": ("TS_BROWSERS", "1"),
+    "max_browsers": ("TS_MAX_BROWSERS", 0),
+    "start": ("TS_START", "realDonaldTrump"),
+    "max_iterations": ("TS_MAX_ITERATIONS", 500),
+    "watch": ("TS_WATCH", "realDonaldTrump"),
+    "graph_path": ("TS_GRAPH_PATH", None),
+    "profile_dir": ("TS_PROFILE_DIR", None),
+    "profile_sample": ("TS_PROFILE_SAMPLE", 0.05),
+    "interactions_per_post": ("TS_INTERACTIONS_PER_POST", 0),
+    "follower_budget": ("TS_FOLLOWER_BUDGET", 0),
+    # streamed follower lists are truncated after this many sessions
+    "follower_sessions": ("TS_FOLLOWER_SESSIONS", 10),
+    "thread_posts": ("TS_THREAD_POSTS", 0),
+    # directory of downloaded images and videos, none are downloaded without it
+    "media_dir": ("TS_MEDIA_DIR", None),
+    "media_per_host": ("TS_MEDIA_PER_HOST", 4),
+    "browser_max_rss_mb": ("TS_BROWSER_MAX_RSS_MB", 2048.0),
+    "browser_max_age": ("TS_BROWSER_MAX_AGE", 4 * 3600.0),
+    # query API, on a replica when given, else on `dsn`
+    "read_dsn": ("TS_READ_DSN", None),
+    "api_host": ("TS_API_HOST", "127.0.0.1"),
+    "api_port": ("TS_API_PORT", 8080),
+    "api_cache_size": ("TS_API_CACHE_SIZE", 10_000),
+    "api_cache_ttl": ("TS_API_CACHE_TTL", 60.0),
+}
+
+
+def load_settings(args: argparse.Namespace, environ=os.environ) -> argparse.Namespace:
+    """Fills settings not given as flags from the config file, environment or defaults."""
+    config = {}
+    if args.config:
+        import tomllib
+
+        with open(args.config, "rb") as f:
+            config = tomllib.load(f)
+    unknown = set(config) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown settings in {args.config}: {sorted(unknown)}")
+
+    for name, (env, default) in SETTINGS.items():
+        if getattr(args, name, None) is not None:
+            continue
+        value = config.get(name, environ.get(env))
+        if value is None:
+            value = default
+        elif default is not None:
+            value = type(default)(value)
+        setattr(args, name, value)
+    return args
+
+
+def _require(args: argparse.Namespace, *names: str):
+    missing = [name for name in names if not getattr(args, name)]
+    if missing:
+        raise SystemExit(
+            "Missing settings: "
+            + ", ".join(f"--{n.replace('_', '-')} ({SETTINGS[n][0]})" for n in missing)
+        )
+
+
+def _usernames(value: str) -> list[str]:
+    return [u for u in value.split(",") if u]
+
+
+def _create_parser(args: argparse.Namespace):
+    from parser import Parser
+    from graph import FollowerGraph
+    from media import MediaDownloader, MediaStore
+    from profiling import CrawlProfiler
+    from proxy import ProxyPool
+    from scheduler import ResourceScheduler
+    from supervisor import BrowserSupervisor
+
+    _require(args, "dsn", "login_username", "login_password")
+    supervisor = BrowserSupervisor(
+        max_rss_mb=args.browser_max_rss_mb, max_age=args.browser_max_age
+    )
+    proxy_pool = ProxyPool.from_string(args.proxies)
+    media = None
+    if args.media_dir:
+        media = MediaDownloader(
+            MediaStore(args.media_dir),
+            per_host=args.media_per_host,
+            proxy_pool=proxy_pool,
+        )
+    scheduler = None
+    if args.browsers == "auto":
+        scheduler = ResourceScheduler(supervisor, max_browsers=args.max_browsers or None)
+    return Parser(
+        proxy_pool=proxy_pool,
+        login_username=args.login_username,
+        login_pass=args.login_password,
+        db_credentials=args.dsn,
+        db_max_connections=15,
+        posts_per_user=30,
+        replies_per_user=30,
+        followers_per_user=50,
+        following_per_user=50,
+        interactions_per_post=args.interactions_per_post,
+        follower_session_budget=args.follower_budget,
+        follower_sessions=args.follower_sessions,
+        thread_posts=args.thread_posts,
+        supervisor=supervisor,
+        scheduler=scheduler,
+        profiler=CrawlProfiler(args.profile_dir, args.profile_sample)
+        if args.profile_dir else None,
+        browsers=1 if scheduler else int(args.browsers),
+        follower_graph=FollowerGraph(args.graph_path) if args.graph_path else None,
+        media=media,
+    )
+
+
+def crawl(args: argparse.Namespace):
+    import nodriver as uc
+
+    parser = _create_parser(args)
+    uc.loop().run_until_complete(
+        parser.parsing_loop(
+            args.start,
+            max_iterations=args.max_iterations,
+            watch_usernames=_usernames(args.watch),
+        )
+    )
+
+
+def watch(args: argparse.Namespace):
+    import nodriver as uc
+
+    parser = _create_parser(args)
+    uc.loop().run_until_complete(parser.watch_loop(_usernames(args.watch)))
+
+
+def db(args: argparse.Namespace):
+    import asyncio
+    import db_manage
+
+    _require(args, "dsn")
+    if args.db_command == "drop":
+        coroutine = db_manage.drop_tables(args.dsn, confirm=not args.yes)
+    elif args.db_command == "create":
+        coroutine = db_manage.create_tables(args.dsn)
+    elif args.db_command == "migrate":
+        coroutine = db_manage.migrate(args.dsn)
+    elif args.db_command == "export":
+        coroutine = db_manage.export(args.dsn, args.path)
+    elif args.db_command == "archive":
+        coroutine = db_manage.archive_posts(args.dsn, args.days)
+    elif args.db_command == "dedup-index":
+        coroutine = db_manage.index_signatures(args.dsn)
+    elif args.db_command == "rebalance":
+        coroutine = db_manage.rebalance(args.dsn)
+    else:
+        coroutine = db_manage.build_graph(args.dsn, args.path)
+    asyncio.run(coroutine)
+
+
+def replay(args: argparse.Namespace):
+    import asyncio
+    import db_manage
+
+    _require(args, "dsn")
+    asyncio.run(db_manage.sync_sink(args.dsn, args.path))
+
+
+def bench(args: argparse.Namespace):
+    import asyncio
+    from bench import bench_sink
+    from sinks import open_sink
+
+    _require(args, "dsn")
+
+    async def run():
+        async with open_sink(args.dsn) as sink:
+            return await bench_sink(sink, args.posts, args.batch_size, args.start_id)
+
+    for result in asyncio.run(run()):
+        print(result.summary())
+
+
+def api(args: argparse.Namespace):
+    import asyncio
+    from api import serve
+
+    if not args.read_dsn:
+        _require(args, "dsn")
+    asyncio.run(
+        serve(
+            args.read_dsn or args.dsn,
+            args.api_host,
+            args.api_port,
+            cache_size=args.api_cache_size,
+            cache_ttl=args.api_cache_ttl,
+        )
+    )
+
+
+def bench_api(args: argparse.Namespace):
+    import asyncio
+    from bench import bench_api
+
+    results = asyncio.run(bench_api(args.url, args.paths, args.requests, args.concurrency))
+    for result in results:
+        print(result.summary())
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Truth Social crawler.")
+    parser.add_argument("--config", metavar="FILE", help="TOML file of settings.")
+    parser.add_argument(
+        "--env-file", default=".env", help="Read when it exists (default: .env)."
+    )
+    parser.add_argument("--log-level", default="INFO")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    crawl_parser = commands.add_parser("crawl", help="Crawl users from an account.")
+    watch_parser = commands.add_parser("watch", help="Only watch accounts for new posts.")
+    watch_parser.add_argument("watch", nargs="?", help="Comma separated usernames.")
+    for command in (crawl_parser, watch_parser):
+        command.add_argument("--login-username")
+        command.add_argument("--login-password")
+        command.add_argument("--proxies", help="Comma separated proxy urls.")
+        command.add_argument("--browser-max-rss-mb", type=float)
+        command.add_argument("--browser-max-age", type=float)
+        command.add_argument("--media-dir", help="Download post media there.")
+        command.add_argument("--media-per-host", type=int)
+    crawl_parser.add_argument("--start", help="First crawled username.")
+    crawl_parser.add_argument("--max-iterations", type=int)
+    crawl_parser.add_argument("--browsers", help='A number, or "auto".')
+    crawl_parser.add_argument("--max-browsers", type=int, help="Cap of --browsers auto.")
+    crawl_parser.add_argument("--watch", help="Usernames watched next to the crawl.")
+    crawl_parser.add_argument("--graph-path")
+    crawl_parser.add_argument("--profile-dir")
+    crawl_parser.add_argument("--profile-sample", type=float)
+    crawl_parser.add_argument("--interactions-per-post", type=int)
+    crawl_parser.add_argument("--follower-budget", type=int)
+    crawl_parser.add_argument("--follower-sessions", type=int)
+    crawl_parser.add_argument("--thread-posts", type=int)
+    crawl_parser.set_defaults(handler=crawl)
+    watch_parser.set_defaults(handler=watch)
+
+    db_parser = commands.add_parser("db", help="Manage the PostgreSQL database.")
+    db_commands = db_parser.add_subparsers(dest="db_command", required=True)
+    drop_parser = db_commands.add_parser("drop", help="Drop all tables.")
+    drop_parser.add_argument("--yes", action="store_true", help="Do not ask to confirm.")
+    db_commands.add_parser("create", help="Create all tables.")
+    db_commands.add_parser("migrate", help="Apply pending migrations.")
+    export_parser = db_commands.add_parser("export", help="Append to Parquet datasets.")
+    export_parser.add_argument("path")
+    archive_parser = db_commands.add_parser("archive", help="Archive old posts.")
+    archive_parser.add_argument("days", type=int)
+    db_commands.add_parser(
+        "dedup-index", help="Sign posts saved without near-duplicate signatures."
+    )
+    db_commands.add_parser(
+        "rebalance", help="Move rows to their shard after adding shards to --dsn."
+    )
+    graph_parser = db_commands.add_parser("build-graph", help="Export the follower graph.")
+    graph_parser.add_argument("path")
+    db_parser.set_defaults(handler=db)
+
+    replay_parser = commands.add_parser(
+        "replay", help="Merge a SQLite sink file or a JSONL sink directory."
+    )
+    replay_parser.add_argument("path")
+    replay_parser.set_defaults(handler=replay)
+
+    bench_parser = commands.add_parser("bench", help="Measure sink write throughput.")
+    bench_parser.add_argument("--posts", type=int, default=10_000)
+    bench_parser.add_argument("--batch-size", type=int, default=500)
+    bench_parser.add_argument(
+        "--start-id", type=int, default=1, help="Use unused ids on a real database."
+    )
+    bench_parser.set_defaults(handler=bench)
+
+    api_parser = commands.add_parser("api", help="Serve the read-only query API.")
+    api_parser.add_argument("--read-dsn", help="Replica to query instead of --dsn.")
+    api_parser.add_argument("--api-host")
+    api_parser.add_argument("--api-port", type=int)
+    api_parser.add_argument("--api-cache-size", type=int)
+    api_parser.add_argument("--api-cache-ttl", type=float)
+    api_parser.set_defaults(handler=api)
+
+    bench_api_parser = commands.add_parser(
+        "bench-api", help="Load test a running query API."
+    )
+    bench_api_parser.add_argument("url", help="http://host:port")
+    bench_api_parser.add_argument("paths", nargs="+", help="/posts, /users/name ...")
+    bench_api_parser.add_argument("--requests", type=int, default=1000)
+    bench_api_parser.add_argument("--concurrency", type=int, default=16)
+    bench_api_parser.set_defaults(handler=bench_api)
+
+    # db takes it after its own subcommand: `db migrate --dsn ...`
+    for command in (
+        *(c for c in commands.choices.values() if c is not db_parser),
+        *db_commands.choices.values(),
+    ):
+        command.add_argument(
+            "--dsn",
+            help="postgresql://... (comma separated for shards), sqlite:///file.db "
+            "or jsonl:///dir (DSN).",
+        )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    if os.path.exists(args.env_file):
+        from dotenv import load_dotenv
+
+        load_dotenv(args.env_file)
+    load_settings(args)
+
+    import logging
+
+    logging.basicConfig(level=args.log_level)
+    args.handler(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
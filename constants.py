@@ -0,0 +1,18 @@
+BASE_URL = "https://truthsocial.com"
+
+POST_SELECTOR = ".status__wrapper.space-y-4.status-public.p-4"
+REPLY_POST_SELECTOR = ".status__wrapper.space-y-4.status-public.status-reply.p-4"
+USER_INFO_SELECTOR = "div.flex.flex-col.space-y-3.mt-6.min-w-0.flex-1.px-4"
+FOLLOWER_SELECTOR = 'div[class="pb-4"] div[data-testid="account"]'
+
+SCROLL_MIN = 80
+SCROLL_MAX = 110
+
+# "ReTruthed by" / "Liked by" lists open in a modal from a post page
+INTERACTION_MODAL_SELECTOR = 'div[data-testid="modal"]'
+INTERACTION_ACCOUNT_SELECTOR = f'{INTERACTION_MODAL_SELECTOR} div[data-testid="account"]'
+# text of the post page counters opening the lists, per interaction type
+INTERACTION_BUTTONS = {"reposted": "ReTruths", "liked": "Likes"}
+
+# statuses of a thread page: ancestors, the opened post, then its replies
+THREAD_POST_SELECTOR = ".thread .status__wrapper"
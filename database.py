@@ -1,19 +1,166 @@
+import asyncio
+import io
 import logging
+from collections import OrderedDict
+from datetime import date, datetime
 
 import asyncpg
 from asyncpg import Pool
 from asyncpg import create_pool
 
-from entities import Post, User, Follower
+import dedup
 
+from entities import Post, User, Follower, PostBatch, FollowerBatch, InteractionBatch
+from sinks import HarvestCheckpoint, MediaFile, Sink, StagedChunk
+
+
+_MOVED_POSTS = "SELECT id FROM all_posts WHERE owner_id = ANY($1)"
+_USER_COLUMNS = (
+    "id, username, name, followers, following, registration_date, "
+    "location, personal_site, bio"
+)
+# rows owned by a user, as moved between shards by `ShardedDatabase.rebalance`
+# in this order: (table, columns, rows of the users $1, conflict clause).
+# Rollups are copied over the ones the triggers of the target computed.
+_USER_TABLES = (
+    (
+        "posts",
+        "id, post_text, owner_id, reply_to_id, likes, reposts, replies, "
+        "creation_date, parent_id, root_id",
+        "owner_id = ANY($1)",
+        "DO NOTHING",
+    ),
+    (
+        "posts_archive",
+        "id, post_text, owner_id, reply_to_id, likes, reposts, replies, "
+        "creation_date, parent_id, root_id, archived_at",
+        "owner_id = ANY($1)",
+        "DO NOTHING",
+    ),
+    (
+        "post_interactions",
+        "post_id, user_id, interaction",
+        f"post_id IN ({_MOVED_POSTS})",
+        "DO NOTHING",
+    ),
+    ("post_mentions", "post_id, user_id", f"post_id IN ({_MOVED_POSTS})", "DO NOTHING"),
+    (
+        "post_hashtags",
+        "post_id, tag, creation_date",
+        f"post_id IN ({_MOVED_POSTS})",
+        "DO NOTHING",
+    ),
+    ("post_links", "post_id, url, domain", f"post_id IN ({_MOVED_POSTS})", "DO NOTHING"),
+    ("post_media", "post_id, url, position", f"post_id IN ({_MOVED_POSTS})", "DO NOTHING"),
+    (
+        "post_snapshots",
+        "post_id, observed_at, likes, reposts, replies",
+        f"post_id IN ({_MOVED_POSTS})",
+        "DO NOTHING",
+    ),
+    (
+        "post_signatures",
+        "post_id, creation_date, signature",
+        f"post_id IN ({_MOVED_POSTS})",
+        "DO NOTHING",
+    ),
+    (
+        "post_lsh_buckets",
+        "band, bucket, post_id",
+        f"post_id IN ({_MOVED_POSTS})",
+        "DO NOTHING",
+    ),
+    ("followers", "user_id, follower, added_at", "user_id = ANY($1)", "DO NOTHING"),
+    ("user_avatars", "user_id, url, first_seen", "user_id = ANY($1)", "DO NOTHING"),
+    (
+        "user_daily_posts",
+        "user_id, day, posts, replies_sent, likes, reposts, replies",
+        "user_id = ANY($1)",
+        """(user_id, day) DO UPDATE SET
+            posts = EXCLUDED.posts, replies_sent = EXCLUDED.replies_sent,
+            likes = EXCLUDED.likes, reposts = EXCLUDED.reposts,
+            replies = EXCLUDED.replies""",
+    ),
+    (
+        "user_daily_followers",
+        "user_id, day, followers, following, edges_added",
+        "user_id = ANY($1)",
+        """(user_id, day) DO UPDATE SET
+            followers = EXCLUDED.followers, following = EXCLUDED.following,
+            edges_added = EXCLUDED.edges_added""",
+    ),
+)
+
+
+def _written(status: str) -> int:
+    """Number of rows from a command status like "INSERT 0 5" or "UPDATE 5"."""
+    return int(status.rsplit(" ", 1)[-1])
+
+
+def snapshot_visible(txid: int, snapshot: str) -> bool:
+    """
+    Whether the changes of transaction `txid` are seen by the snapshot
+    `snapshot` ("xmin:xmax:xip,...", see `txid_current_snapshot`).
+    """
+    xmin, xmax, running = snapshot.split(":")
+    if txid < int(xmin):
+        return True
+    return txid < int(xmax) and str(txid) not in running.split(",")
+
+
+class Database(Sink):
+    """
+    PostgreSQL sink.
+
+    Upserts of posts and users only rewrite rows whose content changed
+    (`IS DISTINCT FROM` guards), and rows already written by this process
+    with the same content are not sent at all: their content hashes are kept
+    in a bounded LRU cache of `write_cache_size` entries per entity.
+
+    With `read_only=True` every transaction of the pool is read-only, for
+    readers such as the query API which may point at a replica.
+
+    A shard of `sharding.ShardedDatabase` gets the `directory` database:
+    user ids are allocated there, and every user a shard writes is first
+    inserted with that id, so ids are the same in every database.
+    """
 
-class Database:
     _pool: Pool
     _max_pool_size: int
 
-    def __init__(self, dsn, max_pool_size: int = 10):
+    def __init__(
+        self,
+        dsn,
+        max_pool_size: int = 10,
+        write_cache_size: int = 100_000,
+        read_only: bool = False,
+        directory: "Database | None" = None,
+    ):
+        super().__init__()
         self.dsn = dsn
         self._max_pool_size = max_pool_size
+        self._read_only = read_only
+        self._directory = directory
+        self._snapshot_months: set[str] = set()
+        self._write_cache_size = write_cache_size
+        self._post_hashes: OrderedDict[int, int] = OrderedDict()
+        self._user_hashes: OrderedDict[str, int] = OrderedDict()
+        # username -> id of users allocated by this database as a directory
+        self._user_ids: OrderedDict[str, int] = OrderedDict()
+
+    def _is_cached(self, cache: OrderedDict, key, content_hash: int) -> bool:
+        if cache.get(key) != content_hash:
+            return False
+        cache.move_to_end(key)
+        return True
+
+    def _cache(self, cache: OrderedDict, items):
+        """Remembers (key, content hash) pairs of rows which were committed."""
+        for key, content_hash in items:
+            cache[key] = content_hash
+            cache.move_to_end(key)
+        while len(cache) > self._write_cache_size:
+            cache.popitem(last=False)
 
     async def __aenter__(self):
         if not hasattr(self, "_pool") or self._pool.is_closing():
@@ -24,7 +171,10 @@ class Database:
         await self.close()
 
     async def connect(self):
-        self._pool = await create_pool(self.dsn, max_size=self._max_pool_size)
+        settings = {"default_transaction_read_only": "on"} if self._read_only else None
+        self._pool = await create_pool(
+            self.dsn, max_size=self._max_pool_size, server_settings=settings
+        )
 
     async def close(self):
         await self._pool.close()
@@ -46,6 +196,7 @@ class Database:
         """
         user_id = await self._get_user_id(conn, username)
         if not user_id:
+            await self._reserve_usernames(conn, [username])
             await conn.execute(
                 """
                 INSERT INTO users (username) VALUES ($1);
@@ -56,7 +207,9 @@ class Database:
         return user_id  # type: ignore
 
     async def save_post(self, post: Post):
+        signatures = await self._sign([post.post_id], [post.text], [post.timestamp])
         async with self._pool.acquire() as conn:
+            await self._ensure_snapshot_partitions(conn)
             async with conn.transaction():
                 # 1. Get or create user
                 user_id = await self._save_username(conn, post.owner)
@@ -68,7 +221,10 @@ class Database:
                 else:
                     reply_to_id = None
 
-                # 3. Insert (or update) post
+                # 3. Insert (or update) post, keeping history of the counters
+                await self._record_snapshots(
+                    conn, [post.post_id], [post.likes], [post.reposts], [post.replies]
+                )
                 await conn.execute(
                     """
                     INSERT INTO posts (
@@ -85,6 +241,11 @@ class Database:
                         reposts = EXCLUDED.reposts,
                         replies = EXCLUDED.replies,
                         creation_date = EXCLUDED.creation_date
+                    WHERE (posts.post_text, posts.owner_id, posts.reply_to_id,
+                            posts.likes, posts.reposts, posts.replies, posts.creation_date)
+                        IS DISTINCT FROM (EXCLUDED.post_text, EXCLUDED.owner_id,
+                            EXCLUDED.reply_to_id, EXCLUDED.likes, EXCLUDED.reposts,
+                            EXCLUDED.replies, EXCLUDED.creation_date)
                     """,
                     post.post_id,
                     post.text,
@@ -96,6 +257,29 @@ class Database:
                     post.timestamp,
                 )
 
+                if post.root_id is not None:
+                    await self._link_replies(
+                        conn, [(post.post_id, post.parent_id, post.root_id)]
+                    )
+                post_id = int(post.post_id)
+                mentioned = {}
+                if post.mentions:
+                    mentioned = await self._save_usernames(conn, post.mentions)
+                await self._save_post_entities(
+                    conn,
+                    mentioned,
+                    [(post_id, username) for username in post.mentions],
+                    [(post_id, tag, post.timestamp) for tag in post.hashtags],
+                    [(post_id, url, domain) for url, domain in post.links],
+                )
+                await self._save_media_links(
+                    conn,
+                    {post.owner: user_id},
+                    [(post_id, url, i) for i, url in enumerate(post.media)],
+                    [(post.owner, post.avatar_url)] if post.avatar_url else [],
+                )
+                await self._save_signatures(conn, *signatures)
+
                 # 4. Add repost interaction if needed
                 if post.is_repost and post.who_reposted:
                     reposter_id = await self._save_username(conn, post.who_reposted)
@@ -103,12 +287,452 @@ class Database:
                         """
                         INSERT INTO post_interactions (post_id, user_id, interaction)
                         VALUES ($1, $2, 'reposted')
+                        ON CONFLICT (post_id, user_id, interaction) DO NOTHING
                         """,
                         int(post.post_id),
                         reposter_id,
                     )
 
+    async def _save_usernames(
+        self,
+        conn: asyncpg.Connection,
+        usernames: list[str],
+        names: list[str | None] | None = None,
+    ) -> dict[str, int]:
+        """
+        Bulk version of `_save_username`.
+        Creates missing users (with `names` if given) and returns username -> id.
+        """
+        if names is None:
+            names = [None] * len(usernames)
+        await self._reserve_usernames(conn, usernames)
+        # sorted inserts keep row lock order stable between concurrent workers
+        rows = sorted(dict(zip(usernames, names)).items())
+        await conn.execute(
+            """
+            INSERT INTO users (username, name)
+            SELECT * FROM unnest($1::text[], $2::text[])
+            ON CONFLICT (username) DO NOTHING
+            """,
+            [r[0] for r in rows],
+            [r[1] for r in rows],
+        )
+        fetched = await conn.fetch(
+            "SELECT id, username FROM users WHERE username = ANY($1::text[])",
+            [r[0] for r in rows],
+        )
+        return {r["username"]: r["id"] for r in fetched}
+
+    async def allocate_user_ids(self, usernames) -> dict[str, int]:
+        """
+        Ids of `usernames`, creating the missing users. Used by shards to
+        get ids from their directory database.
+        """
+        ids = {}
+        missing = []
+        for username in set(usernames):
+            if username in self._user_ids:
+                self._user_ids.move_to_end(username)
+                ids[username] = self._user_ids[username]
+            else:
+                missing.append(username)
+        if missing:
+            async with self._pool.acquire() as conn:
+                allocated = await self._save_usernames(conn, missing)
+            self._cache(self._user_ids, allocated.items())
+            ids.update(allocated)
+        return ids
+
+    async def _reserve_usernames(self, conn: asyncpg.Connection, usernames):
+        """
+        On a shard, inserts the users of `usernames` which may be missing
+        with the ids allocated by the directory.
+        """
+        if self._directory is None or not usernames:
+            return
+        ids = await self._directory.allocate_user_ids(usernames)
+        rows = sorted(ids.items())
+        await conn.execute(
+            """
+            INSERT INTO users (id, username)
+            SELECT * FROM unnest($1::int[], $2::text[])
+            ON CONFLICT DO NOTHING
+            """,
+            [r[1] for r in rows],
+            [r[0] for r in rows],
+        )
+
+    async def save_posts(self, batch: PostBatch):
+        """
+        Saves a batch of posts and their repost interactions in one transaction.
+        Posts this process already wrote with the same content are skipped.
+        """
+        if not len(batch):
+            return
+        # the same post can be in a batch twice: as a post and as a repost
+        changed = {}
+        for i in range(len(batch)):
+            content = (
+                batch.text[i],
+                batch.owner[i],
+                batch.reply_to[i],
+                batch.likes[i],
+                batch.reposts[i],
+                batch.replies[i],
+                batch.timestamp[i],
+                batch.parent_id[i],
+                batch.root_id[i],
+            )
+            content_hash = hash(content)
+            if not self._is_cached(self._post_hashes, batch.post_id[i], content_hash):
+                changed[batch.post_id[i]] = (i, content_hash)
+        reposts = [
+            (batch.post_id[i], batch.who_reposted[i])
+            for i in range(len(batch))
+            if batch.is_repost[i] and batch.who_reposted[i]
+        ]
+        submitted = len(set(batch.post_id))
+        if not changed and not reposts:
+            self.write_stats.record("posts", submitted, 0)
+            return
+
+        signatures = await self._sign(
+            [batch.post_id[i] for i, _ in changed.values()],
+            [batch.text[i] for i, _ in changed.values()],
+            [batch.timestamp[i] for i, _ in changed.values()],
+        )
+        async with self._pool.acquire() as conn:
+            await self._ensure_snapshot_partitions(conn)
+            async with conn.transaction():
+                ids = await self._save_usernames(conn, batch.usernames())
+
+                rows = []
+                for i, _ in changed.values():
+                    reply_to = batch.reply_to[i]
+                    rows.append(
+                        (
+                            batch.post_id[i],
+                            batch.text[i],
+                            ids[batch.owner[i]],
+                            ids[reply_to] if reply_to else None,
+                            batch.likes[i],
+                            batch.reposts[i],
+                            batch.replies[i],
+                            batch.timestamp[i],
+                        )
+                    )
+                status = "INSERT 0 0"
+                if rows:
+                    columns = list(zip(*sorted(rows)))
+                    await self._record_snapshots(
+                        conn, columns[0], columns[4], columns[5], columns[6]
+                    )
+                    status = await conn.execute(
+                        """
+                        INSERT INTO posts (
+                            id, post_text, owner_id,
+                            reply_to_id, likes, reposts,
+                            replies, creation_date
+                        )
+                        SELECT * FROM unnest(
+                            $1::bigint[], $2::text[], $3::int[], $4::bigint[],
+                            $5::int[], $6::int[], $7::int[], $8::timestamp[]
+                        )
+                        ON CONFLICT (id) DO UPDATE SET
+                            post_text = EXCLUDED.post_text,
+                            owner_id = EXCLUDED.owner_id,
+                            reply_to_id = EXCLUDED.reply_to_id,
+                            likes = EXCLUDED.likes,
+                            reposts = EXCLUDED.reposts,
+                            replies = EXCLUDED.replies,
+                            creation_date = EXCLUDED.creation_date
+                        WHERE (posts.post_text, posts.owner_id, posts.reply_to_id,
+                                posts.likes, posts.reposts, posts.replies, posts.creation_date)
+                            IS DISTINCT FROM (EXCLUDED.post_text, EXCLUDED.owner_id,
+                                EXCLUDED.reply_to_id, EXCLUDED.likes, EXCLUDED.reposts,
+                                EXCLUDED.replies, EXCLUDED.creation_date)
+                        """,
+                        *columns,
+                    )
+                links = batch.thread_links()
+                if links:
+                    await self._link_replies(conn, links)
+                await self._save_post_entities(
+                    conn, ids, *batch.entity_rows(i for i, _ in changed.values())
+                )
+                await self._save_media_links(
+                    conn, ids, *batch.media_rows(i for i, _ in changed.values())
+                )
+                await self._save_signatures(conn, *signatures)
+
+                if reposts:
+                    await self._insert_interactions(
+                        conn,
+                        [r[0] for r in reposts],
+                        [ids[r[1]] for r in reposts],
+                        ["reposted"] * len(reposts),
+                    )
+        self._cache(
+            self._post_hashes,
+            ((post_id, content_hash) for post_id, (_, content_hash) in changed.items()),
+        )
+        self.write_stats.record("posts", submitted, _written(status))
+
+    async def _link_replies(self, conn: asyncpg.Connection, links):
+        """
+        Stores (post_id, parent_id, root_id) read from thread pages, in
+        both tiers. An unknown parent (None) does not overwrite a known one.
+        """
+        for table in ("posts", "posts_archive"):
+            await conn.execute(
+                f"""
+                UPDATE {table} p SET
+                    parent_id = coalesce(l.parent_id, p.parent_id),
+                    root_id = l.root_id
+                FROM unnest($1::bigint[], $2::bigint[], $3::bigint[])
+                    AS l(id, parent_id, root_id)
+                WHERE p.id = l.id
+                    AND (p.parent_id, p.root_id)
+                        IS DISTINCT FROM (coalesce(l.parent_id, p.parent_id), l.root_id)
+                """,
+                [link[0] for link in links],
+                [link[1] for link in links],
+                [link[2] for link in links],
+            )
+
+    async def _save_post_entities(
+        self, conn: asyncpg.Connection, user_ids: dict, mentions, hashtags, links
+    ):
+        """
+        Bulk inserts (post_id, username) mentions, (post_id, tag, creation_date)
+        hashtags and (post_id, url, domain) links. Existing rows are skipped.
+        """
+        if mentions:
+            await conn.execute(
+                """
+                INSERT INTO post_mentions (post_id, user_id)
+                SELECT * FROM unnest($1::bigint[], $2::int[])
+                ON CONFLICT (post_id, user_id) DO NOTHING
+                """,
+                [m[0] for m in mentions],
+                [user_ids[m[1]] for m in mentions],
+            )
+        if hashtags:
+            await conn.execute(
+                """
+                INSERT INTO post_hashtags (post_id, tag, creation_date)
+                SELECT * FROM unnest($1::bigint[], $2::text[], $3::timestamp[])
+                ON CONFLICT (post_id, tag) DO NOTHING
+                """,
+                *zip(*hashtags),
+            )
+        if links:
+            await conn.execute(
+                """
+                INSERT INTO post_links (post_id, url, domain)
+                SELECT * FROM unnest($1::bigint[], $2::text[], $3::text[])
+                ON CONFLICT (post_id, url) DO NOTHING
+                """,
+                *zip(*links),
+            )
+
+    async def _save_media_links(
+        self, conn: asyncpg.Connection, user_ids: dict, media, avatars
+    ):
+        """
+        Bulk inserts (post_id, url, position) attachments and
+        (username, url) avatars. Existing rows are skipped.
+        """
+        if media:
+            await conn.execute(
+                """
+                INSERT INTO post_media (post_id, url, position)
+                SELECT * FROM unnest($1::bigint[], $2::text[], $3::smallint[])
+                ON CONFLICT (post_id, url) DO NOTHING
+                """,
+                *zip(*media),
+            )
+        if avatars:
+            await conn.execute(
+                """
+                INSERT INTO user_avatars (user_id, url)
+                SELECT * FROM unnest($1::int[], $2::text[])
+                ON CONFLICT (user_id, url) DO NOTHING
+                """,
+                [user_ids[a[0]] for a in avatars],
+                [a[1] for a in avatars],
+            )
+
+    async def get_downloaded_urls(self, urls: list[str]) -> set[str]:
+        rows = await self._pool.fetch(
+            "SELECT url FROM media_urls WHERE url = ANY($1::text[])", urls
+        )
+        return {r["url"] for r in rows}
+
+    async def save_media_files(self, files: list[MediaFile]):
+        """Stores downloaded files and the urls they were fetched from."""
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    INSERT INTO media_files (sha256, size, content_type, path)
+                    SELECT DISTINCT ON (sha256) *
+                    FROM unnest($1::text[], $2::bigint[], $3::text[], $4::text[])
+                        AS f(sha256, size, content_type, path)
+                    ORDER BY sha256
+                    ON CONFLICT (sha256) DO NOTHING
+                    """,
+                    [f.sha256 for f in files],
+                    [f.size for f in files],
+                    [f.content_type for f in files],
+                    [f.path for f in files],
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO media_urls (url, sha256)
+                    SELECT * FROM unnest($1::text[], $2::text[])
+                    ON CONFLICT (url) DO UPDATE SET
+                        sha256 = EXCLUDED.sha256, fetched_at = now()
+                    """,
+                    [f.url for f in files],
+                    [f.sha256 for f in files],
+                )
+
+    async def get_post_media(self, post_id: int) -> list[asyncpg.Record]:
+        """Attachments of a post with their stored files, None if not downloaded yet."""
+        return await self._pool.fetch(
+            """
+            SELECT m.url, m.position, f.sha256, f.size, f.content_type, f.path
+            FROM post_media m
+                LEFT JOIN media_urls u ON u.url = m.url
+                LEFT JOIN media_files f ON f.sha256 = u.sha256
+            WHERE m.post_id = $1
+            ORDER BY m.position
+            """,
+            post_id,
+        )
+
+    async def _sign(self, post_ids, texts, timestamps):
+        """
+        MinHash signatures of post texts, computed on a thread (numpy
+        releases the GIL) before a connection is taken from the pool.
+        """
+        kept, signatures = await asyncio.to_thread(dedup.signatures, texts)
+        return [post_ids[i] for i in kept], [timestamps[i] for i in kept], signatures
+
+    async def _save_signatures(
+        self, conn: asyncpg.Connection, post_ids, timestamps, signatures
+    ):
+        """
+        Upserts signatures and adds the LSH buckets of the posts. Buckets
+        of an edited text are kept, candidates are verified by signature.
+        """
+        if not post_ids:
+            return
+        await conn.execute(
+            """
+            INSERT INTO post_signatures (post_id, creation_date, signature)
+            SELECT * FROM unnest($1::bigint[], $2::timestamp[], $3::bytea[])
+            ON CONFLICT (post_id) DO UPDATE SET signature = EXCLUDED.signature
+            WHERE post_signatures.signature IS DISTINCT FROM EXCLUDED.signature
+            """,
+            post_ids,
+            timestamps,
+            [dedup.to_bytes(s) for s in signatures],
+        )
+        keys = dedup.band_keys(signatures)
+        await conn.execute(
+            """
+            INSERT INTO post_lsh_buckets (band, bucket, post_id)
+            SELECT * FROM unnest($1::smallint[], $2::bigint[], $3::bigint[])
+            ON CONFLICT (band, bucket, post_id) DO NOTHING
+            """,
+            list(range(dedup.BANDS)) * len(post_ids),
+            keys.ravel().tolist(),
+            [post_id for post_id in post_ids for _ in range(dedup.BANDS)],
+        )
+
+    async def _insert_interactions(
+        self, conn: asyncpg.Connection, post_ids, user_ids, interactions
+    ) -> int:
+        """
+        Bulk inserts interactions, skipping the ones already stored and the
+        ones of unknown posts. Returns the number of inserted rows.
+        """
+        # sorted inserts keep unique index lock order stable between workers
+        rows = sorted(set(zip(post_ids, user_ids, interactions)))
+        status = await conn.execute(
+            """
+            INSERT INTO post_interactions (post_id, user_id, interaction)
+            SELECT i.post_id, i.user_id, i.interaction::interaction_type
+            FROM unnest($1::bigint[], $2::int[], $3::text[])
+                AS i(post_id, user_id, interaction)
+                JOIN all_posts p ON p.id = i.post_id
+            ON CONFLICT (post_id, user_id, interaction) DO NOTHING
+            """,
+            [r[0] for r in rows],
+            [r[1] for r in rows],
+            [r[2] for r in rows],
+        )
+        return _written(status)
+
+    async def save_interactions(self, batch: InteractionBatch):
+        """Saves harvested reposters and likers of posts in one transaction."""
+        if not len(batch):
+            return
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                ids = await self._save_usernames(conn, batch.username, batch.name)
+                written = await self._insert_interactions(
+                    conn,
+                    batch.post_id,
+                    [ids[u] for u in batch.username],
+                    batch.interaction,
+                )
+        self.write_stats.record("interactions", len(batch), written)
+
+    async def _ensure_snapshot_partitions(self, conn: asyncpg.Connection):
+        """Creates this and next month partitions of post_snapshots once a month."""
+        month = datetime.now().strftime("%Y-%m")
+        if month in self._snapshot_months:
+            return
+        for ts in ("now()", "now() + interval '1 month'"):
+            try:
+                await conn.execute(
+                    f"SELECT ensure_post_snapshots_partition(({ts})::timestamp)"
+                )
+            except asyncpg.DuplicateTableError:
+                # created concurrently by another crawler
+                pass
+        self._snapshot_months.add(month)
+
+    async def _record_snapshots(
+        self, conn: asyncpg.Connection, post_ids, likes, reposts, replies
+    ):
+        """
+        Appends engagement snapshots for posts which are new or whose counters
+        differ from the stored ones. Must run before the posts are upserted.
+        """
+        await conn.execute(
+            """
+            INSERT INTO post_snapshots (post_id, observed_at, likes, reposts, replies)
+            SELECT n.id, now(), n.likes, n.reposts, n.replies
+            FROM unnest($1::bigint[], $2::int[], $3::int[], $4::int[])
+                AS n(id, likes, reposts, replies)
+                LEFT JOIN all_posts p ON p.id = n.id
+            WHERE p.id IS NULL
+                OR (p.likes, p.reposts, p.replies)
+                    IS DISTINCT FROM (n.likes, n.reposts, n.replies)
+            ON CONFLICT (post_id, observed_at) DO NOTHING
+            """,
+            list(post_ids),
+            list(likes),
+            list(reposts),
+            list(replies),
+        )
+
     async def _insert_user(self, conn: asyncpg.Connection, user: User):
+        await self._reserve_usernames(conn, [user.username])
         return await conn.execute(
             """
             INSERT INTO users
@@ -129,6 +753,12 @@ class Database:
                 location = EXCLUDED.location,
                 personal_site = EXCLUDED.personal_site,
                 bio = EXCLUDED.bio
+            WHERE (users.name, users.followers, users.following,
+                    users.registration_date, users.location,
+                    users.personal_site, users.bio)
+                IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.followers,
+                    EXCLUDED.following, EXCLUDED.registration_date,
+                    EXCLUDED.location, EXCLUDED.personal_site, EXCLUDED.bio)
             """,
             user.username,
             user.name,
@@ -141,10 +771,27 @@ class Database:
         )
 
     async def save_user(self, user: User):
+        content_hash = hash(
+            (
+                user.name,
+                user.followers_num,
+                user.following_num,
+                user.registration_date,
+                user.location,
+                user.personal_site,
+                user.bio,
+            )
+        )
+        if self._is_cached(self._user_hashes, user.username, content_hash):
+            self.write_stats.record("users", 1, 0)
+            return
         async with self._pool.acquire() as conn:
-            await self._insert_user(conn, user)
+            status = await self._insert_user(conn, user)
+        self._cache(self._user_hashes, [(user.username, content_hash)])
+        self.write_stats.record("users", 1, _written(status))
 
-    async def save_follower(self, follower: Follower):
+    async def save_follower(self, follower: Follower) -> tuple[int, int]:
+        """Saves a follower edge. Returns (user_id, follower_id) of the edge."""
         async with self._pool.acquire() as conn:
             async with conn.transaction():
                 user_id = await self._save_username(conn, follower.who_to_follow)
@@ -164,15 +811,375 @@ class Database:
                     user_id,
                     follower_id,
                 )
+        return user_id, follower_id  # type: ignore
 
-    async def mark_user_parsed(self, username: str):
-        await self._mark_user(username, "parsed")
+    async def save_followers(self, batch: FollowerBatch) -> list[tuple[int, int]]:
+        """
+        Saves a batch of follower edges in one transaction.
+        Returns (user_id, follower_id) of every edge.
+        """
+        if not len(batch):
+            return []
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                ids = await self._save_usernames(conn, batch.who_to_follow)
+                ids.update(
+                    await self._save_usernames(conn, batch.username, batch.name)
+                )
+                edges = sorted(
+                    (ids[user], ids[follower])
+                    for user, follower in zip(batch.who_to_follow, batch.username)
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO followers (user_id, follower)
+                    SELECT * FROM unnest($1::int[], $2::int[])
+                    ON CONFLICT (user_id, follower) DO NOTHING
+                    """,
+                    [e[0] for e in edges],
+                    [e[1] for e in edges],
+                )
+        return edges
 
-    async def mark_user_error(self, username: str):
-        await self._mark_user(username, "error")
+    async def bulk_load(self, chunk: StagedChunk):
+        """
+        Merges rows from a local sink (see `sinks.sync`) in one transaction.
+        Rows are copied into temporary staging tables with COPY and then
+        upserted with a few set based statements.
+        """
+        posts = {p[0]: p for p in chunk.posts}.values()
+        signatures = await self._sign(
+            [p[0] for p in posts], [p[1] for p in posts], [p[7] for p in posts]
+        )
+        async with self._pool.acquire() as conn:
+            await self._ensure_snapshot_partitions(conn)
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    CREATE TEMP TABLE stage_users (
+                        username TEXT, has_profile BOOLEAN, name TEXT,
+                        followers INT, following INT, registration_date DATE,
+                        location TEXT, personal_site TEXT, bio TEXT,
+                        parser_status TEXT
+                    ) ON COMMIT DROP;
+                    CREATE TEMP TABLE stage_posts (
+                        id BIGINT, post_text TEXT, owner TEXT, reply_to TEXT,
+                        likes INT, reposts INT, replies INT,
+                        creation_date TIMESTAMP, parent_id BIGINT, root_id BIGINT
+                    ) ON COMMIT DROP;
+                    CREATE TEMP TABLE stage_interactions (
+                        post_id BIGINT, username TEXT, interaction TEXT
+                    ) ON COMMIT DROP;
+                    CREATE TEMP TABLE stage_followers (
+                        username TEXT, follower TEXT
+                    ) ON COMMIT DROP;
+                    CREATE TEMP TABLE stage_mentions (
+                        post_id BIGINT, username TEXT
+                    ) ON COMMIT DROP;
+                    CREATE TEMP TABLE stage_hashtags (
+                        post_id BIGINT, tag TEXT, creation_date TIMESTAMP
+                    ) ON COMMIT DROP;
+                    CREATE TEMP TABLE stage_links (
+                        post_id BIGINT, url TEXT, domain TEXT
+                    ) ON COMMIT DROP;
+                    CREATE TEMP TABLE stage_media (
+                        post_id BIGINT, url TEXT, position SMALLINT
+                    ) ON COMMIT DROP;
+                    CREATE TEMP TABLE stage_avatars (
+                        username TEXT, url TEXT
+                    ) ON COMMIT DROP;
+                    CREATE TEMP TABLE stage_media_files (
+                        url TEXT, sha256 TEXT, size BIGINT,
+                        content_type TEXT, path TEXT
+                    ) ON COMMIT DROP;
+                    """
+                )
+                await self._reserve_usernames(conn, chunk.usernames())
+                for table, rows in (
+                    ("stage_users", chunk.user_rows()),
+                    ("stage_posts", chunk.posts),
+                    ("stage_interactions", chunk.interactions),
+                    ("stage_followers", chunk.followers),
+                    ("stage_mentions", chunk.mentions),
+                    ("stage_hashtags", chunk.hashtags),
+                    ("stage_links", chunk.links),
+                    ("stage_media", chunk.media),
+                    ("stage_avatars", chunk.avatars),
+                    ("stage_media_files", chunk.media_files),
+                ):
+                    if rows:
+                        await conn.copy_records_to_table(table, records=rows)
 
-    async def mark_user_parsing_now(self, username: str):
-        await self._mark_user(username, "parsing now")
+                await conn.execute(
+                    """
+                    INSERT INTO users (username, name)
+                    SELECT username, max(name) FROM (
+                        SELECT username, name FROM stage_users
+                        UNION ALL SELECT owner, NULL FROM stage_posts
+                        UNION ALL SELECT reply_to, NULL FROM stage_posts
+                            WHERE reply_to IS NOT NULL
+                        UNION ALL SELECT username, NULL FROM stage_interactions
+                        UNION ALL SELECT username, NULL FROM stage_followers
+                        UNION ALL SELECT follower, NULL FROM stage_followers
+                        UNION ALL SELECT username, NULL FROM stage_mentions
+                        UNION ALL SELECT username, NULL FROM stage_avatars
+                    ) referenced
+                    GROUP BY username
+                    ORDER BY username
+                    ON CONFLICT (username) DO NOTHING;
+
+                    UPDATE users u SET
+                        name = s.name,
+                        followers = s.followers,
+                        following = s.following,
+                        registration_date = s.registration_date,
+                        location = s.location,
+                        personal_site = s.personal_site,
+                        bio = s.bio
+                    FROM stage_users s
+                    WHERE s.username = u.username AND s.has_profile
+                        AND (u.name, u.followers, u.following,
+                            u.registration_date, u.location,
+                            u.personal_site, u.bio)
+                        IS DISTINCT FROM (s.name, s.followers, s.following,
+                            s.registration_date, s.location,
+                            s.personal_site, s.bio);
+
+                    UPDATE users u SET parser_status = s.parser_status::parser_status_type
+                    FROM stage_users s
+                    WHERE s.username = u.username AND s.parser_status IS NOT NULL
+                        -- a user parsed by any crawler stays out of the frontier
+                        AND u.parser_status IS DISTINCT FROM 'parsed'
+                        AND u.parser_status::text IS DISTINCT FROM s.parser_status;
+
+                    INSERT INTO post_snapshots (
+                        post_id, observed_at, likes, reposts, replies
+                    )
+                    SELECT DISTINCT ON (n.id) n.id, now(), n.likes, n.reposts, n.replies
+                    FROM stage_posts n LEFT JOIN all_posts p ON p.id = n.id
+                    WHERE p.id IS NULL
+                        OR (p.likes, p.reposts, p.replies)
+                            IS DISTINCT FROM (n.likes, n.reposts, n.replies)
+                    ORDER BY n.id
+                    ON CONFLICT (post_id, observed_at) DO NOTHING;
+
+                    INSERT INTO posts (
+                        id, post_text, owner_id,
+                        reply_to_id, likes, reposts,
+                        replies, creation_date
+                    )
+                    SELECT DISTINCT ON (p.id)
+                        p.id, p.post_text, o.id, r.id,
+                        p.likes, p.reposts, p.replies, p.creation_date
+                    FROM stage_posts p
+                        JOIN users o ON o.username = p.owner
+                        LEFT JOIN users r ON r.username = p.reply_to
+                    ORDER BY p.id
+                    ON CONFLICT (id) DO UPDATE SET
+                        post_text = EXCLUDED.post_text,
+                        owner_id = EXCLUDED.owner_id,
+                        reply_to_id = EXCLUDED.reply_to_id,
+                        likes = EXCLUDED.likes,
+                        reposts = EXCLUDED.reposts,
+                        replies = EXCLUDED.replies,
+                        creation_date = EXCLUDED.creation_date
+                    WHERE (posts.post_text, posts.owner_id, posts.reply_to_id,
+                            posts.likes, posts.reposts, posts.replies, posts.creation_date)
+                        IS DISTINCT FROM (EXCLUDED.post_text, EXCLUDED.owner_id,
+                            EXCLUDED.reply_to_id, EXCLUDED.likes, EXCLUDED.reposts,
+                            EXCLUDED.replies, EXCLUDED.creation_date);
+
+                    CREATE TEMP TABLE stage_thread_links ON COMMIT DROP AS
+                    SELECT id, max(parent_id) AS parent_id, max(root_id) AS root_id
+                    FROM stage_posts WHERE root_id IS NOT NULL
+                    GROUP BY id;
+
+                    UPDATE posts p SET
+                        parent_id = coalesce(l.parent_id, p.parent_id),
+                        root_id = l.root_id
+                    FROM stage_thread_links l
+                    WHERE p.id = l.id
+                        AND (p.parent_id, p.root_id) IS DISTINCT FROM
+                            (coalesce(l.parent_id, p.parent_id), l.root_id);
+
+                    UPDATE posts_archive p SET
+                        parent_id = coalesce(l.parent_id, p.parent_id),
+                        root_id = l.root_id
+                    FROM stage_thread_links l
+                    WHERE p.id = l.id
+                        AND (p.parent_id, p.root_id) IS DISTINCT FROM
+                            (coalesce(l.parent_id, p.parent_id), l.root_id);
+
+                    INSERT INTO post_interactions (post_id, user_id, interaction)
+                    SELECT DISTINCT i.post_id, u.id, i.interaction::interaction_type
+                    FROM stage_interactions i
+                        JOIN users u ON u.username = i.username
+                        JOIN all_posts p ON p.id = i.post_id
+                    ON CONFLICT (post_id, user_id, interaction) DO NOTHING;
+
+                    INSERT INTO followers (user_id, follower)
+                    SELECT DISTINCT u.id, f.id
+                    FROM stage_followers s
+                        JOIN users u ON u.username = s.username
+                        JOIN users f ON f.username = s.follower
+                    ON CONFLICT (user_id, follower) DO NOTHING;
+
+                    INSERT INTO post_mentions (post_id, user_id)
+                    SELECT DISTINCT m.post_id, u.id
+                    FROM stage_mentions m
+                        JOIN users u ON u.username = m.username
+                        JOIN all_posts p ON p.id = m.post_id
+                    ON CONFLICT (post_id, user_id) DO NOTHING;
+
+                    INSERT INTO post_hashtags (post_id, tag, creation_date)
+                    SELECT DISTINCT ON (h.post_id, h.tag) h.post_id, h.tag, h.creation_date
+                    FROM stage_hashtags h JOIN all_posts p ON p.id = h.post_id
+                    ON CONFLICT (post_id, tag) DO NOTHING;
+
+                    INSERT INTO post_links (post_id, url, domain)
+                    SELECT DISTINCT ON (l.post_id, l.url) l.post_id, l.url, l.domain
+                    FROM stage_links l JOIN all_posts p ON p.id = l.post_id
+                    ON CONFLICT (post_id, url) DO NOTHING;
+
+                    INSERT INTO post_media (post_id, url, position)
+                    SELECT DISTINCT ON (m.post_id, m.url) m.post_id, m.url, m.position
+                    FROM stage_media m JOIN all_posts p ON p.id = m.post_id
+                    ON CONFLICT (post_id, url) DO NOTHING;
+
+                    INSERT INTO user_avatars (user_id, url)
+                    SELECT DISTINCT u.id, a.url
+                    FROM stage_avatars a JOIN users u ON u.username = a.username
+                    ON CONFLICT (user_id, url) DO NOTHING;
+
+                    INSERT INTO media_files (sha256, size, content_type, path)
+                    SELECT DISTINCT ON (sha256) sha256, size, content_type, path
+                    FROM stage_media_files
+                    ORDER BY sha256
+                    ON CONFLICT (sha256) DO NOTHING;
+
+                    INSERT INTO media_urls (url, sha256)
+                    SELECT DISTINCT ON (url) url, sha256 FROM stage_media_files
+                    ORDER BY url
+                    ON CONFLICT (url) DO UPDATE SET
+                        sha256 = EXCLUDED.sha256, fetched_at = now();
+                    """
+                )
+                await self._save_signatures(conn, *signatures)
+
+    async def iter_follower_edges(self, chunk_size: int = 100_000):
+        """
+        Streams the whole `followers` table with a server side cursor.
+        Yields (user_ids, follower_ids) lists of at most `chunk_size` edges.
+        """
+        async for rows in self._iter_rows(
+            "SELECT user_id, follower FROM followers", chunk_size=chunk_size
+        ):
+            yield [r[0] for r in rows], [r[1] for r in rows]
+
+    async def iter_posts_after(self, last_id: int, chunk_size: int = 100_000):
+        """Streams posts with id greater than `last_id` in id order."""
+        async for rows in self._iter_rows(
+            """
+            SELECT id, post_text, owner_id, reply_to_id,
+                likes, reposts, replies, creation_date
+            FROM all_posts WHERE id > $1 ORDER BY id
+            """,
+            last_id,
+            chunk_size=chunk_size,
+        ):
+            yield rows
+
+    async def iter_posts_snapshot(self, chunk_size: int = 100_000):
+        """
+        Streams every post in id order from one REPEATABLE READ snapshot.
+        Yields (rows, snapshot), at least once: the snapshot is the same in
+        every item, changes of the transactions it sees are in the rows.
+        """
+        async with self._pool.acquire() as conn:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                snapshot = await conn.fetchval("SELECT txid_current_snapshot()::text")
+                cursor = await conn.cursor(
+                    """
+                    SELECT id, post_text, owner_id, reply_to_id,
+                        likes, reposts, replies, creation_date
+                    FROM all_posts ORDER BY id
+                    """
+                )
+                rows = await cursor.fetch(chunk_size)
+                yield rows, snapshot
+                while rows := await cursor.fetch(chunk_size):
+                    yield rows, snapshot
+
+    async def iter_inserted_posts(
+        self,
+        after: tuple[int, int],
+        chunk_size: int = 10_000,
+        seen: str | None = None,
+    ):
+        """
+        Streams posts inserted after the change feed offset `after`, in the
+        order of their commits, unlike ids which follow the post dates.
+        Inserts of transactions visible in the snapshot `seen` are skipped,
+        a scan from `iter_posts_snapshot` already read them. Yields (rows,
+        offset of the last change read); rows may be empty when only
+        updates were read.
+        """
+        while changes := await self.fetch_changes(after, chunk_size, ["post"]):
+            after = (changes[-1]["txid"], changes[-1]["id"])
+            inserted = [
+                c["entity_id"]
+                for c in changes
+                if c["op"] == "I" and not (seen and snapshot_visible(c["txid"], seen))
+            ]
+            async with self._pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT id, post_text, owner_id, reply_to_id,
+                        likes, reposts, replies, creation_date
+                    FROM all_posts WHERE id = ANY($1::bigint[]) ORDER BY id
+                    """,
+                    inserted,
+                )
+            yield rows, after
+
+    async def iter_users_after(self, last_id: int, chunk_size: int = 100_000):
+        """Streams users with id greater than `last_id` in id order."""
+        async for rows in self._iter_rows(
+            """
+            SELECT id, username, name, followers, following, registration_date,
+                location, personal_site, parser_status::text, bio
+            FROM users WHERE id > $1 ORDER BY id
+            """,
+            last_id,
+            chunk_size=chunk_size,
+        ):
+            yield rows
+
+    async def iter_followers_after(
+        self, last_key: tuple, chunk_size: int = 100_000
+    ):
+        """
+        Streams follower edges added after `last_key`,
+        a (added_at, user_id, follower) tuple of the last seen edge.
+        """
+        async for rows in self._iter_rows(
+            """
+            SELECT user_id, follower, added_at FROM followers
+            WHERE (added_at, user_id, follower) > ($1, $2, $3)
+            ORDER BY added_at, user_id, follower
+            """,
+            *last_key,
+            chunk_size=chunk_size,
+        ):
+            yield rows
+
+    async def _iter_rows(self, query: str, *args, chunk_size: int):
+        """Runs `query` with a server side cursor, yields lists of records."""
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor(query, *args)
+                while rows := await cursor.fetch(chunk_size):
+                    yield rows
 
     async def _mark_user(self, username, status):
         # NOTE: This the the only database method enclosed in a try-except block.
@@ -184,7 +1191,8 @@ class Database:
                     user_id = await self._save_username(conn, username)
                     await conn.execute(
                         """
-                        UPDATE users SET parser_status = $1 WHERE id = $2
+                        UPDATE users SET parser_status = $1
+                        WHERE id = $2 AND parser_status IS DISTINCT FROM $1
                         """,
                         status,
                         user_id,
@@ -192,13 +1200,13 @@ class Database:
         except (asyncpg.PostgresError, asyncpg.InterfaceError):
             logging.error(f"Cannot mark user as {status}")
 
-    async def get_bunch_of_usernames(
+    async def get_bunch_of_users(
         self, start_from_id: int = 1, limit: int = 10
-    ) -> list[str]:
+    ) -> list[tuple[int, str]]:
         async with self._pool.acquire() as conn:
             fetched_rows = await conn.fetch(
                 """
-                SELECT username FROM users
+                SELECT id, username FROM users
                 WHERE
                     parser_status = 'not parsed'
                     OR parser_status = 'error'
@@ -208,4 +1216,881 @@ class Database:
                 start_from_id,
                 limit,
             )
-            return [row[0] for row in fetched_rows]
+            return [(row[0], row[1]) for row in fetched_rows]
+
+    async def get_harvest_checkpoint(
+        self, username: str, direction: str
+    ) -> HarvestCheckpoint | None:
+        async with self._pool.acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                SELECT username, direction, cursor, harvested, finished
+                FROM follower_harvests WHERE username = $1 AND direction = $2
+                """,
+                username,
+                direction,
+            )
+        return HarvestCheckpoint(*row) if row else None
+
+    async def save_harvest_checkpoint(self, checkpoint: HarvestCheckpoint):
+        async with self._pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO follower_harvests
+                    (username, direction, cursor, harvested, finished)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (username, direction) DO UPDATE SET
+                    cursor = EXCLUDED.cursor,
+                    harvested = EXCLUDED.harvested,
+                    finished = EXCLUDED.finished,
+                    updated_at = now()
+                """,
+                checkpoint.username,
+                checkpoint.direction,
+                checkpoint.cursor,
+                checkpoint.harvested,
+                checkpoint.finished,
+            )
+
+    async def get_unfinished_harvests(
+        self, limit: int = 100
+    ) -> list[HarvestCheckpoint]:
+        """Unfinished follower lists, the least recently continued first."""
+        async with self._pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT username, direction, cursor, harvested, finished
+                FROM follower_harvests WHERE NOT finished
+                ORDER BY updated_at LIMIT $1
+                """,
+                limit,
+            )
+        return [HarvestCheckpoint(*row) for row in rows]
+
+    async def search_posts(
+        self,
+        query: str,
+        user: str | None = None,
+        since: datetime | None = None,
+        limit: int = 20,
+        after: tuple[float | None, int] | None = None,
+        substring: bool = False,
+    ) -> list[asyncpg.Record]:
+        """
+        Searches posts by keywords, hot and archived (see `archive_posts`).
+        Args:
+            query (str): Web search syntax query ("trump -biden", "\"exact phrase\"")
+                or, with `substring=True`, any substring of the post text.
+            user (str): Only posts of this username.
+            since (datetime): Only posts created at or after this time.
+            limit (int): Page size.
+            after (tuple): (rank, id) of the last row of the previous page.
+            substring (bool): Match substrings with the trigram index instead of
+                full text search. Results are ordered by id (newest first)
+                and `rank` is None.
+        Returns:
+            Records with id, owner, post_text, creation_date, likes and rank,
+            ordered by rank and id descending.
+        """
+        after_rank, after_id = after if after else (None, None)
+        if substring:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace(
+                "_", "\\_"
+            ) + "%"
+            sql = """
+                SELECT p.id, u.username AS owner, p.post_text, p.creation_date,
+                    p.likes, NULL::float8 AS rank
+                FROM all_posts p JOIN users u ON u.id = p.owner_id
+                WHERE p.post_text ILIKE $1
+                    AND ($2::text IS NULL OR u.username = $2)
+                    AND ($3::timestamp IS NULL OR p.creation_date >= $3)
+                    AND ($4::bigint IS NULL OR p.id < $4)
+                ORDER BY p.id DESC
+                LIMIT $5
+            """
+            args = (pattern, user, since, after_id, limit)
+        else:
+            sql = """
+                SELECT * FROM (
+                    SELECT p.id, u.username AS owner, p.post_text, p.creation_date,
+                        p.likes, ts_rank(p.post_text_tsv, q.query)::float8 AS rank
+                    FROM (
+                        SELECT id, owner_id, post_text, creation_date, likes,
+                            post_text_tsv
+                        FROM posts
+                        UNION ALL
+                        -- matches the expression index of the archive
+                        SELECT id, owner_id, post_text, creation_date, likes,
+                            to_tsvector('english', post_text)
+                        FROM posts_archive
+                    ) p
+                        JOIN users u ON u.id = p.owner_id,
+                        websearch_to_tsquery('english', $1) AS q(query)
+                    WHERE p.post_text_tsv @@ q.query
+                        AND ($2::text IS NULL OR u.username = $2)
+                        AND ($3::timestamp IS NULL OR p.creation_date >= $3)
+                ) ranked
+                WHERE $4::float8 IS NULL OR (rank, id) < ($4, $5::bigint)
+                ORDER BY rank DESC, id DESC
+                LIMIT $6
+            """
+            args = (query, user, since, after_rank, after_id, limit)
+
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(sql, *args)
+
+    async def get_user(self, username: str) -> asyncpg.Record | None:
+        async with self._pool.acquire() as conn:
+            return await conn.fetchrow(
+                """
+                SELECT id, username, name, followers, following,
+                    registration_date, location, personal_site, bio
+                FROM users WHERE username = $1
+                """,
+                username,
+            )
+
+    async def get_user_posts(
+        self,
+        username: str,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        before: tuple[datetime, int] | None = None,
+        limit: int = 20,
+    ) -> list[asyncpg.Record]:
+        """
+        Posts of `username` created within [since, until), newest first.
+        `before` is the (creation_date, id) of the last row of the previous page.
+        """
+        before_date, before_id = before if before else (None, None)
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT p.id, u.username AS owner, p.post_text, p.creation_date,
+                    p.likes, p.reposts, p.replies, p.parent_id
+                FROM users u JOIN all_posts p ON p.owner_id = u.id
+                WHERE u.username = $1
+                    AND ($2::timestamp IS NULL OR p.creation_date >= $2)
+                    AND ($3::timestamp IS NULL OR p.creation_date < $3)
+                    AND ($4::timestamp IS NULL
+                        OR (p.creation_date, p.id) < ($4, $5::bigint))
+                ORDER BY p.creation_date DESC, p.id DESC
+                LIMIT $6
+                """,
+                username,
+                since,
+                until,
+                before_date,
+                before_id,
+                limit,
+            )
+
+    async def get_posts_by_date(
+        self,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        before: tuple[datetime, int] | None = None,
+        limit: int = 20,
+    ) -> list[asyncpg.Record]:
+        """
+        Posts of all users created within [since, until), newest first.
+        `before` is the (creation_date, id) of the last row of the previous page.
+        """
+        before_date, before_id = before if before else (None, None)
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT p.id, u.username AS owner, p.post_text, p.creation_date,
+                    p.likes, p.reposts, p.replies, p.parent_id
+                FROM all_posts p JOIN users u ON u.id = p.owner_id
+                WHERE ($1::timestamp IS NULL OR p.creation_date >= $1)
+                    AND ($2::timestamp IS NULL OR p.creation_date < $2)
+                    AND ($3::timestamp IS NULL
+                        OR (p.creation_date, p.id) < ($3, $4::bigint))
+                ORDER BY p.creation_date DESC, p.id DESC
+                LIMIT $5
+                """,
+                since,
+                until,
+                before_date,
+                before_id,
+                limit,
+            )
+
+    async def get_followers(
+        self, username: str, after_id: int | None = None, limit: int = 100
+    ) -> list[asyncpg.Record]:
+        """Followers of `username` by user id, `after_id` pages."""
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT f.id, f.username, f.name, e.added_at
+                FROM users u
+                    JOIN followers e ON e.user_id = u.id
+                    JOIN users f ON f.id = e.follower
+                WHERE u.username = $1
+                    AND ($2::int IS NULL OR e.follower > $2)
+                ORDER BY e.follower
+                LIMIT $3
+                """,
+                username,
+                after_id,
+                limit,
+            )
+
+    async def fetch_changes(
+        self,
+        after: tuple[int, int] = (0, 0),
+        limit: int = 500,
+        entities: list[str] | None = None,
+    ) -> list[asyncpg.Record]:
+        """
+        Change feed rows after the (txid, id) offset `after`, oldest first.
+        Rows of transactions that may still be followed by an earlier
+        commit are held back, so offsets can be stored safely.
+        """
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT id, txid, entity, op, entity_id, payload, created_at
+                FROM change_feed
+                WHERE (txid, id) > ($1, $2)
+                    AND txid < txid_snapshot_xmin(txid_current_snapshot())
+                    AND ($3::text[] IS NULL OR entity = ANY($3::text[]))
+                ORDER BY txid, id
+                LIMIT $4
+                """,
+                after[0],
+                after[1],
+                entities,
+                limit,
+            )
+
+    async def get_consumer_offset(self, consumer: str) -> tuple[int, int]:
+        async with self._pool.acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                SELECT last_txid, last_id FROM change_feed_offsets
+                WHERE consumer = $1
+                """,
+                consumer,
+            )
+        return (row[0], row[1]) if row else (0, 0)
+
+    async def set_consumer_offset(self, consumer: str, offset: tuple[int, int]):
+        async with self._pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO change_feed_offsets (consumer, last_txid, last_id)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (consumer) DO UPDATE SET
+                    last_txid = EXCLUDED.last_txid,
+                    last_id = EXCLUDED.last_id,
+                    updated_at = now()
+                """,
+                consumer,
+                offset[0],
+                offset[1],
+            )
+
+    async def get_change_feed_head(self) -> tuple[int, int]:
+        """Offset of the newest change, for consumers that skip history."""
+        async with self._pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT txid, id FROM change_feed ORDER BY txid DESC, id DESC LIMIT 1"
+            )
+        return (row[0], row[1]) if row else (0, 0)
+
+    async def get_change_feed_horizon(self) -> tuple[int, int]:
+        """
+        Offset between the changes of transactions which committed before
+        the oldest running one and all later changes. A scan of the tables
+        started afterwards sees every change before it.
+        """
+        async with self._pool.acquire() as conn:
+            xmin = await conn.fetchval(
+                "SELECT txid_snapshot_xmin(txid_current_snapshot())"
+            )
+        return (xmin, 0)
+
+    async def prune_change_feed(self) -> int:
+        """Deletes changes already read by every consumer. Returns deleted rows."""
+        async with self._pool.acquire() as conn:
+            result = await conn.execute(
+                """
+                DELETE FROM change_feed
+                WHERE (txid, id) <= (
+                    SELECT last_txid, last_id FROM change_feed_offsets
+                    ORDER BY last_txid, last_id
+                    LIMIT 1
+                )
+                """
+            )
+        return int(result.split()[-1])
+
+    async def archive_posts(
+        self, older_than: datetime, batch_size: int = 10_000
+    ) -> int:
+        """
+        Moves posts created before `older_than` from the hot `posts` table to
+        `posts_archive`, one transaction per `batch_size` posts, then vacuums
+        `posts` so new posts reuse the freed space. Posts locked by a running
+        upsert are left for the next run. Returns the number of moved posts.
+        """
+        moved = 0
+        async with self._pool.acquire() as conn:
+            while True:
+                status = await conn.execute(
+                    """
+                    WITH moved AS (
+                        DELETE FROM posts WHERE id IN (
+                            SELECT id FROM posts WHERE creation_date < $1
+                            ORDER BY creation_date
+                            LIMIT $2
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING id, post_text, owner_id, reply_to_id, likes,
+                            reposts, replies, creation_date, parent_id, root_id
+                    )
+                    INSERT INTO posts_archive (
+                        id, post_text, owner_id, reply_to_id, likes,
+                        reposts, replies, creation_date, parent_id, root_id
+                    )
+                    SELECT * FROM moved ORDER BY id
+                    -- re-inserted in the hot table while it was being moved
+                    ON CONFLICT (id) DO UPDATE SET
+                        post_text = EXCLUDED.post_text,
+                        likes = EXCLUDED.likes,
+                        reposts = EXCLUDED.reposts,
+                        replies = EXCLUDED.replies
+                    """,
+                    older_than,
+                    batch_size,
+                )
+                count = _written(status)
+                moved += count
+                if count < batch_size:
+                    break
+            if moved:
+                await conn.execute("VACUUM (ANALYZE) posts")
+        logging.info(f"Archived {moved} posts created before {older_than}")
+        return moved
+
+    async def get_existing_post_ids(self, post_ids: list[int]) -> set[int]:
+        """Those of `post_ids` stored in this database, in either tier."""
+        async with self._pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT id FROM all_posts WHERE id = ANY($1::bigint[])", post_ids
+            )
+        return {r["id"] for r in rows}
+
+    async def get_resident_user_ids(self) -> list[int]:
+        """Ids of the users whose posts, follower edges or profile are stored here."""
+        async with self._pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT owner_id FROM posts
+                UNION SELECT owner_id FROM posts_archive
+                UNION SELECT user_id FROM followers
+                UNION SELECT id FROM users
+                    WHERE followers IS NOT NULL OR registration_date IS NOT NULL
+                """
+            )
+        return sorted(r[0] for r in rows)
+
+    async def export_user_rows(self, user_ids: list[int]) -> dict[str, bytes]:
+        """
+        Rows of `user_ids` (see `_USER_TABLES`) and of the users they
+        reference, as binary COPY data per table, from one snapshot.
+        """
+        exported = {}
+        async with self._pool.acquire() as conn:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                queries = [
+                    (
+                        "users",
+                        f"""
+                        SELECT {_USER_COLUMNS} FROM users
+                        WHERE id = ANY($1) OR id IN (
+                            SELECT reply_to_id FROM all_posts WHERE owner_id = ANY($1)
+                            UNION SELECT user_id FROM post_interactions
+                                WHERE post_id IN ({_MOVED_POSTS})
+                            UNION SELECT user_id FROM post_mentions
+                                WHERE post_id IN ({_MOVED_POSTS})
+                            UNION SELECT follower FROM followers WHERE user_id = ANY($1)
+                        )
+                        """,
+                    ),
+                    *(
+                        (table, f"SELECT {columns} FROM {table} WHERE {condition}")
+                        for table, columns, condition, _ in _USER_TABLES
+                    ),
+                ]
+                for table, query in queries:
+                    buffer = io.BytesIO()
+                    await conn.copy_from_query(
+                        query, user_ids, output=buffer, format="binary"
+                    )
+                    exported[table] = buffer.getvalue()
+        return exported
+
+    async def _stage_copy(
+        self, conn: asyncpg.Connection, table: str, columns: str, data: bytes
+    ):
+        """Copies binary COPY `data` of `table` into a temporary stage_`table`."""
+        await conn.execute(
+            f"""
+            CREATE TEMP TABLE stage_{table} ON COMMIT DROP AS
+            SELECT {columns} FROM {table} WITH NO DATA
+            """
+        )
+        await conn.copy_to_table(
+            f"stage_{table}", source=io.BytesIO(data), format="binary"
+        )
+
+    async def import_user_rows(self, user_ids: list[int], exported: dict[str, bytes]):
+        """
+        Upserts rows exported by `export_user_rows` of another database in
+        one transaction. Profiles of `user_ids` are taken over, the other
+        referenced users are only created.
+        """
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                await self._stage_copy(conn, "users", _USER_COLUMNS, exported["users"])
+                await conn.execute(
+                    """
+                    INSERT INTO users (id, username)
+                    SELECT id, username FROM stage_users ORDER BY id
+                    ON CONFLICT DO NOTHING
+                    """
+                )
+                await conn.execute(
+                    """
+                    UPDATE users u SET
+                        name = coalesce(s.name, u.name),
+                        followers = coalesce(s.followers, u.followers),
+                        following = coalesce(s.following, u.following),
+                        registration_date =
+                            coalesce(s.registration_date, u.registration_date),
+                        location = coalesce(s.location, u.location),
+                        personal_site = coalesce(s.personal_site, u.personal_site),
+                        bio = coalesce(s.bio, u.bio)
+                    FROM stage_users s
+                    WHERE s.id = u.id AND s.id = ANY($1)
+                    """,
+                    user_ids,
+                )
+                for table, columns, _, conflict in _USER_TABLES:
+                    await self._stage_copy(conn, table, columns, exported[table])
+                    if table == "post_snapshots":
+                        # rows of old months must not land in the default partition
+                        await conn.execute(
+                            """
+                            SELECT ensure_post_snapshots_partition(month)
+                            FROM (
+                                SELECT DISTINCT date_trunc('month', observed_at) AS month
+                                FROM stage_post_snapshots
+                            ) months
+                            """
+                        )
+                    await conn.execute(
+                        f"""
+                        INSERT INTO {table} ({columns})
+                        SELECT {columns} FROM stage_{table}
+                        ON CONFLICT {conflict}
+                        """
+                    )
+
+    async def delete_user_rows(self, user_ids: list[int]):
+        """
+        Deletes the rows of `user_ids` (see `_USER_TABLES`) and clears their
+        profiles. The users themselves stay, other rows may reference them.
+        """
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                for table, _, condition, _ in reversed(_USER_TABLES):
+                    await conn.execute(f"DELETE FROM {table} WHERE {condition}", user_ids)
+                await conn.execute(
+                    """
+                    UPDATE users SET followers = NULL, following = NULL,
+                        registration_date = NULL, location = NULL,
+                        personal_site = NULL, bio = ''
+                    WHERE id = ANY($1)
+                    """,
+                    user_ids,
+                )
+
+    async def index_signatures(self, batch_size: int = 10_000) -> int:
+        """
+        Signs the posts saved before signatures were stored, in both tiers.
+        Returns the number of signed posts.
+        """
+        signed, last_id = 0, 0
+        while True:
+            async with self._pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT p.id, p.post_text, p.creation_date
+                    FROM all_posts p
+                        LEFT JOIN post_signatures s ON s.post_id = p.id
+                    WHERE p.id > $1 AND s.post_id IS NULL
+                    ORDER BY p.id
+                    LIMIT $2
+                    """,
+                    last_id,
+                    batch_size,
+                )
+                if not rows:
+                    break
+                last_id = rows[-1]["id"]
+                signatures = await self._sign(
+                    [r["id"] for r in rows],
+                    [r["post_text"] for r in rows],
+                    [r["creation_date"] for r in rows],
+                )
+                async with conn.transaction():
+                    await self._save_signatures(conn, *signatures)
+            signed += len(signatures[0])
+        logging.info(f"Signed {signed} posts for near-duplicate search")
+        return signed
+
+    async def get_near_duplicates(
+        self, post_id: int, threshold: float = 0.8, limit: int = 100
+    ) -> list[tuple[int, float]]:
+        """
+        (post_id, estimated similarity) of the posts whose text is a
+        near-duplicate of the post's, most similar first.
+        """
+        rows = await self._pool.fetch(
+            """
+            SELECT s.post_id, s.signature
+            FROM post_signatures s
+            WHERE s.post_id = $1 OR s.post_id IN (
+                SELECT c.post_id
+                FROM post_lsh_buckets b
+                    JOIN post_lsh_buckets c USING (band, bucket)
+                WHERE b.post_id = $1 AND c.post_id <> $1
+            )
+            """,
+            post_id,
+        )
+        ids = [r["post_id"] for r in rows]
+        signatures = dedup.from_bytes([r["signature"] for r in rows])
+        return dedup.rank_similar(post_id, ids, signatures, threshold)[:limit]
+
+    async def get_signature(self, post_id: int) -> bytes | None:
+        return await self._pool.fetchval(
+            "SELECT signature FROM post_signatures WHERE post_id = $1", post_id
+        )
+
+    async def get_bucket_mates(self, signature: bytes) -> list[asyncpg.Record]:
+        """post_id and signature of the posts sharing an LSH bucket with `signature`."""
+        keys = dedup.band_keys(dedup.from_bytes([signature]))[0]
+        return await self._pool.fetch(
+            """
+            SELECT DISTINCT s.post_id, s.signature
+            FROM unnest($1::smallint[], $2::bigint[]) AS k(band, bucket)
+                JOIN post_lsh_buckets b USING (band, bucket)
+                JOIN post_signatures s USING (post_id)
+            """,
+            list(range(dedup.BANDS)),
+            keys.tolist(),
+        )
+
+    async def get_signatures(
+        self, since: datetime, until: datetime
+    ) -> list[asyncpg.Record]:
+        """post_id and signature of the posts created in [since, until)."""
+        return await self._pool.fetch(
+            """
+            SELECT post_id, signature FROM post_signatures
+            WHERE creation_date >= $1 AND creation_date < $2
+            """,
+            since,
+            until,
+        )
+
+    async def cluster_posts(
+        self, since: datetime, until: datetime, threshold: float = 0.8
+    ) -> list[list[int]]:
+        """
+        Groups of near-duplicate posts created in [since, until), largest
+        first. Posts without a group are left out.
+        """
+        rows = await self.get_signatures(since, until)
+        if not rows:
+            return []
+        ids = [r["post_id"] for r in rows]
+        signatures = dedup.from_bytes([r["signature"] for r in rows])
+        return await asyncio.to_thread(dedup.cluster, ids, signatures, threshold)
+
+    async def get_engagement_curve(self, post_id: int) -> list[asyncpg.Record]:
+        """Snapshots (observed_at, likes, reposts, replies) of a post, oldest first."""
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT observed_at, likes, reposts, replies FROM post_snapshots
+                WHERE post_id = $1
+                ORDER BY observed_at
+                """,
+                post_id,
+            )
+
+    async def get_top_growing_posts(
+        self,
+        since: datetime,
+        until: datetime | None = None,
+        metric: str = "likes",
+        limit: int = 20,
+    ) -> list[asyncpg.Record]:
+        """
+        Posts whose `metric` (likes, reposts or replies) grew the most within
+        [since, until). Growth is measured from the last snapshot before the
+        window, or from the first one inside it for posts first seen there.
+        """
+        if metric not in ("likes", "reposts", "replies"):
+            raise ValueError(f"Unknown metric: {metric}")
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                f"""
+                WITH window_values AS (
+                    SELECT post_id,
+                        max({metric}) AS last_value,
+                        min({metric}) AS first_value
+                    FROM post_snapshots
+                    WHERE observed_at >= $1
+                        AND ($2::timestamp IS NULL OR observed_at < $2)
+                    GROUP BY post_id
+                )
+                SELECT w.post_id,
+                    w.last_value - coalesce(b.value, w.first_value) AS growth,
+                    w.last_value AS {metric}
+                FROM window_values w
+                    LEFT JOIN LATERAL (
+                        SELECT s.{metric} AS value FROM post_snapshots s
+                        WHERE s.post_id = w.post_id AND s.observed_at < $1
+                        ORDER BY s.observed_at DESC
+                        LIMIT 1
+                    ) b ON true
+                ORDER BY growth DESC, w.post_id
+                LIMIT $3
+                """,
+                since,
+                until,
+                limit,
+            )
+
+    async def get_thread(
+        self, root_id: int, limit: int = 10_000
+    ) -> list[asyncpg.Record]:
+        """
+        Reply tree of the conversation started by `root_id`, in depth-first
+        order. Every row has `depth` (0 for the root) and `path`, the ids from
+        the root to the post. Posts whose parent is unknown (not crawled from
+        a thread page) are not part of the tree.
+        """
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                WITH RECURSIVE conversation AS MATERIALIZED (
+                    SELECT id, parent_id FROM all_posts WHERE root_id = $1
+                ),
+                tree AS (
+                    SELECT $1::bigint AS id, 0 AS depth, ARRAY[$1::bigint] AS path
+                    UNION ALL
+                    SELECT c.id, t.depth + 1, t.path || c.id
+                    FROM conversation c JOIN tree t ON c.parent_id = t.id
+                    WHERE c.id <> $1
+                )
+                SELECT p.id, p.parent_id, u.username AS owner, p.post_text,
+                    p.likes, p.reposts, p.replies, p.creation_date,
+                    t.depth, t.path
+                FROM tree t
+                    JOIN all_posts p ON p.id = t.id
+                    JOIN users u ON u.id = p.owner_id
+                ORDER BY t.path
+                LIMIT $2
+                """,
+                root_id,
+                limit,
+            )
+
+    async def get_conversation(self, root_id: int) -> list[asyncpg.Record]:
+        """
+        The posts of the conversation started by `root_id` with their
+        parent_id, unordered: the rows `get_thread` builds its tree from.
+        """
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT p.id, p.parent_id, u.username AS owner, p.post_text,
+                    p.likes, p.reposts, p.replies, p.creation_date
+                FROM all_posts p JOIN users u ON u.id = p.owner_id
+                WHERE p.root_id = $1 OR p.id = $1
+                """,
+                root_id,
+            )
+
+    async def get_posts_mentioning(
+        self, username: str, limit: int = 20, before_id: int | None = None
+    ) -> list[asyncpg.Record]:
+        """Posts mentioning `username`, newest first, `before_id` pages."""
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT p.id, o.username AS owner, p.post_text, p.creation_date,
+                    p.likes
+                FROM users u
+                    JOIN post_mentions m ON m.user_id = u.id
+                    JOIN all_posts p ON p.id = m.post_id
+                    JOIN users o ON o.id = p.owner_id
+                WHERE u.username = $1
+                    AND ($2::bigint IS NULL OR m.post_id < $2)
+                ORDER BY m.post_id DESC
+                LIMIT $3
+                """,
+                username,
+                before_id,
+                limit,
+            )
+
+    async def get_posts_with_hashtag(
+        self,
+        tag: str,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        limit: int = 20,
+    ) -> list[asyncpg.Record]:
+        """Posts tagged `tag` created within [since, until), newest first."""
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT p.id, u.username AS owner, p.post_text, p.creation_date,
+                    p.likes
+                FROM post_hashtags h
+                    JOIN all_posts p ON p.id = h.post_id
+                    JOIN users u ON u.id = p.owner_id
+                WHERE h.tag = $1
+                    AND ($2::timestamp IS NULL OR h.creation_date >= $2)
+                    AND ($3::timestamp IS NULL OR h.creation_date < $3)
+                ORDER BY h.creation_date DESC, h.post_id DESC
+                LIMIT $4
+                """,
+                tag.lstrip("#").lower(),
+                since,
+                until,
+                limit,
+            )
+
+    async def get_top_hashtags(
+        self, since: datetime, until: datetime | None = None, limit: int | None = 20
+    ) -> list[asyncpg.Record]:
+        """Most used hashtags of posts created within [since, until), all if no `limit`."""
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT tag, count(*) AS posts
+                FROM post_hashtags
+                WHERE creation_date >= $1
+                    AND ($2::timestamp IS NULL OR creation_date < $2)
+                GROUP BY tag
+                ORDER BY posts DESC, tag
+                LIMIT $3
+                """,
+                since,
+                until,
+                limit,
+            )
+
+    async def get_posts_linking(
+        self, domain: str, limit: int = 20, before_id: int | None = None
+    ) -> list[asyncpg.Record]:
+        """Posts linking to `domain` (without "www."), newest first, with the urls."""
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT p.id, u.username AS owner, p.post_text, p.creation_date,
+                    array_agg(l.url ORDER BY l.url) AS urls
+                FROM post_links l
+                    JOIN all_posts p ON p.id = l.post_id
+                    JOIN users u ON u.id = p.owner_id
+                WHERE l.domain = $1
+                    AND ($2::bigint IS NULL OR l.post_id < $2)
+                GROUP BY p.id, u.username
+                ORDER BY p.id DESC
+                LIMIT $3
+                """,
+                domain.lower().removeprefix("www."),
+                before_id,
+                limit,
+            )
+
+    async def get_user_daily_stats(
+        self,
+        username: str,
+        since: date | None = None,
+        until: date | None = None,
+    ) -> list[asyncpg.Record]:
+        """
+        Daily rollups of a user within [since, until), oldest first: posts,
+        replies_sent, likes, reposts, replies, avg_likes and reply_ratio of
+        the posts created that day, followers/following crawled that day,
+        follower_growth since the previous crawl and follower edges_added.
+        """
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                WITH owner AS (SELECT id FROM users WHERE username = $1),
+                crawled AS (
+                    SELECT day, followers, following, edges_added,
+                        -- rows without counters are their own partition
+                        followers - lag(followers) OVER (
+                            PARTITION BY followers IS NULL ORDER BY day
+                        ) AS follower_growth
+                    FROM user_daily_followers
+                    WHERE user_id = (SELECT id FROM owner)
+                )
+                SELECT day,
+                    coalesce(p.posts, 0) AS posts,
+                    coalesce(p.replies_sent, 0) AS replies_sent,
+                    coalesce(p.likes, 0) AS likes,
+                    coalesce(p.reposts, 0) AS reposts,
+                    coalesce(p.replies, 0) AS replies,
+                    p.likes::float8 / nullif(p.posts, 0) AS avg_likes,
+                    p.replies_sent::float8 / nullif(p.posts, 0) AS reply_ratio,
+                    f.followers, f.following, f.follower_growth,
+                    coalesce(f.edges_added, 0) AS edges_added
+                FROM (
+                    SELECT * FROM user_daily_posts
+                    WHERE user_id = (SELECT id FROM owner)
+                ) p
+                    FULL JOIN crawled f USING (day)
+                WHERE ($2::date IS NULL OR day >= $2)
+                    AND ($3::date IS NULL OR day < $3)
+                ORDER BY day
+                """,
+                username,
+                since,
+                until,
+            )
+
+    async def get_most_active_users(
+        self, since: date, until: date | None = None, limit: int = 20
+    ) -> list[asyncpg.Record]:
+        """Users with the most posts created within [since, until), from the rollups."""
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT u.username, sum(s.posts) AS posts,
+                    sum(s.likes)::float8 / nullif(sum(s.posts), 0) AS avg_likes,
+                    sum(s.replies_sent)::float8 / nullif(sum(s.posts), 0) AS reply_ratio
+                FROM user_daily_posts s JOIN users u ON u.id = s.user_id
+                WHERE s.day >= $1 AND ($2::date IS NULL OR s.day < $2)
+                GROUP BY u.username
+                ORDER BY posts DESC, u.username
+                LIMIT $3
+                """,
+                since,
+                until,
+                limit,
+            )
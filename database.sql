@@ -1,3 +1,5 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 CREATE TYPE parser_status_type AS ENUM ('not parsed', 'parsing now', 'parsed', 'error');
 
 CREATE TABLE users (
@@ -21,8 +23,13 @@ CREATE TABLE posts (
     likes INT,
     reposts INT,
     replies INT,
-    creation_date TIMESTAMP NOT NULL
+    creation_date TIMESTAMP NOT NULL,
+    post_text_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', post_text)) STORED
 );
+CREATE INDEX posts_text_tsv_idx ON posts USING GIN (post_text_tsv);
+CREATE INDEX posts_text_trgm_idx ON posts USING GIN (post_text gin_trgm_ops);
+CREATE INDEX posts_owner_date_idx ON posts (owner_id, creation_date);
 
 CREATE TYPE interaction_type AS ENUM ('reposted', 'liked');
 
@@ -35,8 +42,422 @@ CREATE TABLE post_interactions (
 CREATE TABLE followers (
     user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     follower INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    added_at TIMESTAMP NOT NULL DEFAULT now(),
     PRIMARY KEY (user_id, follower)
 );
+CREATE INDEX followers_added_at_idx ON followers (added_at);
+
+-- outbox of inserted and updated rows, consumers get woken up by NOTIFY
+-- on the 'change_feed' channel. Rows are read in (txid, id) order and only
+-- from transactions older than every running one, so a consumer offset
+-- never skips a row committed later by a concurrent transaction.
+CREATE TABLE change_feed (
+    id BIGSERIAL PRIMARY KEY,
+    txid BIGINT NOT NULL DEFAULT txid_current(),
+    entity VARCHAR(16) NOT NULL,
+    op CHAR(1) NOT NULL,
+    entity_id BIGINT NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE INDEX change_feed_txid_idx ON change_feed (txid, id);
+
+CREATE TABLE change_feed_offsets (
+    consumer VARCHAR(255) PRIMARY KEY,
+    last_txid BIGINT NOT NULL DEFAULT 0,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE FUNCTION record_change() RETURNS trigger AS $$
+DECLARE
+    row_id BIGINT;
+BEGIN
+    IF TG_TABLE_NAME = 'followers' THEN
+        row_id := NEW.user_id;
+    ELSE
+        row_id := NEW.id;
+    END IF;
+    INSERT INTO change_feed (entity, op, entity_id, payload)
+    VALUES (
+        TG_ARGV[0],
+        CASE TG_OP WHEN 'INSERT' THEN 'I' ELSE 'U' END,
+        row_id,
+        to_jsonb(NEW) - 'post_text_tsv'
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION notify_change_feed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('change_feed', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_insert_change AFTER INSERT ON posts
+    FOR EACH ROW EXECUTE FUNCTION record_change('post');
+CREATE TRIGGER posts_update_change AFTER UPDATE ON posts
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION record_change('post');
+CREATE TRIGGER users_insert_change AFTER INSERT ON users
+    FOR EACH ROW EXECUTE FUNCTION record_change('user');
+CREATE TRIGGER users_update_change AFTER UPDATE ON users
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION record_change('user');
+CREATE TRIGGER followers_insert_change AFTER INSERT ON followers
+    FOR EACH ROW EXECUTE FUNCTION record_change('follower');
+-- one notification per statement, consumers fetch everything after their offset
+CREATE TRIGGER change_feed_notify AFTER INSERT ON change_feed
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_change_feed();
+
+-- append-only history of engagement counters, a row is written only when
+-- the counters of a post differ from the values stored in posts
+CREATE TABLE post_snapshots (
+    post_id BIGINT NOT NULL,
+    observed_at TIMESTAMP NOT NULL,
+    likes INT,
+    reposts INT,
+    replies INT,
+    PRIMARY KEY (post_id, observed_at)
+) PARTITION BY RANGE (observed_at);
+CREATE TABLE post_snapshots_default PARTITION OF post_snapshots DEFAULT;
+CREATE INDEX post_snapshots_observed_at_idx ON post_snapshots (observed_at);
+
+-- creates the monthly partition holding `ts` if it does not exist yet
+CREATE FUNCTION ensure_post_snapshots_partition(ts TIMESTAMP) RETURNS void AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', ts);
+    partition_name TEXT := 'post_snapshots_' || to_char(ts, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF post_snapshots FOR VALUES FROM (%L) TO (%L)',
+            partition_name, month_start, month_start + interval '1 month'
+        );
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- one row per (post, user, interaction), inserts skip existing ones
+ALTER TABLE post_interactions
+    ADD CONSTRAINT post_interactions_key UNIQUE (post_id, user_id, interaction);
+
+-- progress of streamed follower lists (see harvest.py), `cursor` is the
+-- last saved username of the list, a later session resumes after it
+CREATE TABLE follower_harvests (
+    username VARCHAR(255) NOT NULL,
+    direction VARCHAR(16) NOT NULL,
+    cursor VARCHAR(255),
+    harvested INT NOT NULL DEFAULT 0,
+    finished BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (username, direction)
+);
+CREATE INDEX follower_harvests_unfinished_idx ON follower_harvests (updated_at)
+    WHERE NOT finished;
+
+-- reply tree of conversations: the replied post and the first post of the
+-- conversation (the root has root_id = id). Filled from thread pages only,
+-- parents are not foreign keys because they may not be crawled yet
+ALTER TABLE posts
+    ADD COLUMN parent_id BIGINT,
+    ADD COLUMN root_id BIGINT;
+CREATE INDEX posts_parent_id_idx ON posts (parent_id) WHERE parent_id IS NOT NULL;
+CREATE INDEX posts_root_id_idx ON posts (root_id) WHERE root_id IS NOT NULL;
+
+-- entities of post texts, extracted while parsing. creation_date of the
+-- post is copied to post_hashtags so "top hashtags of a day" is a range scan
+CREATE TABLE post_mentions (
+    post_id BIGINT NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    PRIMARY KEY (post_id, user_id)
+);
+CREATE INDEX post_mentions_user_id_idx ON post_mentions (user_id, post_id);
+
+CREATE TABLE post_hashtags (
+    post_id BIGINT NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+    tag VARCHAR(255) NOT NULL,
+    creation_date TIMESTAMP NOT NULL,
+    PRIMARY KEY (post_id, tag)
+);
+CREATE INDEX post_hashtags_tag_idx ON post_hashtags (tag, creation_date);
+CREATE INDEX post_hashtags_creation_date_idx ON post_hashtags (creation_date, tag);
+
+CREATE TABLE post_links (
+    post_id BIGINT NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    domain VARCHAR(255) NOT NULL,
+    PRIMARY KEY (post_id, url)
+);
+CREATE INDEX post_links_domain_idx ON post_links (domain, post_id);
+
+-- per user per day rollups, maintained in the write path by statement
+-- triggers: each statement applies the difference between the new and the
+-- old rows it wrote from its transition tables, so dashboards read a few
+-- rows per user instead of aggregating posts. Rollups are history, deleting
+-- posts does not change them.
+-- user_daily_posts is keyed on the creation day of the posts: reply ratio
+-- is replies_sent / posts, average likes is likes / posts
+CREATE TABLE user_daily_posts (
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    posts INT NOT NULL DEFAULT 0,
+    replies_sent INT NOT NULL DEFAULT 0,
+    likes BIGINT NOT NULL DEFAULT 0,
+    reposts BIGINT NOT NULL DEFAULT 0,
+    replies BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+CREATE INDEX user_daily_posts_day_idx ON user_daily_posts (day, user_id);
+
+-- user_daily_followers is keyed on the day the profile was crawled: last
+-- seen counters of the day and follower edges discovered that day
+CREATE TABLE user_daily_followers (
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    followers INT,
+    following INT,
+    edges_added INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE FUNCTION apply_user_daily_posts() RETURNS trigger AS $$
+BEGIN
+    -- sorted upserts keep row lock order stable between concurrent workers
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO user_daily_posts AS s
+            (user_id, day, posts, replies_sent, likes, reposts, replies)
+        SELECT owner_id, creation_date::date, count(*), count(reply_to_id),
+            coalesce(sum(likes), 0), coalesce(sum(reposts), 0),
+            coalesce(sum(replies), 0)
+        FROM new_rows
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            posts = s.posts + EXCLUDED.posts,
+            replies_sent = s.replies_sent + EXCLUDED.replies_sent,
+            likes = s.likes + EXCLUDED.likes,
+            reposts = s.reposts + EXCLUDED.reposts,
+            replies = s.replies + EXCLUDED.replies;
+    ELSE
+        INSERT INTO user_daily_posts AS s
+            (user_id, day, posts, replies_sent, likes, reposts, replies)
+        SELECT user_id, day, sum(posts), sum(replies_sent),
+            sum(likes), sum(reposts), sum(replies)
+        FROM (
+            SELECT owner_id, creation_date::date, 1,
+                (reply_to_id IS NOT NULL)::int, coalesce(likes, 0),
+                coalesce(reposts, 0), coalesce(replies, 0)
+            FROM new_rows
+            UNION ALL
+            SELECT owner_id, creation_date::date, -1,
+                -(reply_to_id IS NOT NULL)::int, -coalesce(likes, 0),
+                -coalesce(reposts, 0), -coalesce(replies, 0)
+            FROM old_rows
+        ) delta (user_id, day, posts, replies_sent, likes, reposts, replies)
+        GROUP BY user_id, day
+        -- updates of other columns (thread links...) change nothing
+        HAVING (sum(posts), sum(replies_sent), sum(likes), sum(reposts), sum(replies))
+            <> (0, 0, 0, 0, 0)
+        ORDER BY user_id, day
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            posts = s.posts + EXCLUDED.posts,
+            replies_sent = s.replies_sent + EXCLUDED.replies_sent,
+            likes = s.likes + EXCLUDED.likes,
+            reposts = s.reposts + EXCLUDED.reposts,
+            replies = s.replies + EXCLUDED.replies;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION apply_user_daily_followers() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'users' THEN
+        INSERT INTO user_daily_followers AS s (user_id, day, followers, following)
+        SELECT id, now()::date, followers, following
+        FROM new_rows
+        WHERE followers IS NOT NULL OR following IS NOT NULL
+        ORDER BY id
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            followers = EXCLUDED.followers,
+            following = EXCLUDED.following
+        WHERE (s.followers, s.following)
+            IS DISTINCT FROM (EXCLUDED.followers, EXCLUDED.following);
+    ELSE
+        INSERT INTO user_daily_followers AS s (user_id, day, edges_added)
+        SELECT user_id, added_at::date, count(*)
+        FROM new_rows
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            edges_added = s.edges_added + EXCLUDED.edges_added;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_insert_daily AFTER INSERT ON posts
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_posts();
+CREATE TRIGGER posts_update_daily AFTER UPDATE ON posts
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_posts();
+CREATE TRIGGER users_insert_daily AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_followers();
+CREATE TRIGGER users_update_daily AFTER UPDATE ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_followers();
+CREATE TRIGGER followers_insert_daily AFTER INSERT ON followers
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_followers();
+
+-- cold tier of posts: `db_manage.py --archive-posts DAYS` moves old posts
+-- here so the hot table, its text search indexes and the upsert path stay
+-- bounded. Rows are written once and compressed (every row above 128 bytes
+-- is TOAST compressed), only the primary key and per-user reads are indexed
+CREATE TABLE posts_archive (
+    id BIGINT PRIMARY KEY,
+    post_text TEXT NOT NULL,
+    owner_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    reply_to_id BIGINT REFERENCES users(id),
+    likes INT,
+    reposts INT,
+    replies INT,
+    creation_date TIMESTAMP NOT NULL,
+    parent_id BIGINT,
+    root_id BIGINT,
+    archived_at TIMESTAMP NOT NULL DEFAULT now()
+) WITH (fillfactor = 100, toast_tuple_target = 128);
+CREATE INDEX posts_archive_owner_date_idx ON posts_archive (owner_id, creation_date);
+
+-- rows of post tables may point to archived posts
+ALTER TABLE post_interactions DROP CONSTRAINT post_interactions_post_id_fkey;
+ALTER TABLE post_mentions DROP CONSTRAINT post_mentions_post_id_fkey;
+ALTER TABLE post_hashtags DROP CONSTRAINT post_hashtags_post_id_fkey;
+ALTER TABLE post_links DROP CONSTRAINT post_links_post_id_fkey;
+
+-- both tiers, a post is stored in exactly one of them
+CREATE VIEW all_posts AS
+    SELECT id, post_text, owner_id, reply_to_id, likes, reposts, replies,
+        creation_date, parent_id, root_id
+    FROM posts
+    UNION ALL
+    SELECT id, post_text, owner_id, reply_to_id, likes, reposts, replies,
+        creation_date, parent_id, root_id
+    FROM posts_archive;
+
+-- re-crawled archived posts are updated in place instead of coming back
+-- to the hot table, whatever the write path (upserts, sync)
+CREATE FUNCTION route_archived_post() RETURNS trigger AS $$
+BEGIN
+    PERFORM 1 FROM posts_archive WHERE id = NEW.id;
+    IF NOT FOUND THEN
+        RETURN NEW;
+    END IF;
+    UPDATE posts_archive SET
+        post_text = NEW.post_text,
+        likes = NEW.likes,
+        reposts = NEW.reposts,
+        replies = NEW.replies
+    WHERE id = NEW.id
+        AND (post_text, likes, reposts, replies)
+            IS DISTINCT FROM (NEW.post_text, NEW.likes, NEW.reposts, NEW.replies);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_route_archived BEFORE INSERT ON posts
+    FOR EACH ROW EXECUTE FUNCTION route_archived_post();
+-- counters of archived posts still roll up (see user_daily_posts)
+CREATE TRIGGER posts_archive_update_daily AFTER UPDATE ON posts_archive
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_posts();
+
+-- images and videos of posts and avatars of users. post_media and
+-- user_avatars are written with the posts, media_urls and media_files by
+-- the downloader (see media.py). Files are stored once per content hash,
+-- any number of urls can point to the same file
+CREATE TABLE post_media (
+    post_id BIGINT NOT NULL,
+    url TEXT NOT NULL,
+    position SMALLINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (post_id, url)
+);
+CREATE INDEX post_media_url_idx ON post_media (url);
+
+CREATE TABLE user_avatars (
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    first_seen TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, url)
+);
+CREATE INDEX user_avatars_url_idx ON user_avatars (url);
+
+CREATE TABLE media_files (
+    sha256 CHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    content_type VARCHAR(255),
+    path TEXT NOT NULL,
+    downloaded_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE media_urls (
+    url TEXT PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL REFERENCES media_files(sha256),
+    fetched_at TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE INDEX media_urls_sha256_idx ON media_urls (sha256);
+
+-- MinHash signatures of post texts and their LSH buckets, see dedup.py.
+-- Rows are added as posts are saved, posts saved before this migration
+-- are indexed with `cli.py db dedup-index`. Like the other post_* tables
+-- they cover both tiers (all_posts), so there is no foreign key to posts
+CREATE TABLE post_signatures (
+    post_id BIGINT PRIMARY KEY,
+    creation_date TIMESTAMP NOT NULL,
+    -- NUM_PERM little endian uint32
+    signature BYTEA NOT NULL
+);
+CREATE INDEX post_signatures_creation_date_idx ON post_signatures (creation_date);
+
+CREATE TABLE post_lsh_buckets (
+    band SMALLINT NOT NULL,
+    bucket BIGINT NOT NULL,
+    post_id BIGINT NOT NULL,
+    PRIMARY KEY (band, bucket, post_id)
+);
+CREATE INDEX post_lsh_buckets_post_id_idx ON post_lsh_buckets (post_id);
+
+-- reads of all_posts are indexed on the archive like on posts: threads by
+-- parent_id and root_id, text search by expression instead of a stored
+-- tsvector column. Keyset pages of all_posts (ORDER BY creation_date DESC,
+-- id DESC) merge both (creation_date, id) indexes instead of sorting the
+-- tiers
+CREATE INDEX posts_archive_creation_date_idx ON posts_archive (creation_date, id);
+CREATE INDEX posts_creation_date_idx ON posts (creation_date, id);
+CREATE INDEX posts_archive_parent_id_idx ON posts_archive (parent_id)
+    WHERE parent_id IS NOT NULL;
+CREATE INDEX posts_archive_root_id_idx ON posts_archive (root_id)
+    WHERE root_id IS NOT NULL;
+CREATE INDEX posts_archive_text_tsv_idx ON posts_archive
+    USING GIN (to_tsvector('english', post_text));
+CREATE INDEX posts_archive_text_trgm_idx ON posts_archive USING GIN (post_text gin_trgm_ops);
+
+-- in-place updates of archived posts reach change feed consumers like
+-- updates of hot posts
+CREATE TRIGGER posts_archive_update_change AFTER UPDATE ON posts_archive
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION record_change('post');
+
+-- files from migrations/ that are already included in this schema
+CREATE TABLE schema_migrations (
+    name VARCHAR(255) PRIMARY KEY,
+    applied_at TIMESTAMP NOT NULL DEFAULT now()
+);
 
 -- see data
 
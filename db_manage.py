@@ -1,58 +1,203 @@
 # Description: This CLI script is used to manage the database. It can be used to drop all tables in the database or create them.
+# The same commands are available as `python cli.py db ...`.
+# A DSN of several comma separated PostgreSQL URLs is a sharded database
+# (see sharding.py): schema commands run on every shard.
 
 import asyncio
-import asyncpg
 import os
 import argparse
-from dotenv import load_dotenv
 
-load_dotenv()
-
-DSN = os.getenv("DSN")
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_FILE = os.path.join(ROOT, 'database.sql')
+MIGRATIONS_DIR = os.path.join(ROOT, 'migrations')
 
 HELP_MSG = """
 Use this script to initialize the database of the parser:
 
 Usage:
-    python db_manage.py [--drop] [--create] [--help]
+    python db_manage.py [--drop] [--create] [--migrate] [--export DIR] [--sync PATH] [--build-graph DIR] [--archive-posts DAYS] [--dedup-index] [--rebalance] [--help]
 """
 
-async def drop_tables():
-    conn = await asyncpg.connect(DSN)
-    print("This will delete all of your data. Are you sure you want to continue?")
-    if input('Yes/no?: ') != 'Yes':
-        print("Aborted.")
-        return
-    try:
-        await conn.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
-        print("Tables dropped successfully.")
-    finally:
-        await conn.close()
+def shard_dsns(dsn):
+    from sinks import split_dsns
+
+    return split_dsns(dsn)
+
+def single_dsn(dsn, command):
+    """`dsn` of a database which is not sharded, for commands reading one database."""
+    shards = len(shard_dsns(dsn))
+    if shards > 1:
+        raise SystemExit(
+            f"{command} reads the tables and change feed of one database, "
+            f"it does not support sharded DSNs ({shards} shards)"
+        )
+    return dsn
+
+async def drop_tables(dsn, confirm=True):
+    """Drops every table. Asks for confirmation on the terminal unless `confirm` is False."""
+    import asyncpg
 
-async def create_tables():
-    conn = await asyncpg.connect(DSN)
+    if confirm:
+        print("This will delete all of your data. Are you sure you want to continue?")
+        if input('Yes/no?: ') != 'Yes':
+            print("Aborted.")
+            return
+    for shard in shard_dsns(dsn):
+        conn = await asyncpg.connect(shard)
+        try:
+            await conn.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+            print("Tables dropped successfully.")
+        finally:
+            await conn.close()
+
+async def create_tables(dsn):
+    import asyncpg
+
+    with open(SCHEMA_FILE, 'r') as f:
+        sql = f.read()
+    for shard in shard_dsns(dsn):
+        conn = await asyncpg.connect(shard)
+        try:
+            async with conn.transaction():
+                await conn.execute(sql)
+                # fresh schema already contains every migration
+                await conn.executemany(
+                    "INSERT INTO schema_migrations (name) VALUES ($1)",
+                    [(name,) for name in migration_files()],
+                )
+            print("Tables created successfully.")
+        finally:
+            await conn.close()
+
+def migration_files():
+    return sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith('.sql'))
+
+async def migrate(dsn):
+    for shard in shard_dsns(dsn):
+        await migrate_shard(shard)
+
+async def migrate_shard(dsn):
+    import asyncpg
+
+    conn = await asyncpg.connect(dsn)
     try:
-        with open('database.sql', 'r') as f:
-            sql = f.read()
-        await conn.execute(sql)
-        print("Tables created successfully.")
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name VARCHAR(255) PRIMARY KEY,
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """)
+        applied = {r['name'] for r in await conn.fetch("SELECT name FROM schema_migrations")}
+        pending = [name for name in migration_files() if name not in applied]
+        for name in pending:
+            with open(os.path.join(MIGRATIONS_DIR, name), 'r') as f:
+                sql = f.read()
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute("INSERT INTO schema_migrations (name) VALUES ($1)", name)
+            print(f"Applied {name}")
+        print(f"Database is up to date ({len(pending)} migrations applied).")
     finally:
         await conn.close()
 
+async def export(dsn, path):
+    from database import Database
+    from export import export_all
+
+    async with Database(single_dsn(dsn, "Export")) as db:
+        counts = await export_all(db, path)
+    for table, count in counts.items():
+        print(f"Exported {count} new rows of {table}.")
+
+async def sync_sink(dsn, path):
+    from sinks import open_sink, sync
+
+    async with open_sink(dsn) as db:
+        rows = await sync(db, path)
+    print(f"Merged {rows} rows from {path}.")
+
+async def build_graph(dsn, path):
+    from database import Database
+    from graph import build_from_database
+
+    async with Database(single_dsn(dsn, "Graph export")) as db:
+        graph = await build_from_database(db, path)
+    print(f"Graph with {graph.num_edges} edges saved to {path}.")
+
+async def archive_posts(dsn, days):
+    from datetime import datetime, timedelta
+    from database import Database
+
+    moved = 0
+    for shard in shard_dsns(dsn):
+        async with Database(shard) as db:
+            moved += await db.archive_posts(datetime.now() - timedelta(days=days))
+    print(f"Moved {moved} posts older than {days} days to posts_archive.")
+
+async def index_signatures(dsn):
+    from database import Database
+
+    signed = 0
+    for shard in shard_dsns(dsn):
+        async with Database(shard) as db:
+            signed += await db.index_signatures()
+    print(f"Signed {signed} posts for near-duplicate search.")
+
+async def rebalance(dsn):
+    """Moves rows to their shard after shards were added. Stop crawlers first."""
+    from sharding import ShardedDatabase
+
+    async with ShardedDatabase(shard_dsns(dsn)) as db:
+        moved = await db.rebalance()
+    print(f"Moved the rows of {moved} users to their shards.")
+
 def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    dsn = os.getenv("DSN")
+
     parser = argparse.ArgumentParser(description="Manage parser database (create/drop).")
     parser.add_argument('--drop', action='store_true',
                         help="Drop all tables in the database.")
     parser.add_argument('--create', action='store_true',
                         help="(Re)create all tables in the database. Could be used with --drop")
+    parser.add_argument('--migrate', action='store_true',
+                        help="Apply pending migrations from the migrations directory.")
+    parser.add_argument('--export', metavar='DIR',
+                        help="Append new rows to the Parquet datasets in DIR.")
+    parser.add_argument('--sync', metavar='PATH',
+                        help="Merge a SQLite sink file or a JSONL sink directory into the database.")
+    parser.add_argument('--build-graph', metavar='DIR',
+                        help="Export the followers table to a memory-mapped graph in DIR.")
+    parser.add_argument('--archive-posts', metavar='DAYS', type=int,
+                        help="Move posts older than DAYS days to the compressed archive table.")
+    parser.add_argument('--dedup-index', action='store_true',
+                        help="Compute near-duplicate signatures of posts saved without them.")
+    parser.add_argument('--rebalance', action='store_true',
+                        help="Move rows to their shard after shards were added to DSN.")
     args = parser.parse_args()
 
     if args.drop:
-        asyncio.run(drop_tables())
+        asyncio.run(drop_tables(dsn))
     if args.create:
-        asyncio.run(create_tables())
-    if not any(vars(args).values()):
+        asyncio.run(create_tables(dsn))
+    if args.migrate:
+        asyncio.run(migrate(dsn))
+    if args.export:
+        asyncio.run(export(dsn, args.export))
+    if args.sync:
+        asyncio.run(sync_sink(dsn, args.sync))
+    if args.build_graph:
+        asyncio.run(build_graph(dsn, args.build_graph))
+    if args.archive_posts is not None:
+        asyncio.run(archive_posts(dsn, args.archive_posts))
+    if args.dedup_index:
+        asyncio.run(index_signatures(dsn))
+    if args.rebalance:
+        asyncio.run(rebalance(dsn))
+    if not any(v is not None and v is not False for v in vars(args).values()):
         print(HELP_MSG)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,175 @@
+"""
+Near-duplicate detection of post texts with MinHash and LSH.
+
+A post text is reduced to the set of its character `SHINGLE`-grams, and a
+MinHash signature of `NUM_PERM` uint32 values estimates the Jaccard
+similarity of two such sets: the share of equal positions. Signatures are
+split into `BANDS` bands of `ROWS` values, and posts with an equal band
+land in the same bucket. Two posts with similarity s share a bucket with
+probability 1 - (1 - s^ROWS)^BANDS, about 0.98 at s=0.8 and 0.05 at s=0.5,
+so only bucket mates have to be compared.
+
+Signatures and buckets are stored with the posts (`post_signatures`,
+`post_lsh_buckets`), so the index grows with every saved batch.
+"""
+import re
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5
+# shorter texts ("Yes!", "🇺🇸") are equal far too often to mean anything
+MIN_LENGTH = 20
+# shingles hashed per step, (NUM_PERM, CHUNK) uint32 is 16MB
+CHUNK = 1 << 15
+
+_URL = re.compile(r"https?://\S+")
+_SPACES = re.compile(r"\s+")
+_rng = np.random.default_rng(20250101)
+# a * x + b mod 2**32 with an odd `a` permutes uint32 values, which is
+# several times faster than hashing modulo a prime in uint64
+_A = (_rng.integers(0, 2**32, NUM_PERM, dtype=np.uint32) | np.uint32(1))[:, None]
+_B = _rng.integers(0, 2**32, NUM_PERM, dtype=np.uint32)[:, None]
+_POWERS = _rng.integers(1, 2**63, SHINGLE, dtype=np.uint64) | np.uint64(1)
+_BAND_MIX = _rng.integers(1, 2**63, ROWS, dtype=np.uint64) | np.uint64(1)
+
+
+def normalize(text: str) -> str:
+    """Lowercase text without links and repeated whitespace."""
+    return _SPACES.sub(" ", _URL.sub(" ", text.lower())).strip()
+
+
+def _shingle_hashes(texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Hashes of the character shingles of all `texts` at once, and the
+    offsets of every text's hashes. Texts must be at least SHINGLE long.
+    """
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    ends = np.cumsum(lengths)
+    # a window starting at i belongs to the text which contains i + SHINGLE - 1
+    windows = sliding_window_view(codes.astype(np.uint64), SHINGLE)
+    hashes = (windows * _POWERS).sum(axis=1)
+    starts = np.arange(len(windows))
+    owner = np.searchsorted(ends, starts, side="right")
+    keep = owner == np.searchsorted(ends, starts + SHINGLE - 1, side="right")
+    hashes = hashes[keep]
+    hashes ^= hashes >> np.uint64(32)
+    hashes *= np.uint64(0x9E3779B97F4A7C15)
+    counts = lengths - SHINGLE + 1
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return (hashes >> np.uint64(32)).astype(np.uint32), offsets
+
+
+def signatures(texts: list[str]) -> tuple[list[int], np.ndarray]:
+    """
+    MinHash signatures of `texts`. Returns the indices of the texts long
+    enough to be signed and their (n, NUM_PERM) uint32 signatures.
+    """
+    normalized = [normalize(t) for t in texts]
+    kept = [i for i, t in enumerate(normalized) if len(t) >= MIN_LENGTH]
+    result = np.empty((len(kept), NUM_PERM), dtype=np.uint32)
+    if not kept:
+        return kept, result
+    hashes, offsets = _shingle_hashes([normalized[i] for i in kept])
+    # permutations x shingles, so that the minimum of a text is taken
+    # over contiguous memory
+    buffer = np.empty((NUM_PERM, min(CHUNK, len(hashes))), dtype=np.uint32)
+    first = 0
+    while first < len(kept):
+        # as many texts as fit in CHUNK shingles, at least one
+        last = np.searchsorted(offsets, offsets[first] + CHUNK, side="right") - 1
+        last = max(int(last), first + 1)
+        rows = hashes[offsets[first]:offsets[last]]
+        if len(rows) > buffer.shape[1]:
+            # a single text longer than CHUNK shingles
+            buffer = np.empty((NUM_PERM, len(rows)), dtype=np.uint32)
+        permuted = buffer[:, :len(rows)]
+        np.multiply(_A, rows, out=permuted)
+        np.add(permuted, _B, out=permuted)
+        result[first:last] = np.minimum.reduceat(
+            permuted, offsets[first:last] - offsets[first], axis=1
+        ).T
+        first = last
+    return kept, result
+
+
+def band_keys(sigs: np.ndarray) -> np.ndarray:
+    """(n, BANDS) int64 bucket keys of signatures."""
+    bands = sigs.reshape(len(sigs), BANDS, ROWS).astype(np.uint64)
+    return (bands * _BAND_MIX).sum(axis=2).view(np.int64)
+
+
+def similarity(sig: np.ndarray, sigs: np.ndarray) -> np.ndarray:
+    """Estimated Jaccard similarity of a signature to each of `sigs`."""
+    return (sigs == sig).mean(axis=1)
+
+
+def rank_similar(
+    post_id: int, ids: list[int], sigs: np.ndarray, threshold: float = 0.8
+) -> list[tuple[int, float]]:
+    """
+    (id, estimated similarity) of the `ids` at least `threshold` similar
+    to `post_id` (one of them), most similar first.
+    """
+    if post_id not in ids:
+        return []
+    scores = similarity(sigs[ids.index(post_id)], sigs)
+    found = [
+        (other, float(score))
+        for other, score in zip(ids, scores)
+        if other != post_id and score >= threshold
+    ]
+    return sorted(found, key=lambda f: (-f[1], f[0]))
+
+
+def to_bytes(sig: np.ndarray) -> bytes:
+    return sig.astype("<u4").tobytes()
+
+
+def from_bytes(values: list[bytes]) -> np.ndarray:
+    return np.frombuffer(b"".join(values), dtype="<u4").reshape(len(values), NUM_PERM)
+
+
+def cluster(ids: list[int], sigs: np.ndarray, threshold: float = 0.8) -> list[list[int]]:
+    """
+    Groups of `ids` whose texts are near-duplicates, largest first.
+
+    Within every band, bucket members are compared to the first member of
+    the bucket only, and accepted pairs are merged with union-find, so a
+    large copy-paste campaign costs linear time instead of quadratic.
+    """
+    n = len(ids)
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    keys = band_keys(sigs)
+    positions = np.arange(n)
+    for band in range(BANDS):
+        order = np.argsort(keys[:, band], kind="stable")
+        sorted_keys = keys[order, band]
+        new_bucket = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        leaders = order[np.maximum.accumulate(np.where(new_bucket, positions, 0))]
+        members = ~new_bucket
+        a, b = order[members], leaders[members]
+        if not len(a):
+            continue
+        similar = (sigs[a] == sigs[b]).mean(axis=1) >= threshold
+        for i, j in zip(a[similar].tolist(), b[similar].tolist()):
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[root_i] = root_j
+
+    groups: dict[int, list[int]] = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(ids[i])
+    clusters = [sorted(g) for g in groups.values() if len(g) > 1]
+    return sorted(clusters, key=lambda g: (-len(g), g[0]))
@@ -1,9 +1,13 @@
 from .post import Post
 from .user import User
 from .follower import Follower
+from .batch import PostBatch, FollowerBatch, InteractionBatch
 
 __all__ = [
     "Post",
     "User",
     "Follower",
+    "PostBatch",
+    "FollowerBatch",
+    "InteractionBatch",
 ]
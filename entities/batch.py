@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+from array import array
+from datetime import datetime
+
+from .post import Post
+from .follower import Follower
+
+
+class PostBatch:
+    """
+    Columnar container of parsed posts.
+
+    Posts are deduplicated by (post_id, is_repost) on append and stored
+    column by column, so the batch keeps neither the `Post` objects nor
+    their HTML trees. Columns are passed to the database as arrays.
+    """
+
+    __slots__ = (
+        "post_id",
+        "owner",
+        "reply_to",
+        "timestamp",
+        "is_repost",
+        "who_reposted",
+        "text",
+        "likes",
+        "replies",
+        "reposts",
+        "parent_id",
+        "root_id",
+        "mentions",
+        "hashtags",
+        "links",
+        "media",
+        "avatar_url",
+        "_keys",
+    )
+    post_id: array
+    owner: list[str]
+    reply_to: list[str | None]
+    timestamp: list[datetime]
+    is_repost: list[bool]
+    who_reposted: list[str | None]
+    text: list[str]
+    likes: array
+    replies: array
+    reposts: array
+    parent_id: list[int | None]
+    root_id: list[int | None]
+    mentions: list[list[str]]
+    hashtags: list[list[str]]
+    links: list[list[tuple[str, str]]]
+    media: list[list[str]]
+    avatar_url: list[str | None]
+    _keys: set[tuple[int, bool]]
+
+    def __init__(self, posts=()):
+        self.post_id = array("q")
+        self.owner = []
+        self.reply_to = []
+        self.timestamp = []
+        self.is_repost = []
+        self.who_reposted = []
+        self.text = []
+        self.likes = array("q")
+        self.replies = array("q")
+        self.reposts = array("q")
+        self.parent_id = []
+        self.root_id = []
+        self.mentions = []
+        self.hashtags = []
+        self.links = []
+        self.media = []
+        self.avatar_url = []
+        self._keys = set()
+        for post in posts:
+            self.append(post)
+
+    def append(self, post: Post) -> bool:
+        """Adds a post to the batch. Returns False if it is already there."""
+        key = (post.post_id, post.is_repost)
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self.post_id.append(post.post_id)
+        self.owner.append(post.owner)
+        self.reply_to.append(post.reply_to)
+        self.timestamp.append(post.timestamp)
+        self.is_repost.append(post.is_repost)
+        self.who_reposted.append(post.who_reposted)
+        self.text.append(post.text)
+        self.likes.append(post.likes)
+        self.replies.append(post.replies)
+        self.reposts.append(post.reposts)
+        self.parent_id.append(post.parent_id)
+        self.root_id.append(post.root_id)
+        self.mentions.append(post.mentions)
+        self.hashtags.append(post.hashtags)
+        self.links.append(post.links)
+        self.media.append(post.media)
+        self.avatar_url.append(post.avatar_url)
+        return True
+
+    def usernames(self) -> list[str]:
+        """
+        Every username referenced by the batch: owners, replied, reposters
+        and mentioned users.
+        """
+        names = set(self.owner)
+        names.update(n for n in self.reply_to if n)
+        names.update(n for n in self.who_reposted if n)
+        for mentions in self.mentions:
+            names.update(mentions)
+        return sorted(names)
+
+    def entity_rows(self, indices=None):
+        """
+        (post_id, username), (post_id, tag, creation_date) and
+        (post_id, url, domain) rows of the posts at `indices` (all by default).
+        """
+        mentions, hashtags, links = set(), set(), set()
+        for i in range(len(self)) if indices is None else indices:
+            post_id = self.post_id[i]
+            mentions.update((post_id, username) for username in self.mentions[i])
+            hashtags.update(
+                (post_id, tag, self.timestamp[i]) for tag in self.hashtags[i]
+            )
+            links.update((post_id, url, domain) for url, domain in self.links[i])
+        return sorted(mentions), sorted(hashtags), sorted(links)
+
+    def media_rows(self, indices=None):
+        """
+        (post_id, url, position) attachment rows and (owner, avatar_url) rows
+        of the posts at `indices` (all by default).
+        """
+        media, avatars = set(), set()
+        for i in range(len(self)) if indices is None else indices:
+            post_id = self.post_id[i]
+            media.update(
+                (post_id, url, position) for position, url in enumerate(self.media[i])
+            )
+            if self.avatar_url[i]:
+                avatars.add((self.owner[i], self.avatar_url[i]))
+        return sorted(media), sorted(avatars)
+
+    def media_urls(self) -> list[str]:
+        """Every attachment and avatar url of the batch, for the downloader."""
+        urls = {url for media in self.media for url in media}
+        urls.update(url for url in self.avatar_url if url)
+        return sorted(urls)
+
+    def thread_links(self) -> list[tuple[int, int | None, int]]:
+        """(post_id, parent_id, root_id) of the posts read from thread pages."""
+        return sorted(
+            {
+                (post_id, parent_id, root_id)
+                for post_id, parent_id, root_id in zip(
+                    self.post_id, self.parent_id, self.root_id
+                )
+                if root_id is not None
+            },
+            key=lambda link: link[0],
+        )
+
+    def __len__(self) -> int:
+        return len(self.post_id)
+
+    def __getitem__(self, i: int) -> Post:
+        return Post(
+            post_id=self.post_id[i],
+            owner=self.owner[i],
+            reply_to=self.reply_to[i],
+            timestamp=self.timestamp[i],
+            is_repost=self.is_repost[i],
+            who_reposted=self.who_reposted[i],
+            text=self.text[i],
+            likes=self.likes[i],
+            replies=self.replies[i],
+            reposts=self.reposts[i],
+            parent_id=self.parent_id[i],
+            root_id=self.root_id[i],
+            mentions=self.mentions[i],
+            hashtags=self.hashtags[i],
+            links=self.links[i],
+            media=self.media[i],
+            avatar_url=self.avatar_url[i],
+        )
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __repr__(self):
+        return f"PostBatch({len(self)} posts)"
+
+
+class FollowerBatch:
+    """
+    Columnar container of follower edges, deduplicated by
+    (username, who_to_follow).
+    """
+
+    __slots__ = ("username", "name", "who_to_follow", "_keys")
+    username: list[str]
+    name: list[str | None]
+    who_to_follow: list[str]
+    _keys: set[tuple[str, str]]
+
+    def __init__(self, followers=()):
+        self.username = []
+        self.name = []
+        self.who_to_follow = []
+        self._keys = set()
+        for follower in followers:
+            self.append(follower)
+
+    def append(self, follower: Follower) -> bool:
+        """Adds a follower to the batch. Returns False if it is already there."""
+        key = (follower.username, follower.who_to_follow)
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self.username.append(follower.username)
+        self.name.append(follower.name)
+        self.who_to_follow.append(follower.who_to_follow)
+        return True
+
+    def __len__(self) -> int:
+        return len(self.username)
+
+    def __getitem__(self, i: int) -> Follower:
+        return Follower(
+            who_to_follow=self.who_to_follow[i],
+            username=self.username[i],
+            name=self.name[i],
+        )
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __repr__(self):
+        return f"FollowerBatch({len(self)} followers)"
+
+
+class InteractionBatch:
+    """
+    Columnar container of users who reposted or liked a post,
+    deduplicated by (post_id, username, interaction).
+    """
+
+    __slots__ = ("post_id", "username", "name", "interaction", "_keys")
+    post_id: array
+    username: list[str]
+    name: list[str | None]
+    interaction: list[str]
+    _keys: set[tuple[int, str, str]]
+
+    def __init__(self):
+        self.post_id = array("q")
+        self.username = []
+        self.name = []
+        self.interaction = []
+        self._keys = set()
+
+    def append(
+        self, post_id: int, username: str, interaction: str, name: str | None = None
+    ) -> bool:
+        """Adds an interaction to the batch. Returns False if it is already there."""
+        key = (post_id, username, interaction)
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self.post_id.append(post_id)
+        self.username.append(username)
+        self.name.append(name)
+        self.interaction.append(interaction)
+        return True
+
+    def extend(self, post_id: int, accounts: FollowerBatch, interaction: str):
+        """Adds the accounts of a scrolled "ReTruthed by" / "Liked by" list."""
+        for username, name in zip(accounts.username, accounts.name):
+            self.append(post_id, username, interaction, name)
+
+    def __len__(self) -> int:
+        return len(self.post_id)
+
+    def __iter__(self):
+        return zip(self.post_id, self.username, self.interaction)
+
+    def __repr__(self):
+        return f"InteractionBatch({len(self)} interactions)"
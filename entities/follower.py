@@ -1,4 +1,11 @@
-from pyquery import PyQuery as pq
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from .html import parse_html
+
+if TYPE_CHECKING:
+    from pyquery import PyQuery as pq
 
 class Follower:
     __slots__ = (
@@ -20,8 +27,10 @@ class Follower:
         html_data: str | None = None,
     ):
         if html_data:
-            self._html_data = pq(html_data)
+            self._html_data = parse_html(html_data)
             self._parse_html()
+            # the tree is not needed after parsing, don't keep it alive
+            del self._html_data
         elif username is None:
             raise ValueError("`username` is required")
         else:
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pyquery import PyQuery
+
+
+def parse_html(html: str) -> PyQuery:
+    """
+    Parses an HTML fragment. pyquery (and lxml) are imported on the first
+    call, so importing the entities stays cheap for analysis code.
+    """
+    from pyquery import PyQuery
+
+    return PyQuery(html)
@@ -1,7 +1,18 @@
 from __future__ import annotations
 
-from pyquery import PyQuery as pq
 from datetime import datetime
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+from constants import BASE_URL
+
+from .html import parse_html
+
+if TYPE_CHECKING:
+    from pyquery import PyQuery as pq
+
+# hosts of links whose paths are profiles and tags, None for relative links
+_INTERNAL_HOSTS = (None, urlparse(BASE_URL).hostname, "www." + urlparse(BASE_URL).hostname)
 
 class Post:
     __slots__ = (
@@ -15,6 +26,13 @@ class Post:
         "likes",
         "replies",
         "reposts",
+        "parent_id",
+        "root_id",
+        "mentions",
+        "hashtags",
+        "links",
+        "media",
+        "avatar_url",
         "_html_data",
     )
     _html_data: pq
@@ -31,6 +49,22 @@ class Post:
     replies: int
     reposts: int
 
+    # id of the replied post and of the first post of the conversation,
+    # only known for posts read from a thread page (see `thread.py`)
+    parent_id: int | None
+    root_id: int | None
+
+    # entities of the text: mentioned usernames, lowercase hashtags
+    # and outbound (url, domain) links
+    mentions: list[str]
+    hashtags: list[str]
+    links: list[tuple[str, str]]
+
+    # urls of the attached images and videos (originals, not previews) and
+    # of the owner's avatar, downloaded apart from the crawl (see `media.py`)
+    media: list[str]
+    avatar_url: str | None
+
     def __init__(
         self,
         post_id: int | None = None,
@@ -43,12 +77,28 @@ class Post:
         likes: int = 0,
         replies: int = 0,
         reposts: int = 0,
+        parent_id: int | None = None,
+        root_id: int | None = None,
+        mentions: list[str] | None = None,
+        hashtags: list[str] | None = None,
+        links: list[tuple[str, str]] | None = None,
+        media: list[str] | None = None,
+        avatar_url: str | None = None,
         *,
         html_data: str | None = None,
     ):
+        self.parent_id = parent_id
+        self.root_id = root_id
+        self.mentions = mentions or []
+        self.hashtags = hashtags or []
+        self.links = links or []
+        self.media = media or []
+        self.avatar_url = avatar_url
         if html_data:
-            self._html_data = pq(html_data)
+            self._html_data = parse_html(html_data)
             self._parse_html()
+            # the tree is not needed after parsing, don't keep it alive
+            del self._html_data
             return None
         if None in (post_id, owner, timestamp, text):
             raise ValueError("Post ID, owner, text, and timestamp are required")
@@ -71,6 +121,9 @@ class Post:
         self.is_repost = self.parse_is_repost()
         self.who_reposted = self.parse_who_reposted()
         self.text = self.parse_text()
+        self.parse_entities()
+        self.media = self.parse_media()
+        self.avatar_url = self.parse_avatar_url()
         self.likes = self.parse_likes()
         self.replies = self.parse_replies()
         self.reposts = self.parse_reposts()
@@ -136,6 +189,43 @@ class Post:
         text = "\n".join(p for p in paragraphs if p)
         return text
 
+    def parse_entities(self):
+        """Collects mentions, hashtags and outbound links of the post text."""
+        text_wrapper = self._html_data(".status__content-wrapper div.relative").eq(0)
+        for link in text_wrapper.items("p a"):
+            href = link.attr("href") or ""
+            classes = (link.attr("class") or "").split()
+            url = urlparse(href)
+            # paths tell tags and profiles apart only on Truth Social itself,
+            # "https://medium.com/@alice/article" is an outbound link
+            internal = url.hostname in _INTERNAL_HOSTS
+            if "hashtag" in classes or internal and url.path.startswith("/tags/"):
+                tag = link.text().lstrip("#").strip().lower()
+                if tag and tag not in self.hashtags:
+                    self.hashtags.append(tag)
+            elif "mention" in classes or internal and url.path.startswith("/@"):
+                # href looks like "https://truthsocial.com/@examore" or "/@examore"
+                username = url.path.rstrip("/").split("/")[-1].lstrip("@")
+                if username and username not in self.mentions:
+                    self.mentions.append(username)
+            elif url.scheme in ("http", "https") and url.hostname:
+                domain = url.hostname.removeprefix("www.")
+                if (href, domain) not in self.links:
+                    self.links.append((href, domain))
+
+    def parse_media(self) -> list[str]:
+        """Urls of the original attached images and of the videos."""
+        media = []
+        gallery = self._html_data(".media-gallery__item")
+        for link in gallery.items("a.media-gallery__item-thumbnail"):
+            media.append(link.attr("href"))
+        for video in gallery.items("video"):
+            media.append(video.attr("src") or video.find("source").attr("src"))
+        return [url for url in dict.fromkeys(media) if url]
+
+    def parse_avatar_url(self) -> str | None:
+        return self._html_data('[data-testid="account"] img[alt="Avatar"]').attr("src")
+
     def __parse_stat_value(self, stat) -> int:
         text = str(self._html_data(f'button[title="{stat}"] span').text()).lower()
         if text:
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
-from pyquery import PyQuery as pq
 from datetime import datetime
+from typing import TYPE_CHECKING
+
+from .html import parse_html
+
+if TYPE_CHECKING:
+    from pyquery import PyQuery as pq
 
 
 class User:
@@ -40,8 +45,10 @@ class User:
         html_data: str | None = None,
     ):
         if html_data:
-            self._html_data = pq(html_data)
+            self._html_data = parse_html(html_data)
             self._parse_html()
+            # the tree is not needed after parsing, don't keep it alive
+            del self._html_data
             return None
         if None in (username, name):
             raise ValueError("Username, name are required")
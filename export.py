@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as parquet
+
+from database import Database
+
+STATE_FILE = "_export_state.json"
+EPOCH = datetime(1970, 1, 1)
+# change feed consumer whose offset keeps unexported inserts from being pruned
+FEED_CONSUMER = "export"
+
+POSTS_SCHEMA = pa.schema(
+    [
+        ("id", pa.int64()),
+        ("post_text", pa.string()),
+        ("owner_id", pa.int32()),
+        ("reply_to_id", pa.int64()),
+        ("likes", pa.int32()),
+        ("reposts", pa.int32()),
+        ("replies", pa.int32()),
+        ("creation_date", pa.timestamp("us")),
+    ]
+)
+USERS_SCHEMA = pa.schema(
+    [
+        ("id", pa.int32()),
+        ("username", pa.string()),
+        ("name", pa.string()),
+        ("followers", pa.int32()),
+        ("following", pa.int32()),
+        ("registration_date", pa.date32()),
+        ("location", pa.string()),
+        ("personal_site", pa.string()),
+        ("parser_status", pa.string()),
+        ("bio", pa.string()),
+    ]
+)
+FOLLOWERS_SCHEMA = pa.schema(
+    [
+        ("user_id", pa.int32()),
+        ("follower", pa.int32()),
+        ("added_at", pa.timestamp("us")),
+    ]
+)
+
+# hive style `day=YYYY-MM-DD` directories, so filters on `day` skip whole files
+DAY_PARTITIONING = ds.partitioning(pa.schema([("day", pa.date32())]), flavor="hive")
+
+# table name -> (schema, timestamp column the dataset is partitioned by)
+DATASETS = {
+    "posts": (POSTS_SCHEMA, "creation_date"),
+    "users": (USERS_SCHEMA, None),
+    "followers": (FOLLOWERS_SCHEMA, "added_at"),
+}
+
+
+def load_state(root: str) -> dict:
+    """
+    Watermarks of the last export: change feed offset of the last exported
+    post insert (and the snapshot of the full scan of posts), last user id
+    and last follower edge key.
+    """
+    path = os.path.join(root, STATE_FILE)
+    if not os.path.exists(path):
+        return {"users": 0, "followers": [EPOCH.isoformat(), 0, 0]}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_state(root: str, state: dict):
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, STATE_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, os.path.join(root, STATE_FILE))
+
+
+def records_to_batch(rows, schema: pa.Schema) -> pa.RecordBatch:
+    """Converts database records (tuples in schema order) to a record batch."""
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    arrays = [pa.array(col, type=field.type) for col, field in zip(columns, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_batch(root: str, table: str, batch: pa.RecordBatch):
+    """Appends a batch to the `table` dataset as new Parquet files."""
+    _, date_column = DATASETS[table]
+    partitioning = None
+    if date_column is not None:
+        day = pc.cast(batch.column(date_column), pa.date32())
+        batch = pa.RecordBatch.from_arrays(
+            batch.columns + [day], names=batch.schema.names + ["day"]
+        )
+        partitioning = DAY_PARTITIONING
+
+    ds.write_dataset(
+        batch,
+        os.path.join(root, table),
+        format="parquet",
+        partitioning=partitioning,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+    )
+
+
+async def export_posts(db: Database, root: str, state: dict) -> int:
+    """
+    Exports posts in the order they were inserted, read from the change
+    feed: post ids follow the post dates, and the older history of a user
+    crawled later has lower ids than posts exported before.
+    """
+    count = 0
+    if "posts_feed" not in state:
+        count += await export_missing_posts(db, root, state)
+    async for rows, offset in db.iter_inserted_posts(
+        tuple(state["posts_feed"]), seen=state.get("posts_snapshot")
+    ):
+        if rows:
+            write_batch(root, "posts", records_to_batch(rows, POSTS_SCHEMA))
+            count += len(rows)
+        state["posts_feed"] = list(offset)
+        save_state(root, state)
+        await db.set_consumer_offset(FEED_CONSUMER, offset)
+    return count
+
+
+async def export_missing_posts(db: Database, root: str, state: dict) -> int:
+    """
+    Exports every post not in the dataset yet with a full scan, then
+    starts following the change feed from where the scan's snapshot
+    began. Inserts that snapshot saw are skipped by later exports
+    (`posts_snapshot`), even those committed after its start. Used by
+    the first export, and by datasets written by id watermarks.
+    """
+    # keeps the changes from being pruned while the scan runs
+    await db.set_consumer_offset(FEED_CONSUMER, await db.get_change_feed_horizon())
+    exported = None
+    if os.path.isdir(os.path.join(root, "posts")):
+        exported = read_table(root, "posts", columns=["id"]).column("id")
+    count = 0
+    async for rows, snapshot in db.iter_posts_snapshot():
+        batch = records_to_batch(rows, POSTS_SCHEMA)
+        if exported is not None:
+            batch = batch.filter(pc.invert(pc.is_in(batch.column("id"), exported)))
+        if batch.num_rows:
+            write_batch(root, "posts", batch)
+            count += batch.num_rows
+    offset = (int(snapshot.split(":")[0]), 0)
+    state.pop("posts", None)
+    state["posts_feed"] = list(offset)
+    state["posts_snapshot"] = snapshot
+    save_state(root, state)
+    await db.set_consumer_offset(FEED_CONSUMER, offset)
+    return count
+
+
+async def export_users(db: Database, root: str, state: dict) -> int:
+    count = 0
+    async for rows in db.iter_users_after(state["users"]):
+        write_batch(root, "users", records_to_batch(rows, USERS_SCHEMA))
+        state["users"] = rows[-1]["id"]
+        save_state(root, state)
+        count += len(rows)
+    return count
+
+
+async def export_followers(db: Database, root: str, state: dict) -> int:
+    added_at, user_id, follower = state["followers"]
+    last_key = (datetime.fromisoformat(added_at), user_id, follower)
+    count = 0
+    async for rows in db.iter_followers_after(last_key):
+        write_batch(root, "followers", records_to_batch(rows, FOLLOWERS_SCHEMA))
+        last = rows[-1]
+        state["followers"] = [
+            last["added_at"].isoformat(), last["user_id"], last["follower"]
+        ]
+        save_state(root, state)
+        count += len(rows)
+    return count
+
+
+async def export_all(db: Database, root: str) -> dict[str, int]:
+    """
+    Appends rows added since the previous export to the Parquet datasets
+    under `root`. Posts are exported once, when inserted, and users by
+    increasing id, so later updates of counters and profiles of already
+    exported rows are not picked up.
+    """
+    state = load_state(root)
+    counts = {
+        "posts": await export_posts(db, root, state),
+        "users": await export_users(db, root, state),
+        "followers": await export_followers(db, root, state),
+    }
+    logging.info(f"Export to {root} finished: {counts}")
+    return counts
+
+
+def _dataset(root: str, table: str) -> ds.Dataset:
+    _, date_column = DATASETS[table]
+    return ds.dataset(
+        os.path.join(root, table),
+        format="parquet",
+        partitioning=DAY_PARTITIONING if date_column else None,
+    )
+
+
+def read_table(
+    root: str,
+    table: str,
+    columns: list[str] | None = None,
+    filter: ds.Expression | None = None,
+) -> pa.Table:
+    """
+    Reads an exported dataset with memory mapping. `filter` is pushed down:
+    conditions on `day` prune partitions, others use row group statistics.
+    """
+    _, date_column = DATASETS[table]
+    return parquet.read_table(
+        os.path.join(root, table),
+        columns=columns,
+        filters=filter,
+        memory_map=True,
+        partitioning=DAY_PARTITIONING if date_column else None,
+    )
+
+
+def iter_batches(
+    root: str,
+    table: str,
+    columns: list[str] | None = None,
+    filter: ds.Expression | None = None,
+    batch_size: int = 100_000,
+):
+    """Streams an exported dataset in record batches of bounded size."""
+    yield from _dataset(root, table).to_batches(
+        columns=columns, filter=filter, batch_size=batch_size
+    )
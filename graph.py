@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import logging
+import os
+from array import array
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    # asyncpg is only needed to build a graph from the database
+    from database import Database
+
+GRAPH_FILES = ("out_indptr", "out_indices", "in_indptr", "in_indices")
+
+
+class FollowerGraph:
+    """
+    Follower graph stored as two CSR adjacency structures over `users.id`.
+
+    An edge `follower -> user` means "follower follows user", so
+    the outgoing neighbours of a node are the accounts it follows and the
+    incoming neighbours are its followers. Indices are int32, offsets are
+    int64, and both are kept in `.npy` files which are memory-mapped on load.
+
+    New edges are buffered and merged into the CSR arrays in batches
+    (see `merge`), so ingestion cost is amortized over many edges.
+    """
+
+    path: str | None
+    merge_threshold: int
+    _out_indptr: np.ndarray
+    _out_indices: np.ndarray
+    _in_indptr: np.ndarray
+    _in_indices: np.ndarray
+    _pending_src: array
+    _pending_dst: array
+    _pagerank: np.ndarray | None
+
+    def __init__(self, path: str | None = None, merge_threshold: int = 100_000):
+        self.path = path
+        self.merge_threshold = merge_threshold
+        self._pending_src = array("i")
+        self._pending_dst = array("i")
+        self._pagerank = None
+        if path and os.path.exists(os.path.join(path, "out_indptr.npy")):
+            self._load(path)
+        else:
+            empty_ptr = np.zeros(1, dtype=np.int64)
+            empty_idx = np.zeros(0, dtype=np.int32)
+            self._out_indptr, self._out_indices = empty_ptr, empty_idx
+            self._in_indptr, self._in_indices = empty_ptr, empty_idx
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self._out_indptr) - 1
+
+    @property
+    def num_edges(self) -> int:
+        return len(self._out_indices)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending_src)
+
+    def add_edge(self, user_id: int, follower_id: int):
+        """Buffers an edge from the `followers` table (user_id, follower)."""
+        self._pending_src.append(follower_id)
+        self._pending_dst.append(user_id)
+        if self.pending >= self.merge_threshold:
+            self.merge()
+
+    def add_edges(self, user_ids, follower_ids):
+        self._pending_src.extend(follower_ids)
+        self._pending_dst.extend(user_ids)
+        if self.pending >= self.merge_threshold:
+            self.merge()
+
+    def merge(self):
+        """Merges buffered edges into the CSR arrays and saves them to `path`."""
+        if not self.pending:
+            return
+        new_src = np.frombuffer(self._pending_src, dtype=np.int32)
+        new_dst = np.frombuffer(self._pending_dst, dtype=np.int32)
+        n = max(self.num_nodes, int(new_src.max()) + 1, int(new_dst.max()) + 1)
+
+        old_src = _expand_indptr(self._out_indptr)
+        keys = np.concatenate(
+            [
+                _edge_keys(old_src, self._out_indices),
+                _edge_keys(new_src, new_dst),
+            ]
+        )
+        keys = np.unique(keys)
+        src = (keys >> 32).astype(np.int32)
+        dst = (keys & 0xFFFFFFFF).astype(np.int32)
+
+        # keys are sorted by source, so the outgoing CSR is a plain count
+        self._out_indptr = _build_indptr(src, n)
+        self._out_indices = dst
+        order = np.argsort(dst, kind="stable")
+        self._in_indptr = _build_indptr(dst[order], n)
+        self._in_indices = src[order]
+
+        logging.info(f"Merged {self.pending} edges, graph has {self.num_edges}")
+        self._pending_src = array("i")
+        self._pending_dst = array("i")
+        self._pagerank = None
+        if self.path:
+            self.save(self.path)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name in GRAPH_FILES:
+            tmp = os.path.join(path, f"{name}.tmp.npy")
+            np.save(tmp, getattr(self, f"_{name}"))
+            os.replace(tmp, os.path.join(path, f"{name}.npy"))
+
+    def _load(self, path: str):
+        for name in GRAPH_FILES:
+            data = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            setattr(self, f"_{name}", data)
+
+    def _check_node(self, node: int) -> bool:
+        return 0 <= node < self.num_nodes
+
+    def following(self, user_id: int) -> np.ndarray:
+        """Ids of the users followed by `user_id`."""
+        if not self._check_node(user_id):
+            return self._out_indices[:0]
+        return self._out_indices[
+            self._out_indptr[user_id]:self._out_indptr[user_id + 1]
+        ]
+
+    def followers(self, user_id: int) -> np.ndarray:
+        """Ids of the followers of `user_id`."""
+        if not self._check_node(user_id):
+            return self._in_indices[:0]
+        return self._in_indices[self._in_indptr[user_id]:self._in_indptr[user_id + 1]]
+
+    def following_count(self, user_id: int) -> int:
+        return len(self.following(user_id))
+
+    def followers_count(self, user_id: int) -> int:
+        return len(self.followers(user_id))
+
+    def out_degrees(self) -> np.ndarray:
+        return np.diff(self._out_indptr)
+
+    def in_degrees(self) -> np.ndarray:
+        return np.diff(self._in_indptr)
+
+    def k_hop(self, user_id: int, k: int, direction: str = "out") -> np.ndarray:
+        """
+        Ids of the nodes reachable from `user_id` within `k` hops
+        (excluding `user_id` itself). `direction` is "out" to follow
+        "following" edges or "in" to follow "followers" edges.
+        """
+        if direction == "out":
+            indptr, indices = self._out_indptr, self._out_indices
+        elif direction == "in":
+            indptr, indices = self._in_indptr, self._in_indices
+        else:
+            raise ValueError(f"Unknown direction: {direction}")
+        if not self._check_node(user_id):
+            return np.zeros(0, dtype=np.int32)
+
+        visited = np.zeros(self.num_nodes, dtype=bool)
+        visited[user_id] = True
+        frontier = np.array([user_id], dtype=np.int64)
+        for _ in range(k):
+            neighbours = _gather(indptr, indices, frontier)
+            neighbours = np.unique(neighbours)
+            frontier = neighbours[~visited[neighbours]]
+            if not len(frontier):
+                break
+            visited[frontier] = True
+        visited[user_id] = False
+        return np.flatnonzero(visited).astype(np.int32)
+
+    def pagerank(
+        self, damping: float = 0.85, max_iterations: int = 50, tol: float = 1e-6
+    ) -> np.ndarray:
+        """
+        PageRank over "follows" edges: being followed by highly ranked
+        accounts raises the score. Result is cached until the next merge.
+        """
+        if self._pagerank is not None:
+            return self._pagerank
+        n = self.num_nodes
+        if not n:
+            return np.zeros(0)
+
+        out_deg = self.out_degrees().astype(np.float64)
+        dangling = out_deg == 0
+        inv_deg = np.divide(1.0, out_deg, out=np.zeros(n), where=~dangling)
+        src = _expand_indptr(self._out_indptr)
+        dst = np.asarray(self._out_indices)
+
+        rank = np.full(n, 1.0 / n)
+        for _ in range(max_iterations):
+            contrib = (rank * inv_deg)[src]
+            new_rank = np.bincount(dst, weights=contrib, minlength=n)
+            new_rank = damping * (new_rank + rank[dangling].sum() / n)
+            new_rank += (1.0 - damping) / n
+            delta = np.abs(new_rank - rank).sum()
+            rank = new_rank
+            if delta < tol:
+                break
+        self._pagerank = rank
+        return rank
+
+    def scores(self, user_ids) -> np.ndarray:
+        """PageRank scores for `user_ids`, zero for unknown users."""
+        ids = np.asarray(user_ids, dtype=np.int64)
+        rank = self.pagerank()
+        known = (ids >= 0) & (ids < len(rank))
+        result = np.zeros(len(ids))
+        result[known] = rank[ids[known]]
+        return result
+
+
+async def build_from_database(
+    db: Database, path: str | None = None, chunk_size: int = 100_000
+) -> FollowerGraph:
+    """Streams the whole `followers` table into a new graph."""
+    graph = FollowerGraph(path, merge_threshold=chunk_size * 10)
+    async for user_ids, follower_ids in db.iter_follower_edges(chunk_size):
+        graph.add_edges(user_ids, follower_ids)
+    graph.merge()
+    return graph
+
+
+def _edge_keys(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    return (src.astype(np.int64) << 32) | dst.astype(np.int64)
+
+
+def _build_indptr(sorted_nodes: np.ndarray, n: int) -> np.ndarray:
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sorted_nodes, minlength=n), out=indptr[1:])
+    return indptr
+
+
+def _expand_indptr(indptr: np.ndarray) -> np.ndarray:
+    """Row id of every entry of a CSR structure."""
+    n = len(indptr) - 1
+    return np.repeat(np.arange(n, dtype=np.int32), np.diff(indptr))
+
+
+def _gather(indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """Concatenated neighbour lists of `nodes` without a Python loop."""
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.asarray(indices[offsets + np.arange(total)], dtype=np.int64)
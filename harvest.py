@@ -0,0 +1,159 @@
+import logging
+from collections import deque
+from random import randint
+
+import nodriver as uc
+
+from constants import BASE_URL, FOLLOWER_SELECTOR, SCROLL_MIN, SCROLL_MAX
+from entities import Follower, FollowerBatch
+from sinks import HarvestCheckpoint, Sink
+
+DIRECTIONS = ("followers", "following")
+
+
+class FollowerHarvester:
+    """
+    Streams the followers (or following) list of one account to the sink.
+
+    The list is virtualised: only the rows around the viewport are rendered,
+    so rows are read while scrolling and only a window of the last `window`
+    usernames is kept to skip rows rendered twice. Edges are flushed every
+    `chunk_size` rows together with a checkpoint holding the last seen
+    username (the cursor), so memory does not depend on the list size.
+
+    One run harvests at most `session_budget` new rows, a later run resumes
+    by scrolling past the cursor without saving anything. The list is only
+    considered finished when no row appeared after `stay_tolerance` scrolls
+    with exponentially growing waits, which tells a slow load from the end.
+
+    The page cannot seek to the cursor, so run k scrolls through k times
+    `session_budget` rows and the work grows with the square of the runs.
+    A list is therefore harvested in at most `max_sessions` runs: it is
+    finished, truncated, at `max_sessions * session_budget` rows.
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        username: str,
+        direction: str = "followers",
+        save_followers=None,
+        chunk_size: int = 500,
+        session_budget: int = 10_000,
+        max_sessions: int = 10,
+        window: int = 500,
+        stay_tolerance: int = 5,
+        max_wait: float = 16.0,
+    ):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown follower list direction {direction}")
+        self.sink = sink
+        self.username = username
+        self.direction = direction
+        # e.g. `UserParser._save_followers`, to keep the follower graph in sync
+        self.save_followers = save_followers or sink.save_followers
+        self.chunk_size = chunk_size
+        self.session_budget = session_budget
+        self.max_sessions = max_sessions
+        self.stay_tolerance = stay_tolerance
+        self.max_wait = max_wait
+        self._recent: deque[str] = deque(maxlen=window)
+        self._recent_set: set[str] = set()
+
+    def _remember(self, account: str) -> bool:
+        """Adds an account to the window. Returns False if it is already there."""
+        if account in self._recent_set:
+            return False
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_set.discard(self._recent[0])
+        self._recent.append(account)
+        self._recent_set.add(account)
+        return True
+
+    async def run(self, browser: uc.Browser) -> HarvestCheckpoint:
+        checkpoint = await self.sink.get_harvest_checkpoint(
+            self.username, self.direction
+        ) or HarvestCheckpoint(self.username, self.direction)
+        if checkpoint.finished or await self._truncate(checkpoint):
+            return checkpoint
+
+        # a new page renders the list from the top again
+        self._recent.clear()
+        self._recent_set.clear()
+        url = f"{BASE_URL}/@{self.username}/{self.direction}"
+        tab = await browser.get(url, new_tab=True)
+        try:
+            await tab.wait_for(FOLLOWER_SELECTOR)
+            await self._harvest(tab, checkpoint)
+        finally:
+            await tab.close()
+        await self._truncate(checkpoint)
+        logging.info(
+            f"@{self.username} {self.direction}: {checkpoint.harvested} harvested, "
+            f"{'finished' if checkpoint.finished else 'to be continued'}"
+        )
+        return checkpoint
+
+    async def _harvest(self, tab: uc.Tab, checkpoint: HarvestCheckpoint):
+        # rows before the cursor were saved by earlier runs, if the cursor row
+        # disappeared (unfollowed) resuming stops after as many skipped rows
+        resuming = checkpoint.cursor is not None
+        skipped = 0
+        batch = FollowerBatch()
+        harvested = 0
+        idle = 0
+        while True:
+            fresh = 0
+            for element in await tab.find_all(FOLLOWER_SELECTOR):
+                follower = Follower(
+                    who_to_follow=self.username, html_data=await element.get_html()
+                )
+                account = follower.username
+                if not self._remember(account):
+                    continue
+                fresh += 1
+                if resuming:
+                    skipped += 1
+                    resuming = (
+                        account != checkpoint.cursor and skipped < checkpoint.harvested
+                    )
+                    continue
+                if self.direction == "following":
+                    follower.swap_direction()
+                batch.append(follower)
+                checkpoint.cursor = account
+                harvested += 1
+                if len(batch) >= self.chunk_size:
+                    await self._flush(batch, checkpoint)
+                    batch = FollowerBatch()
+                if harvested >= self.session_budget:
+                    await self._flush(batch, checkpoint)
+                    return
+
+            idle = 0 if fresh else idle + 1
+            if idle > self.stay_tolerance:
+                checkpoint.finished = True
+                await self._flush(batch, checkpoint)
+                return
+            await tab.scroll_down(randint(SCROLL_MIN, SCROLL_MAX))
+            await tab.wait(min(2 ** idle, self.max_wait) if idle else randint(1, 3))
+
+    async def _truncate(self, checkpoint: HarvestCheckpoint) -> bool:
+        """Finishes a list which reached `max_sessions` runs. Returns True if it did."""
+        if checkpoint.finished or (
+            checkpoint.harvested < self.max_sessions * self.session_budget
+        ):
+            return False
+        checkpoint.finished = True
+        await self.sink.save_harvest_checkpoint(checkpoint)
+        logging.info(
+            f"@{self.username} {self.direction}: truncated at {checkpoint.harvested} "
+            f"rows after {self.max_sessions} sessions"
+        )
+        return True
+
+    async def _flush(self, batch: FollowerBatch, checkpoint: HarvestCheckpoint):
+        if len(batch):
+            await self.save_followers(batch)
+            checkpoint.harvested += len(batch)
+        await self.sink.save_harvest_checkpoint(checkpoint)
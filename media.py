@@ -0,0 +1,350 @@
+"""
+Downloads images and videos of posts and avatars of users apart from the
+crawl: parsing only collects their urls (`Post.media`, `Post.avatar_url`)
+and the browsers never wait for a file.
+
+Files are stored by content, `root/ab/cd/abcd...ef.jpg` named after their
+SHA-256, so media reposted under other urls is stored once. Every url is
+fetched once: urls already queued by this process or already downloaded
+according to the sink are skipped. Interrupted downloads are kept in
+`root/partial/` and resumed with a Range request.
+
+Requests are made with aiohttp, through the crawler's proxies when a
+`ProxyPool` is given: http proxies are passed per request, socks proxies
+get a session (and connection pool) each with aiohttp-socks.
+"""
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+from collections import Counter
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp_socks import ProxyConnector, ProxyError
+
+from entities import PostBatch
+from proxy import Proxy, ProxyPool
+from sinks import MediaFile, Sink
+
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 64 * 1024
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, url: str):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        return self.status >= 500 or self.status == 429
+
+
+class MediaStore:
+    """Directory of content addressed files."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(os.path.join(root, "partial"), exist_ok=True)
+
+    def partial_path(self, url: str) -> str:
+        name = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.root, "partial", f"{name}.part")
+
+    def find(self, sha256: str) -> str | None:
+        """Relative path of the file with this hash, whatever its extension."""
+        directory = os.path.join(sha256[:2], sha256[2:4])
+        try:
+            names = os.listdir(os.path.join(self.root, directory))
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if name.split(".", 1)[0] == sha256:
+                return os.path.join(directory, name)
+        return None
+
+    def add(self, partial: str, sha256: str, extension: str) -> tuple[str, bool]:
+        """
+        Moves a complete download to its content addressed path. Returns the
+        relative path and False if the same content was already stored.
+        """
+        existing = self.find(sha256)
+        if existing is not None:
+            os.remove(partial)
+            return existing, False
+        path = os.path.join(sha256[:2], sha256[2:4], sha256 + extension)
+        os.makedirs(os.path.dirname(os.path.join(self.root, path)), exist_ok=True)
+        os.replace(partial, os.path.join(self.root, path))
+        return path, True
+
+
+def _sha256(path: str) -> tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while data := f.read(1024 * 1024):
+            digest.update(data)
+            size += len(data)
+    return digest.hexdigest(), size
+
+
+def _extension(url: str, content_type: str | None) -> str:
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    if 1 < len(extension) <= 5:
+        return extension
+    if content_type:
+        return mimetypes.guess_extension(content_type.split(";")[0].strip()) or ""
+    return ""
+
+
+class MediaDownloader:
+    """
+    Queue of media urls downloaded by `workers` concurrent tasks over
+    pooled keep-alive connections, at most `per_host` requests to a host at
+    a time. Every attempt goes through a proxy of `proxy_pool` if given,
+    connection failures count against the proxy like failed users of the
+    crawler. `enqueue` never blocks the crawl: urls are looked up in the
+    sink and downloaded in the background, downloaded files are saved to
+    the sink in batches of `flush_size`.
+    """
+
+    def __init__(
+        self,
+        store: MediaStore,
+        workers: int = 8,
+        per_host: int = 4,
+        retries: int = 3,
+        timeout: float = 30.0,
+        backoff: float = 1.0,
+        flush_size: int = 50,
+        proxy_pool: ProxyPool | None = None,
+    ):
+        self.store = store
+        self.workers = workers
+        self.per_host = per_host
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.flush_size = flush_size
+        self.proxy_pool = proxy_pool
+        self.stats = Counter()
+        self._sink: Sink | None = None
+        self._seen: set[str] = set()
+        self._pending: asyncio.Queue[list[str]] = asyncio.Queue()
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=workers * 4)
+        self._downloaded: list[MediaFile] = []
+        self._tasks: list[asyncio.Task] = []
+        # by socks proxy url, None for direct and http proxied requests
+        self._sessions: dict[str | None, aiohttp.ClientSession] = {}
+        self._limits: dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start(self, sink: Sink | None = None):
+        """Starts the workers. Downloads are recorded in `sink` if given."""
+        self._sink = sink
+        self._tasks = [asyncio.create_task(self._lookup())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def wrap(self, sink: Sink):
+        """Proxy of `sink` which queues the media of every saved post batch."""
+        return _QueueingSink(sink, self)
+
+    def enqueue(self, urls) -> int:
+        """Queues the urls not seen yet. Returns how many were queued."""
+        new = [url for url in dict.fromkeys(urls) if url and url not in self._seen]
+        if new:
+            self._seen.update(new)
+            self._pending.put_nowait(new)
+        return len(new)
+
+    async def join(self):
+        """Waits until every queued url was downloaded or given up."""
+        await self._pending.join()
+        await self._queue.join()
+        await self._flush()
+
+    async def close(self, timeout: float = 60.0):
+        """Finishes the queued downloads for up to `timeout` seconds, then stops."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except TimeoutError:
+            logging.warning(f"Media downloads left unfinished: {self._queue.qsize()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._flush()
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+        logging.info(f"Media stats: {self.summary()}")
+
+    def summary(self) -> str:
+        return " ".join(f"{name}={count}" for name, count in sorted(self.stats.items()))
+
+    async def _lookup(self):
+        """Drops urls that the sink knows as downloaded, queues the others."""
+        while True:
+            urls = await self._pending.get()
+            try:
+                known = set()
+                if self._sink is not None:
+                    known = await self._sink.get_downloaded_urls(urls)
+                self.stats["known"] += len(known)
+                for url in urls:
+                    if url not in known:
+                        await self._queue.put(url)
+            except Exception as e:
+                logging.error(f"Cannot queue media urls: {e}")
+            finally:
+                self._pending.task_done()
+
+    async def _worker(self):
+        while True:
+            url = await self._queue.get()
+            try:
+                media_file = await self._download(url)
+                if media_file is not None:
+                    self._downloaded.append(media_file)
+                    if len(self._downloaded) >= self.flush_size:
+                        await self._flush()
+            except Exception as e:
+                self.stats["failed"] += 1
+                logging.error(f"Cannot store media {url}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _flush(self):
+        files, self._downloaded = self._downloaded, []
+        if files and self._sink is not None:
+            await self._sink.save_media_files(files)
+
+    async def _download(self, url: str) -> MediaFile | None:
+        """Downloads `url` with retries, None if it cannot be downloaded."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            proxy = await self.proxy_pool.acquire() if self.proxy_pool else None
+            failed = False
+            try:
+                return await self._fetch(url, proxy)
+            except HttpError as e:
+                error = e
+                if not e.retryable:
+                    break
+            except aiohttp.TooManyRedirects as e:
+                error = e
+                break
+            except ValueError as e:
+                # stale or unexpected partial download, started over
+                error = e
+            except (aiohttp.ClientError, ProxyError, OSError, EOFError) as e:
+                # connection errors, timeouts and truncated bodies, the part
+                # downloaded so far is resumed by the next attempt
+                error = e
+                failed = True
+            finally:
+                if proxy is not None:
+                    self._release(proxy, failed)
+        self.stats["failed"] += 1
+        logging.warning(f"Cannot download {url}: {error!r}")
+        return None
+
+    def _release(self, proxy: Proxy, failed: bool):
+        if failed:
+            self.proxy_pool.record_error(proxy)  # type: ignore
+        else:
+            self.proxy_pool.record_success(proxy)  # type: ignore
+        self.proxy_pool.release(proxy)  # type: ignore
+
+    def _session(self, proxy: Proxy | None) -> tuple[aiohttp.ClientSession, str | None]:
+        """Session to request through `proxy` and the proxy url to pass per request."""
+        socks = proxy is not None and proxy.scheme.startswith("socks")
+        key = proxy.url if socks else None
+        session = self._sessions.get(key)
+        if session is None:
+            # per host limits are enforced by `_limits` across sessions, the
+            # connector keeps as many connections open
+            options = {"limit": 0, "limit_per_host": self.per_host}
+            session = aiohttp.ClientSession(
+                connector=(
+                    ProxyConnector.from_url(proxy.url, **options)  # type: ignore
+                    if socks
+                    else aiohttp.TCPConnector(**options)
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=self.timeout, sock_read=self.timeout
+                ),
+                # byte ranges of the stored file, not of a compressed body
+                headers={"Accept-Encoding": "identity"},
+                auto_decompress=False,
+            )
+            self._sessions[key] = session
+        return session, None if socks or proxy is None else proxy.url
+
+    async def _fetch(self, url: str, proxy: Proxy | None = None) -> MediaFile:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported url {url}")
+        partial = self.store.partial_path(url)
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        limit = self._limits.setdefault(parts.netloc, asyncio.Semaphore(self.per_host))
+        session, proxy_url = self._session(proxy)
+        async with limit, session.get(
+            url, headers=headers, proxy=proxy_url, max_redirects=MAX_REDIRECTS
+        ) as response:
+            target = str(response.url)
+            if response.status == 416:
+                # the part on disk does not match the file anymore
+                os.remove(partial)
+                raise ValueError("Stale partial download")
+            if response.status not in (200, 206):
+                raise HttpError(response.status, target)
+            if response.status == 206:
+                # "bytes 1000-1999/2000"
+                content_range = response.headers.get("Content-Range", "")
+                if not content_range.startswith(f"bytes {offset}-"):
+                    os.remove(partial)
+                    raise ValueError(f"Unexpected range {content_range}")
+                self.stats["resumed"] += 1
+            else:
+                # served in full, the Range header was ignored
+                offset = 0
+            content_type = response.headers.get("Content-Type")
+            with open(partial, "ab" if offset else "wb") as f:
+                async for data in response.content.iter_chunked(CHUNK_SIZE):
+                    f.write(data)
+
+        sha256, size = await asyncio.to_thread(_sha256, partial)
+        path, new = await asyncio.to_thread(
+            self.store.add, partial, sha256, _extension(target, content_type)
+        )
+        self.stats["downloaded"] += 1
+        self.stats["stored" if new else "duplicates"] += 1
+        self.stats["bytes"] += size - offset
+        return MediaFile(url, sha256, size, content_type, path)
+
+
+class _QueueingSink:
+    __slots__ = ("_sink", "_downloader")
+
+    def __init__(self, sink: Sink, downloader: MediaDownloader):
+        self._sink = sink
+        self._downloader = downloader
+
+    def __getattr__(self, name):
+        return getattr(self._sink, name)
+
+    async def save_posts(self, batch: PostBatch):
+        await self._sink.save_posts(batch)
+        self._downloader.enqueue(batch.media_urls())
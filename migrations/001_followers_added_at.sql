@@ -0,0 +1,3 @@
+-- incremental exports need to know when a follower edge was first seen
+ALTER TABLE followers ADD COLUMN added_at TIMESTAMP NOT NULL DEFAULT now();
+CREATE INDEX followers_added_at_idx ON followers (added_at);
@@ -0,0 +1,7 @@
+-- full text (tsvector) and substring (trigram) search over posts
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+ALTER TABLE posts ADD COLUMN post_text_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', post_text)) STORED;
+CREATE INDEX posts_text_tsv_idx ON posts USING GIN (post_text_tsv);
+CREATE INDEX posts_text_trgm_idx ON posts USING GIN (post_text gin_trgm_ops);
+CREATE INDEX posts_owner_date_idx ON posts (owner_id, creation_date);
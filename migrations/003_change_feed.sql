@@ -0,0 +1,64 @@
+-- outbox of inserted and updated rows, consumers get woken up by NOTIFY
+-- on the 'change_feed' channel. Rows are read in (txid, id) order and only
+-- from transactions older than every running one, so a consumer offset
+-- never skips a row committed later by a concurrent transaction.
+CREATE TABLE change_feed (
+    id BIGSERIAL PRIMARY KEY,
+    txid BIGINT NOT NULL DEFAULT txid_current(),
+    entity VARCHAR(16) NOT NULL,
+    op CHAR(1) NOT NULL,
+    entity_id BIGINT NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE INDEX change_feed_txid_idx ON change_feed (txid, id);
+
+CREATE TABLE change_feed_offsets (
+    consumer VARCHAR(255) PRIMARY KEY,
+    last_txid BIGINT NOT NULL DEFAULT 0,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE FUNCTION record_change() RETURNS trigger AS $$
+DECLARE
+    row_id BIGINT;
+BEGIN
+    IF TG_TABLE_NAME = 'followers' THEN
+        row_id := NEW.user_id;
+    ELSE
+        row_id := NEW.id;
+    END IF;
+    INSERT INTO change_feed (entity, op, entity_id, payload)
+    VALUES (
+        TG_ARGV[0],
+        CASE TG_OP WHEN 'INSERT' THEN 'I' ELSE 'U' END,
+        row_id,
+        to_jsonb(NEW) - 'post_text_tsv'
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION notify_change_feed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('change_feed', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_insert_change AFTER INSERT ON posts
+    FOR EACH ROW EXECUTE FUNCTION record_change('post');
+CREATE TRIGGER posts_update_change AFTER UPDATE ON posts
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION record_change('post');
+CREATE TRIGGER users_insert_change AFTER INSERT ON users
+    FOR EACH ROW EXECUTE FUNCTION record_change('user');
+CREATE TRIGGER users_update_change AFTER UPDATE ON users
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION record_change('user');
+CREATE TRIGGER followers_insert_change AFTER INSERT ON followers
+    FOR EACH ROW EXECUTE FUNCTION record_change('follower');
+-- one notification per statement, consumers fetch everything after their offset
+CREATE TRIGGER change_feed_notify AFTER INSERT ON change_feed
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_change_feed();
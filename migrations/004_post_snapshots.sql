@@ -0,0 +1,27 @@
+-- append-only history of engagement counters, a row is written only when
+-- the counters of a post differ from the values stored in posts
+CREATE TABLE post_snapshots (
+    post_id BIGINT NOT NULL,
+    observed_at TIMESTAMP NOT NULL,
+    likes INT,
+    reposts INT,
+    replies INT,
+    PRIMARY KEY (post_id, observed_at)
+) PARTITION BY RANGE (observed_at);
+CREATE TABLE post_snapshots_default PARTITION OF post_snapshots DEFAULT;
+CREATE INDEX post_snapshots_observed_at_idx ON post_snapshots (observed_at);
+
+-- creates the monthly partition holding `ts` if it does not exist yet
+CREATE FUNCTION ensure_post_snapshots_partition(ts TIMESTAMP) RETURNS void AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', ts);
+    partition_name TEXT := 'post_snapshots_' || to_char(ts, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF post_snapshots FOR VALUES FROM (%L) TO (%L)',
+            partition_name, month_start, month_start + interval '1 month'
+        );
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
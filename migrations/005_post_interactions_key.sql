@@ -0,0 +1,10 @@
+-- every re-crawl of a repost used to insert one more 'reposted' row,
+-- keep the oldest of the duplicates and forbid new ones
+DELETE FROM post_interactions a
+    USING post_interactions b
+WHERE a.post_id = b.post_id
+    AND a.user_id = b.user_id
+    AND a.interaction = b.interaction
+    AND a.id > b.id;
+ALTER TABLE post_interactions
+    ADD CONSTRAINT post_interactions_key UNIQUE (post_id, user_id, interaction);
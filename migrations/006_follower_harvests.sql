@@ -0,0 +1,13 @@
+-- progress of streamed follower lists (see harvest.py), `cursor` is the
+-- last saved username of the list, a later session resumes after it
+CREATE TABLE follower_harvests (
+    username VARCHAR(255) NOT NULL,
+    direction VARCHAR(16) NOT NULL,
+    cursor VARCHAR(255),
+    harvested INT NOT NULL DEFAULT 0,
+    finished BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (username, direction)
+);
+CREATE INDEX follower_harvests_unfinished_idx ON follower_harvests (updated_at)
+    WHERE NOT finished;
@@ -0,0 +1,8 @@
+-- reply tree of conversations: the replied post and the first post of the
+-- conversation (the root has root_id = id). Filled from thread pages only,
+-- parents are not foreign keys because they may not be crawled yet
+ALTER TABLE posts
+    ADD COLUMN parent_id BIGINT,
+    ADD COLUMN root_id BIGINT;
+CREATE INDEX posts_parent_id_idx ON posts (parent_id) WHERE parent_id IS NOT NULL;
+CREATE INDEX posts_root_id_idx ON posts (root_id) WHERE root_id IS NOT NULL;
@@ -0,0 +1,25 @@
+-- entities of post texts, extracted while parsing. creation_date of the
+-- post is copied to post_hashtags so "top hashtags of a day" is a range scan
+CREATE TABLE post_mentions (
+    post_id BIGINT NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    PRIMARY KEY (post_id, user_id)
+);
+CREATE INDEX post_mentions_user_id_idx ON post_mentions (user_id, post_id);
+
+CREATE TABLE post_hashtags (
+    post_id BIGINT NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+    tag VARCHAR(255) NOT NULL,
+    creation_date TIMESTAMP NOT NULL,
+    PRIMARY KEY (post_id, tag)
+);
+CREATE INDEX post_hashtags_tag_idx ON post_hashtags (tag, creation_date);
+CREATE INDEX post_hashtags_creation_date_idx ON post_hashtags (creation_date, tag);
+
+CREATE TABLE post_links (
+    post_id BIGINT NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    domain VARCHAR(255) NOT NULL,
+    PRIMARY KEY (post_id, url)
+);
+CREATE INDEX post_links_domain_idx ON post_links (domain, post_id);
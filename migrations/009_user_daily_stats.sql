@@ -0,0 +1,141 @@
+-- per user per day rollups, maintained in the write path by statement
+-- triggers: each statement applies the difference between the new and the
+-- old rows it wrote from its transition tables, so dashboards read a few
+-- rows per user instead of aggregating posts. Rollups are history, deleting
+-- posts does not change them.
+-- user_daily_posts is keyed on the creation day of the posts: reply ratio
+-- is replies_sent / posts, average likes is likes / posts
+CREATE TABLE user_daily_posts (
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    posts INT NOT NULL DEFAULT 0,
+    replies_sent INT NOT NULL DEFAULT 0,
+    likes BIGINT NOT NULL DEFAULT 0,
+    reposts BIGINT NOT NULL DEFAULT 0,
+    replies BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+CREATE INDEX user_daily_posts_day_idx ON user_daily_posts (day, user_id);
+
+-- user_daily_followers is keyed on the day the profile was crawled: last
+-- seen counters of the day and follower edges discovered that day
+CREATE TABLE user_daily_followers (
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    followers INT,
+    following INT,
+    edges_added INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE FUNCTION apply_user_daily_posts() RETURNS trigger AS $$
+BEGIN
+    -- sorted upserts keep row lock order stable between concurrent workers
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO user_daily_posts AS s
+            (user_id, day, posts, replies_sent, likes, reposts, replies)
+        SELECT owner_id, creation_date::date, count(*), count(reply_to_id),
+            coalesce(sum(likes), 0), coalesce(sum(reposts), 0),
+            coalesce(sum(replies), 0)
+        FROM new_rows
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            posts = s.posts + EXCLUDED.posts,
+            replies_sent = s.replies_sent + EXCLUDED.replies_sent,
+            likes = s.likes + EXCLUDED.likes,
+            reposts = s.reposts + EXCLUDED.reposts,
+            replies = s.replies + EXCLUDED.replies;
+    ELSE
+        INSERT INTO user_daily_posts AS s
+            (user_id, day, posts, replies_sent, likes, reposts, replies)
+        SELECT user_id, day, sum(posts), sum(replies_sent),
+            sum(likes), sum(reposts), sum(replies)
+        FROM (
+            SELECT owner_id, creation_date::date, 1,
+                (reply_to_id IS NOT NULL)::int, coalesce(likes, 0),
+                coalesce(reposts, 0), coalesce(replies, 0)
+            FROM new_rows
+            UNION ALL
+            SELECT owner_id, creation_date::date, -1,
+                -(reply_to_id IS NOT NULL)::int, -coalesce(likes, 0),
+                -coalesce(reposts, 0), -coalesce(replies, 0)
+            FROM old_rows
+        ) delta (user_id, day, posts, replies_sent, likes, reposts, replies)
+        GROUP BY user_id, day
+        -- updates of other columns (thread links...) change nothing
+        HAVING (sum(posts), sum(replies_sent), sum(likes), sum(reposts), sum(replies))
+            <> (0, 0, 0, 0, 0)
+        ORDER BY user_id, day
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            posts = s.posts + EXCLUDED.posts,
+            replies_sent = s.replies_sent + EXCLUDED.replies_sent,
+            likes = s.likes + EXCLUDED.likes,
+            reposts = s.reposts + EXCLUDED.reposts,
+            replies = s.replies + EXCLUDED.replies;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION apply_user_daily_followers() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'users' THEN
+        INSERT INTO user_daily_followers AS s (user_id, day, followers, following)
+        SELECT id, now()::date, followers, following
+        FROM new_rows
+        WHERE followers IS NOT NULL OR following IS NOT NULL
+        ORDER BY id
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            followers = EXCLUDED.followers,
+            following = EXCLUDED.following
+        WHERE (s.followers, s.following)
+            IS DISTINCT FROM (EXCLUDED.followers, EXCLUDED.following);
+    ELSE
+        INSERT INTO user_daily_followers AS s (user_id, day, edges_added)
+        SELECT user_id, added_at::date, count(*)
+        FROM new_rows
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            edges_added = s.edges_added + EXCLUDED.edges_added;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_insert_daily AFTER INSERT ON posts
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_posts();
+CREATE TRIGGER posts_update_daily AFTER UPDATE ON posts
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_posts();
+CREATE TRIGGER users_insert_daily AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_followers();
+CREATE TRIGGER users_update_daily AFTER UPDATE ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_followers();
+CREATE TRIGGER followers_insert_daily AFTER INSERT ON followers
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_followers();
+
+-- backfill from the rows stored before the triggers existed
+INSERT INTO user_daily_posts (user_id, day, posts, replies_sent, likes, reposts, replies)
+SELECT owner_id, creation_date::date, count(*), count(reply_to_id),
+    coalesce(sum(likes), 0), coalesce(sum(reposts), 0), coalesce(sum(replies), 0)
+FROM posts
+GROUP BY 1, 2;
+
+INSERT INTO user_daily_followers (user_id, day, edges_added)
+SELECT user_id, added_at::date, count(*)
+FROM followers
+GROUP BY 1, 2;
+
+INSERT INTO user_daily_followers AS s (user_id, day, followers, following)
+SELECT id, now()::date, followers, following
+FROM users
+WHERE followers IS NOT NULL OR following IS NOT NULL
+ON CONFLICT (user_id, day) DO UPDATE SET
+    followers = EXCLUDED.followers,
+    following = EXCLUDED.following;
@@ -0,0 +1,63 @@
+-- cold tier of posts: `db_manage.py --archive-posts DAYS` moves old posts
+-- here so the hot table, its text search indexes and the upsert path stay
+-- bounded. Rows are written once and compressed (every row above 128 bytes
+-- is TOAST compressed), only the primary key and per-user reads are indexed
+CREATE TABLE posts_archive (
+    id BIGINT PRIMARY KEY,
+    post_text TEXT NOT NULL,
+    owner_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    reply_to_id BIGINT REFERENCES users(id),
+    likes INT,
+    reposts INT,
+    replies INT,
+    creation_date TIMESTAMP NOT NULL,
+    parent_id BIGINT,
+    root_id BIGINT,
+    archived_at TIMESTAMP NOT NULL DEFAULT now()
+) WITH (fillfactor = 100, toast_tuple_target = 128);
+CREATE INDEX posts_archive_owner_date_idx ON posts_archive (owner_id, creation_date);
+CREATE INDEX posts_archive_creation_date_idx ON posts_archive USING BRIN (creation_date);
+CREATE INDEX posts_creation_date_idx ON posts (creation_date);
+
+-- rows of post tables may point to archived posts
+ALTER TABLE post_interactions DROP CONSTRAINT post_interactions_post_id_fkey;
+ALTER TABLE post_mentions DROP CONSTRAINT post_mentions_post_id_fkey;
+ALTER TABLE post_hashtags DROP CONSTRAINT post_hashtags_post_id_fkey;
+ALTER TABLE post_links DROP CONSTRAINT post_links_post_id_fkey;
+
+-- both tiers, a post is stored in exactly one of them
+CREATE VIEW all_posts AS
+    SELECT id, post_text, owner_id, reply_to_id, likes, reposts, replies,
+        creation_date, parent_id, root_id
+    FROM posts
+    UNION ALL
+    SELECT id, post_text, owner_id, reply_to_id, likes, reposts, replies,
+        creation_date, parent_id, root_id
+    FROM posts_archive;
+
+-- re-crawled archived posts are updated in place instead of coming back
+-- to the hot table, whatever the write path (upserts, sync)
+CREATE FUNCTION route_archived_post() RETURNS trigger AS $$
+BEGIN
+    PERFORM 1 FROM posts_archive WHERE id = NEW.id;
+    IF NOT FOUND THEN
+        RETURN NEW;
+    END IF;
+    UPDATE posts_archive SET
+        post_text = NEW.post_text,
+        likes = NEW.likes,
+        reposts = NEW.reposts,
+        replies = NEW.replies
+    WHERE id = NEW.id
+        AND (post_text, likes, reposts, replies)
+            IS DISTINCT FROM (NEW.post_text, NEW.likes, NEW.reposts, NEW.replies);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_route_archived BEFORE INSERT ON posts
+    FOR EACH ROW EXECUTE FUNCTION route_archived_post();
+-- counters of archived posts still roll up (see user_daily_posts)
+CREATE TRIGGER posts_archive_update_daily AFTER UPDATE ON posts_archive
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_user_daily_posts();
@@ -0,0 +1,34 @@
+-- images and videos of posts and avatars of users. post_media and
+-- user_avatars are written with the posts, media_urls and media_files by
+-- the downloader (see media.py). Files are stored once per content hash,
+-- any number of urls can point to the same file
+CREATE TABLE post_media (
+    post_id BIGINT NOT NULL,
+    url TEXT NOT NULL,
+    position SMALLINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (post_id, url)
+);
+CREATE INDEX post_media_url_idx ON post_media (url);
+
+CREATE TABLE user_avatars (
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    first_seen TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, url)
+);
+CREATE INDEX user_avatars_url_idx ON user_avatars (url);
+
+CREATE TABLE media_files (
+    sha256 CHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    content_type VARCHAR(255),
+    path TEXT NOT NULL,
+    downloaded_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE media_urls (
+    url TEXT PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL REFERENCES media_files(sha256),
+    fetched_at TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE INDEX media_urls_sha256_idx ON media_urls (sha256);
@@ -0,0 +1,19 @@
+-- MinHash signatures of post texts and their LSH buckets, see dedup.py.
+-- Rows are added as posts are saved, posts saved before this migration
+-- are indexed with `cli.py db dedup-index`. Like the other post_* tables
+-- they cover both tiers (all_posts), so there is no foreign key to posts
+CREATE TABLE post_signatures (
+    post_id BIGINT PRIMARY KEY,
+    creation_date TIMESTAMP NOT NULL,
+    -- NUM_PERM little endian uint32
+    signature BYTEA NOT NULL
+);
+CREATE INDEX post_signatures_creation_date_idx ON post_signatures (creation_date);
+
+CREATE TABLE post_lsh_buckets (
+    band SMALLINT NOT NULL,
+    bucket BIGINT NOT NULL,
+    post_id BIGINT NOT NULL,
+    PRIMARY KEY (band, bucket, post_id)
+);
+CREATE INDEX post_lsh_buckets_post_id_idx ON post_lsh_buckets (post_id);
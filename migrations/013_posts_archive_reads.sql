@@ -0,0 +1,22 @@
+-- reads of all_posts are indexed on the archive like on posts: threads by
+-- parent_id and root_id, text search by expression instead of a stored
+-- tsvector column. Keyset pages of all_posts (ORDER BY creation_date DESC,
+-- id DESC) merge both (creation_date, id) indexes instead of sorting the
+-- tiers, so they replace the BRIN and creation_date indexes of 010
+DROP INDEX posts_archive_creation_date_idx;
+DROP INDEX posts_creation_date_idx;
+CREATE INDEX posts_archive_creation_date_idx ON posts_archive (creation_date, id);
+CREATE INDEX posts_creation_date_idx ON posts (creation_date, id);
+CREATE INDEX posts_archive_parent_id_idx ON posts_archive (parent_id)
+    WHERE parent_id IS NOT NULL;
+CREATE INDEX posts_archive_root_id_idx ON posts_archive (root_id)
+    WHERE root_id IS NOT NULL;
+CREATE INDEX posts_archive_text_tsv_idx ON posts_archive
+    USING GIN (to_tsvector('english', post_text));
+CREATE INDEX posts_archive_text_trgm_idx ON posts_archive USING GIN (post_text gin_trgm_ops);
+
+-- in-place updates of archived posts reach change feed consumers like
+-- updates of hot posts
+CREATE TRIGGER posts_archive_update_change AFTER UPDATE ON posts_archive
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION record_change('post');
@@ -1,42 +1,43 @@
+import asyncio
 import logging
-import os
 from time import time
-from collections import deque
+from collections import Counter, deque
 import traceback
 
 from random import randint
-from ordered_set import OrderedSet
-from dotenv import load_dotenv
 
 # nodriver was "undetected chrome" earlier so it's convinient to use 'uc' name
 import nodriver as uc
 
-from entities import Post, User, Follower
-from database import Database
-
-logging.basicConfig(level=logging.INFO)
-load_dotenv()
-
-PROXY = "socks5://localhost:2080"
-BASE_URL = "https://truthsocial.com"
-
-USERNAME = os.environ["TS_USERNAME"]
-PASSWORD = os.environ["TS_PASSWORD"]
-DSN = os.environ["DSN"]
-
-POST_SELECTOR = ".status__wrapper.space-y-4.status-public.p-4"
-REPLY_POST_SELECTOR = ".status__wrapper.space-y-4.status-public.status-reply.p-4"
-USER_INFO_SELECTOR = "div.flex.flex-col.space-y-3.mt-6.min-w-0.flex-1.px-4"
-FOLLOWER_SELECTOR = 'div[class="pb-4"] div[data-testid="account"]'
-
-SCROLL_MIN = 80
-SCROLL_MAX = 110
+from entities import Post, User, Follower, PostBatch, FollowerBatch, InteractionBatch
+from sinks import Sink, open_sink
+from graph import FollowerGraph
+from harvest import FollowerHarvester
+from thread import ThreadCrawler
+from profiling import CrawlProfiler, UserProfile, span
+from supervisor import BrowserSupervisor
+from scheduler import ResourceScheduler
+from media import MediaDownloader
+from proxy import Proxy, ProxyPool
+from watch import Watcher
+from constants import (
+    BASE_URL,
+    POST_SELECTOR,
+    REPLY_POST_SELECTOR,
+    USER_INFO_SELECTOR,
+    FOLLOWER_SELECTOR,
+    INTERACTION_ACCOUNT_SELECTOR,
+    INTERACTION_BUTTONS,
+    INTERACTION_MODAL_SELECTOR,
+    SCROLL_MIN,
+    SCROLL_MAX,
+)
 
 INTIAL_USERNAME = "realDonaldTrump"
 
 
 class Parser:
-    browser: uc.Browser
+    _proxy_pool: ProxyPool
     _login_username: str
     _login_pass: str
     _dsn: str
@@ -44,10 +45,12 @@ class Parser:
     _users_queue: deque[str]
     _seen_usenames: set[str]
     _iterations: int
+    _max_iterations: int
+    _active_workers: int
 
     def __init__(
         self,
-        proxy_url: str,
+        proxy_pool: ProxyPool,
         login_username: str,
         login_pass: str,
         db_credentials: str,
@@ -56,8 +59,20 @@ class Parser:
         replies_per_user: int = 30,
         followers_per_user: int = 50,
         following_per_user: int = 50,
+        interactions_per_post: int = 0,
+        interaction_threshold: int = 100,
+        follower_session_budget: int = 0,
+        follower_sessions: int = 10,
+        thread_posts: int = 0,
+        profiler: CrawlProfiler | None = None,
+        supervisor: BrowserSupervisor | None = None,
+        scheduler: ResourceScheduler | None = None,
+        browsers: int = 1,
+        health_check_interval: float = 30.0,
+        follower_graph: FollowerGraph | None = None,
+        media: MediaDownloader | None = None,
     ) -> None:
-        self._proxy = proxy_url
+        self._proxy_pool = proxy_pool
         self._login_pass = login_pass
         self._login_username = login_username
         self._dsn = db_credentials
@@ -66,51 +81,350 @@ class Parser:
         self._replies_per_user = replies_per_user
         self._followers_per_user = followers_per_user
         self._following_per_user = following_per_user
+        self._interactions_per_post = interactions_per_post
+        self._interaction_threshold = interaction_threshold
+        self._follower_session_budget = follower_session_budget
+        self._follower_sessions = follower_sessions
+        self._thread_posts = thread_posts
+        self._profiler = profiler
+        self._supervisor = supervisor or BrowserSupervisor()
+        # with a scheduler the number of browsers and tabs follows host
+        # resources, `browsers` and `db_max_connections` are ignored
+        self._scheduler = scheduler
+        if scheduler is not None:
+            self._db_pool_size = scheduler.db_connections
+        self._target_browsers = browsers
+        self._tabs_per_browser = 3
+        self._crawl_over = False
+        # users whose follower lists are streamed over several sessions, and
+        # the number of sessions each one had in this crawl
+        self._pending_harvests: set[str] = set()
+        self._harvest_sessions: Counter[str] = Counter()
+        self._browsers = browsers
+        self._health_check_interval = health_check_interval
+        self._follower_graph = follower_graph
+        # media of saved posts is downloaded in the background when given
+        self._media = media
         self._users_queue = deque()
         self._seen_usenames = set()
         self._iterations = 0
+        self._max_iterations = 0
+        self._active_workers = 0
+        self._queue_lock = asyncio.Lock()
 
-    async def create_browser(self):
-        self.browser = await uc.start(
-            browser_args=[f"--proxy-server={self._proxy}"],
+    async def create_browser(self, proxy: Proxy) -> uc.Browser:
+        return await uc.start(
+            browser_args=[f"--proxy-server={proxy.url}"],
         )
 
-    async def parsing_loop(self, initial_username: str, max_iterations=100):
-        await self.create_browser()
-        await self.sign_in()
+    async def parsing_loop(
+        self,
+        initial_username: str,
+        max_iterations=100,
+        watch_usernames: list[str] | None = None,
+    ):
+        """
+        Crawls users starting from `initial_username`. With `watch_usernames`
+        a separate browser watches these accounts for new posts while the
+        crawl is running.
+        """
+        await self._proxy_pool.check_all()
+        health_checks = asyncio.create_task(
+            self._proxy_pool.run_health_checks(self._health_check_interval)
+        )
+        watch = None
+        try:
+            async with open_sink(self._dsn, self._db_pool_size) as db:
+                db = self._start_media(db)
+                if watch_usernames:
+                    watch = asyncio.create_task(self._watch(db, watch_usernames))
+                self._users_queue.append(initial_username)
+                if self._follower_session_budget:
+                    for checkpoint in await db.get_unfinished_harvests():
+                        self._pending_harvests.add(checkpoint.username)
+                        self._users_queue.append(checkpoint.username)
+                self._max_iterations = max_iterations
+                await self._run_workers(db)
+                if watch is not None:
+                    watch.cancel()
+                    await asyncio.gather(watch, return_exceptions=True)
+                if self._media is not None:
+                    await self._media.close()
+                logging.info(f"Write stats: {db.write_stats.summary()}")
+        finally:
+            health_checks.cancel()
+            if self._follower_graph is not None:
+                self._follower_graph.merge()
+        logging.info(f"Proxy stats:\n{self._proxy_pool.summary()}")
+        logging.info(f"Browser recycles: {self._supervisor.recycled}")
+        if self._profiler is not None:
+            self._profiler.write()
+        logging.info("Parsing finished!")
 
-        async with Database(self._dsn, self._db_pool_size) as db:
-            self._users_queue.append(initial_username)
-            while self._iterations < max_iterations and self._users_queue:
-                uname = self._users_queue.pop()
-                user_parser = UserParser(self.browser, uname, db)
-                logging.info(f"Parsing user @{uname}")
+    async def watch_loop(self, usernames: list[str]):
+        """Only watches `usernames` for new posts, until cancelled."""
+        await self._proxy_pool.check_all()
+        health_checks = asyncio.create_task(
+            self._proxy_pool.run_health_checks(self._health_check_interval)
+        )
+        try:
+            async with open_sink(self._dsn, self._db_pool_size) as db:
                 try:
-                    await db.mark_user_parsing_now(uname)
-                    await user_parser.parse()
-                    await db.mark_user_parsed(uname)
-                except Exception:
-                    await db.mark_user_error(uname)
-                    logging.error(traceback.format_exc())
-                    logging.error(f"Failed to parse user @{uname}")
+                    await self._watch(self._start_media(db), usernames)
+                finally:
+                    if self._media is not None:
+                        await self._media.close()
+        finally:
+            health_checks.cancel()
+
+    def _start_media(self, db: Sink) -> Sink:
+        """Starts the media downloader, returns the sink that feeds it."""
+        if self._media is None:
+            return db
+        self._media.start(db)
+        return self._media.wrap(db)
+
+    async def _watch(self, db: Sink, usernames: list[str]):
+        proxy, browser = await self._start_session()
+        logging.info(f"Watching {len(usernames)} accounts via {proxy.url}")
+        try:
+            await Watcher(browser, usernames, db).run()
+        finally:
+            self._stop_session(proxy, browser)
+
+    async def _start_session(self, attempts: int = 5) -> tuple[Proxy, uc.Browser]:
+        """Acquires a healthy proxy and starts a signed in browser behind it."""
+        for _ in range(attempts):
+            proxy = await self._proxy_pool.acquire()
+            browser = None
+            try:
+                browser = await self.create_browser(proxy)
+                await self.sign_in(browser)
+                self._supervisor.register(browser)
+                return proxy, browser
+            except Exception:
+                logging.error(traceback.format_exc())
+                logging.error(f"Cannot start browser session via {proxy.url}")
+                self._proxy_pool.record_error(proxy)
+                self._proxy_pool.release(proxy)
+                if browser is not None:
+                    browser.stop()
+        raise RuntimeError(f"Cannot start browser session after {attempts} attempts")
+
+    async def _run_workers(self, db: Sink):
+        """
+        Runs `browsers` workers until the crawl is over. With a scheduler,
+        workers are started, or stopped after their current user, whenever
+        it changes its target. A failed worker is logged and started again,
+        later after every failure, so one bad proxy or browser does not stop
+        the crawl.
+        """
+        workers: dict[int, asyncio.Task] = {}
+        failures: Counter[int] = Counter()
+        timeout = None
+        if self._scheduler is not None:
+            self._scheduler.start()
+            self._target_browsers = self._scheduler.browsers
+            self._tabs_per_browser = self._scheduler.tabs
+            timeout = self._scheduler.interval
+        try:
+            while True:
+                if not self._crawl_over:
+                    for n in range(self._target_browsers):
+                        if n not in workers:
+                            delay = min(2 ** failures[n] - 1, 60)
+                            workers[n] = asyncio.create_task(self._worker(n, db, delay))
+                if not workers:
+                    break
+                await asyncio.wait(
+                    workers.values(),
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for n, task in list(workers.items()):
+                    if task.done():
+                        del workers[n]
+                        if not task.cancelled() and task.exception() is not None:
+                            failures[n] += 1
+                            logging.error(
+                                f"Worker {n} failed, restarting it",
+                                exc_info=task.exception(),
+                            )
+                if self._scheduler is not None:
+                    self._target_browsers, self._tabs_per_browser = (
+                        self._scheduler.update()
+                    )
+        finally:
+            for task in workers.values():
+                task.cancel()
+            await asyncio.gather(*workers.values(), return_exceptions=True)
+            if self._scheduler is not None:
+                self._scheduler.stop()
+
+    async def _worker(self, worker_id: int, db: Sink, delay: float = 0.0):
+        await asyncio.sleep(delay)
+        proxy, browser = await self._start_session()
+        logging.info(f"Worker {worker_id} assigned to proxy {proxy.url}")
+        try:
+            while True:
+                if worker_id >= self._target_browsers:
+                    logging.info(f"Worker {worker_id} stops: host resources are short")
+                    break
+                reason = await self._supervisor.recycle_reason(browser)
+                if reason is not None:
+                    logging.info(f"Worker {worker_id} recycles its browser: {reason}")
+                    proxy, browser = await self._restart_session(proxy, browser)
+
+                uname = await self._next_username(db)
+                if uname is None:
+                    self._crawl_over = True
+                    break
                 try:
-                    if not self._users_queue:
-                        for un in await db.get_bunch_of_usernames():
-                            if un not in self._seen_usenames:
-                                logging.info(f"adding user to queue @{un}")
-                                self._users_queue.append(un)
-                    else:
+                    ok = await self._parse_user(browser, uname, db)
+                finally:
+                    self._active_workers -= 1
+                self._supervisor.user_done(browser)
+
+                if ok:
+                    self._proxy_pool.record_success(proxy)
+                    continue
+                if not await self._supervisor.is_alive(browser):
+                    # the user failed because of the browser, not of the page
+                    logging.info(f"Worker {worker_id} lost its browser on @{uname}")
+                    self._requeue(uname)
+                    proxy, browser = await self._restart_session(proxy, browser)
+                    continue
+                self._proxy_pool.record_error(proxy)
+                if not proxy.healthy:
+                    # move this user and the worker itself to another proxy
+                    logging.info(f"Worker {worker_id} leaves drained {proxy.url}")
+                    self._requeue(uname)
+                    proxy, browser = await self._restart_session(proxy, browser)
+                    logging.info(f"Worker {worker_id} assigned to proxy {proxy.url}")
+        except Exception:
+            # checked again by the health checks before another worker gets it
+            self._proxy_pool.drain(proxy, f"worker {worker_id} failed")
+            raise
+        finally:
+            self._stop_session(proxy, browser)
+
+    async def _restart_session(
+        self, proxy: Proxy, browser: uc.Browser
+    ) -> tuple[Proxy, uc.Browser]:
+        """
+        Starts a new signed in session, then stops the old one. The old proxy
+        is released only afterwards, so a drained proxy is not picked again.
+        """
+        new_proxy, new_browser = await self._start_session()
+        self._stop_session(proxy, browser)
+        return new_proxy, new_browser
+
+    def _stop_session(self, proxy: Proxy, browser: uc.Browser):
+        self._supervisor.unregister(browser)
+        browser.stop()
+        self._proxy_pool.release(proxy)
+
+    def _requeue(self, uname: str):
+        """Puts an in-flight user back to be parsed by the next free worker."""
+        self._users_queue.append(uname)
+        self._seen_usenames.discard(uname)
+        self._iterations -= 1
+
+    async def _parse_user(self, browser: uc.Browser, uname: str, db: Sink) -> bool:
+        profile = self._profiler.for_user(uname) if self._profiler else None
+        user_parser = UserParser(
+            browser,
+            uname,
+            db,
+            max_interactions=self._interactions_per_post,
+            interaction_threshold=self._interaction_threshold,
+            follower_session_budget=self._follower_session_budget,
+            follower_sessions=self._follower_sessions,
+            max_thread_posts=self._thread_posts,
+            max_concurrent_tabs=self._tabs_per_browser,
+            follower_graph=self._follower_graph,
+            profile=profile,
+        )
+        logging.info(f"Parsing user @{uname}")
+        try:
+            await db.mark_user_parsing_now(uname)
+            ok = await user_parser.parse(
+                followers_only=uname in self._pending_harvests
+            )
+            # phases after the profile fail quietly when the browser dies,
+            # the worker then re-queues the user like a failed profile
+            ok = ok and await self._supervisor.is_alive(browser)
+            if ok:
+                await db.mark_user_parsed(uname)
+            else:
+                # left in the frontier for another attempt after a restart
+                await db.mark_user_error(uname)
+            self._pending_harvests.discard(uname)
+            if user_parser.harvest_pending:
+                self._harvest_sessions[uname] += 1
+                if self._harvest_sessions[uname] < self._follower_sessions:
+                    # continue the follower lists after every queued user
+                    self._pending_harvests.add(uname)
+                    self._seen_usenames.discard(uname)
+                    self._users_queue.appendleft(uname)
+                else:
+                    logging.info(f"@{uname}: follower lists are left for a later crawl")
+            return ok
+        except Exception:
+            await db.mark_user_error(uname)
+            logging.error(traceback.format_exc())
+            logging.error(f"Failed to parse user @{uname}")
+            return False
+        finally:
+            if profile is not None:
+                profile.finish()
+
+    async def _next_username(self, db: Sink) -> str | None:
+        """
+        Pops the next user to parse. Refills the queue from the database when
+        it is empty; waits while other workers may still discover new users.
+        Returns None when the crawl is over.
+        """
+        while True:
+            async with self._queue_lock:
+                if self._iterations >= self._max_iterations:
+                    return None
+                while self._users_queue:
+                    uname = self._users_queue.pop()
+                    if uname not in self._seen_usenames:
+                        self._seen_usenames.add(uname)
+                        self._iterations += 1
+                        self._active_workers += 1
                         logging.info(f"queue length: {len(self._users_queue)}")
+                        return uname
+                try:
+                    for un in await self._fetch_frontier(db):
+                        if un not in self._seen_usenames:
+                            logging.info(f"adding user to queue @{un}")
+                            self._users_queue.append(un)
                 except Exception:
                     logging.error(traceback.format_exc())
                     logging.info("Cannot add new users to queue")
-                self._seen_usenames.add(uname)
-                self._iterations += 1
-        logging.info("Parsing finished!")
+                if self._users_queue:
+                    continue
+                if not self._active_workers:
+                    return None
+            await asyncio.sleep(1)
+
+    async def _fetch_frontier(self, db: Sink) -> list[str]:
+        """
+        Next users to parse. With a follower graph the candidates are ordered
+        by PageRank so the most central accounts are popped from the queue first.
+        """
+        if self._follower_graph is None:
+            return await db.get_bunch_of_usernames()
+        users = await db.get_bunch_of_users(limit=50)
+        scores = self._follower_graph.scores([user_id for user_id, _ in users])
+        return [users[i][1] for i in scores.argsort(kind="stable")]
 
-    async def sign_in(self, timeouts=1):
+    async def sign_in(self, browser: uc.Browser, timeouts=1):
         """Login in to the truthsocial"""
-        page = await self.browser.get(BASE_URL)
+        page = await browser.get(BASE_URL)
 
         await page.wait_for('div[data-testid="banner"]')
         cookies_accept = await page.find("Accept", best_match=True)
@@ -143,39 +457,97 @@ class Parser:
 class UserParser:
     browser: uc.Browser
     database: None
-    _database: Database
+    _database: Sink
 
     def __init__(
         self,
         browser: uc.Browser,
         username: str,
-        database: Database,
+        database: Sink,
         max_posts: int = 35,
         max_replies: int = 35,
         max_followers=50,
         max_following=50,
+        max_interactions: int = 0,
+        interaction_threshold: int = 100,
+        max_harvested_posts: int = 3,
+        follower_session_budget: int = 0,
+        follower_sessions: int = 10,
+        max_thread_posts: int = 0,
+        max_threads: int = 5,
+        max_concurrent_tabs: int = 3,
+        follower_graph: FollowerGraph | None = None,
+        profile: UserProfile | None = None,
     ):
         self.username = username
         self.browser = browser
         self._database = database
+        self.profile = profile
+        if profile is not None:
+            # time every awaited browser and sink call of this user
+            self.browser = profile.wrap(browser, "cdp")
+            self._database = profile.wrap(database, "db")
         self.max_posts = max_posts
         self.max_replies = max_replies
         self.max_followers = max_followers
         self.max_following = max_following
+        # reposters/likers are harvested for at most `max_harvested_posts` posts
+        # with at least `interaction_threshold` likes or reposts, 0 disables it
+        self.max_interactions = max_interactions
+        self.interaction_threshold = interaction_threshold
+        self.max_harvested_posts = max_harvested_posts
+        self._harvest: list[tuple[int, int, str]] = []
+        # with a budget follower lists are streamed without the max_followers
+        # cap, in at most `follower_sessions` sessions, `harvest_pending` is
+        # set when a list must be continued later
+        self.follower_session_budget = follower_session_budget
+        self.follower_sessions = follower_sessions
+        self.harvest_pending = False
+        # conversations of the first `max_threads` replies are crawled from
+        # thread pages, up to `max_thread_posts` pages each, 0 disables it
+        self.max_thread_posts = max_thread_posts
+        self.max_threads = max_threads
+        self.max_concurrent_tabs = max_concurrent_tabs
+        self._replies: list[tuple[str, int]] = []
+        self.follower_graph = follower_graph
         self.scroll_retries = 4
 
-    async def parse(self):
-        async def handle_task(task, username, action):
+    async def parse(self, followers_only: bool = False) -> bool:
+        """
+        Runs every parsing stage for the user, or only the follower lists
+        when continuing a streamed harvest.
+        Returns False if the profile page could not be parsed at all, which
+        usually means that the page did not load through the proxy.
+        """
+        async def handle_task(task, username, action) -> bool:
             try:
-                await task()
+                with span(self.profile, action):
+                    await task()
+                return True
             except (TimeoutError, ValueError) as e:
                 logging.error(f"Failed to {action} for @{username}: {e}")
+                return False
 
-        await handle_task(self.get_user_info, self.username, "parse profile info")
+        if followers_only:
+            for task, action in (
+                (self.get_users_followers, "obtain followers"),
+                (self.get_users_following, "obtain following"),
+            ):
+                await handle_task(task, self.username, action)
+            return True
+
+        ok = await handle_task(self.get_user_info, self.username, "parse profile info")
         await handle_task(self.download_main_posts, self.username, "download posts")
         await handle_task(self.download_replies, self.username, "download replies")
+        if self.max_thread_posts:
+            await handle_task(self.crawl_threads, self.username, "crawl threads")
         await handle_task(self.get_users_followers, self.username, "obtain followers")
         await handle_task(self.get_users_following, self.username, "obtain following")
+        if self.max_interactions:
+            await handle_task(
+                self.harvest_interactions, self.username, "harvest interactions"
+            )
+        return ok
 
     async def get_user_info(self):
         url = f"{BASE_URL}/@{self.username}"
@@ -187,7 +559,8 @@ class UserParser:
         finally:
             await tab.close()
 
-        user = User(html_data=html_data)
+        with span(self.profile, "parse"):
+            user = User(html_data=html_data)
         await self._database.save_user(user)
 
     async def download_main_posts(self):
@@ -212,9 +585,9 @@ class UserParser:
         finally:
             await tab.close()
 
-        for p in posts:
-            logging.info(f"saving post {p}")
-            await self._database.save_post(p)
+        logging.info(f"saving {len(posts)} posts")
+        await self._database.save_posts(posts)
+        self._select_for_harvest(posts)
 
     async def download_replies(self):
         url = f"{BASE_URL}/@{self.username}/with_replies"
@@ -231,11 +604,30 @@ class UserParser:
         finally:
             await tab.close()
 
-        for p in posts:
-            logging.info(f"saving reply {p}")
-            await self._database.save_post(p)
+        logging.info(f"saving {len(posts)} replies")
+        await self._database.save_posts(posts)
+        self._replies = [
+            (posts.owner[i], posts.post_id[i])
+            for i in range(len(posts))
+            if posts.reply_to[i] and not posts.is_repost[i]
+        ][:self.max_threads]
+
+    async def crawl_threads(self):
+        """Links the downloaded replies to their conversations."""
+        crawler = ThreadCrawler(
+            self.browser,
+            self._database,
+            max_posts=self.max_thread_posts,
+            max_concurrent_tabs=self.max_concurrent_tabs,
+        )
+        for owner, post_id in self._replies:
+            opened = await crawler.crawl(owner, post_id)
+            logging.info(f"crawled {opened} thread pages below post {post_id}")
 
     async def get_users_followers(self):
+        if self.follower_session_budget:
+            await self._stream_followers("followers")
+            return
         url = f"{BASE_URL}/@{self.username}/followers"
         tab = await self.browser.get(url, new_tab=True)
 
@@ -248,11 +640,13 @@ class UserParser:
         finally:
             await tab.close()
 
-        for follower in followers:
-            logging.info(f"saving follower: {follower}")
-            await self._database.save_follower(follower)
+        logging.info(f"saving {len(followers)} followers")
+        await self._save_followers(followers)
 
     async def get_users_following(self):
+        if self.follower_session_budget:
+            await self._stream_followers("following")
+            return
         url = f"{BASE_URL}/@{self.username}/following"
         tab = await self.browser.get(url, new_tab=True)
 
@@ -266,9 +660,67 @@ class UserParser:
         finally:
             await tab.close()
 
-        for follower in followers:
-            logging.info(f"saving following: {follower}")
-            await self._database.save_follower(follower)
+        logging.info(f"saving {len(followers)} following")
+        await self._save_followers(followers)
+
+    async def _stream_followers(self, direction: str):
+        harvester = FollowerHarvester(
+            self._database,
+            self.username,
+            direction,
+            save_followers=self._save_followers,
+            session_budget=self.follower_session_budget,
+            max_sessions=self.follower_sessions,
+            stay_tolerance=self.scroll_retries,
+        )
+        checkpoint = await harvester.run(self.browser)
+        if not checkpoint.finished:
+            self.harvest_pending = True
+
+    def _select_for_harvest(self, posts: PostBatch):
+        """Remembers the most engaging posts of the user for `harvest_interactions`."""
+        candidates = [
+            (max(posts.likes[i], posts.reposts[i]), posts.post_id[i], posts.owner[i])
+            for i in range(len(posts))
+            if not posts.is_repost[i]
+            and max(posts.likes[i], posts.reposts[i]) >= self.interaction_threshold
+        ]
+        self._harvest = sorted(candidates, reverse=True)[:self.max_harvested_posts]
+
+    async def harvest_interactions(self):
+        """Scrolls "ReTruthed by" and "Liked by" lists of high-engagement posts."""
+        interactions = InteractionBatch()
+        for _, post_id, owner in self._harvest:
+            url = f"{BASE_URL}/@{owner}/posts/{post_id}"
+            tab = await self.browser.get(url, new_tab=True)
+            try:
+                await tab.wait_for(POST_SELECTOR)
+                for interaction, button_text in INTERACTION_BUTTONS.items():
+                    button = await tab.find(button_text, best_match=True)
+                    if button is None:
+                        continue
+                    await button.click()
+                    accounts = await self.scroll_followers(
+                        tab,
+                        max_followers=self.max_interactions,
+                        stay_tolerance=self.scroll_retries,
+                        selector=INTERACTION_ACCOUNT_SELECTOR,
+                        container=INTERACTION_MODAL_SELECTOR,
+                    )
+                    interactions.extend(post_id, accounts, interaction)
+                    await tab.reload()
+                    await tab.wait_for(POST_SELECTOR)
+            finally:
+                await tab.close()
+
+        logging.info(f"saving {len(interactions)} interactions")
+        await self._database.save_interactions(interactions)
+
+    async def _save_followers(self, followers: FollowerBatch):
+        edges = await self._database.save_followers(followers)
+        if self.follower_graph is not None and edges:
+            user_ids, follower_ids = zip(*edges)
+            self.follower_graph.add_edges(user_ids, follower_ids)
 
     async def scroll_posts(
         self,
@@ -278,7 +730,7 @@ class UserParser:
         max_posts: int,
         stay_tolerance: int,
     ):
-        posts = OrderedSet()  # type: ignore
+        posts = PostBatch()
         height = await tab.evaluate("document.body.scrollHeight")
         same_height = 0
         while True:
@@ -293,7 +745,8 @@ class UserParser:
 
             for p in found_posts:
                 html = await p.get_html()
-                posts.add(Post(html_data=html))
+                with span(self.profile, "parse"):
+                    posts.append(Post(html_data=html))
 
             if len(posts) >= max_posts:
                 logging.info("Max posts limit reached")
@@ -314,26 +767,43 @@ class UserParser:
         max_followers: int,
         stay_tolerance: int,
         following_swap: bool = False,
+        selector: str = FOLLOWER_SELECTOR,
+        container: str | None = None,
     ):
-        await tab.wait_for(FOLLOWER_SELECTOR)
+        """
+        Collects accounts matching `selector` while scrolling the page,
+        or the `container` element (e.g. a modal) when it is given.
+        """
+        await tab.wait_for(selector)
 
-        followers = OrderedSet()  # type: ignore
-        height = await tab.evaluate("document.body.scrollHeight")
+        scrolled = f"document.querySelector('{container}')" if container else None
+        height_js = (
+            f"{scrolled}.scrollHeight" if scrolled else "document.body.scrollHeight"
+        )
+        followers = FollowerBatch()
+        height = await tab.evaluate(height_js)
         same_height = 0
         while True:
-            follower_divs = await tab.find_all(FOLLOWER_SELECTOR)
+            follower_divs = await tab.find_all(selector)
             logging.info(f"Found {len(follower_divs)} followers on a page")
 
             for fd in follower_divs:
                 html = await fd.get_html()
-                follower = Follower(who_to_follow=self.username, html_data=html)
+                with span(self.profile, "parse"):
+                    follower = Follower(who_to_follow=self.username, html_data=html)
                 if following_swap:
                     # swap direction in case 'followed by' people
                     follower.swap_direction()
-                followers.add(follower)
+                followers.append(follower)
 
-            await tab.scroll_down(randint(SCROLL_MIN, SCROLL_MAX))
-            new_height = await tab.evaluate("document.body.scrollHeight")
+            if scrolled:
+                # scroll_down takes % of the viewport, scrollBy takes pixels
+                await tab.evaluate(
+                    f"{scrolled}.scrollBy(0, {randint(SCROLL_MIN, SCROLL_MAX) * 10})"
+                )
+            else:
+                await tab.scroll_down(randint(SCROLL_MIN, SCROLL_MAX))
+            new_height = await tab.evaluate(height_js)
 
             logging.info("waiting for followers to load")
             await tab.wait(randint(1, 3))
@@ -357,17 +827,8 @@ class UserParser:
 
 
 if __name__ == "__main__":
-    parser = Parser(
-        proxy_url=PROXY,
-        login_username=USERNAME,
-        login_pass=PASSWORD,
-        db_credentials=DSN,
-        db_max_connections=15,
-        posts_per_user=30,
-        replies_per_user=30,
-        followers_per_user=50,
-        following_per_user=50,
-    )
-    uc.loop().run_until_complete(
-        parser.parsing_loop(INTIAL_USERNAME, max_iterations=500)
-    )
+    import sys
+
+    from cli import main
+
+    sys.exit(main(["crawl", *sys.argv[1:]]))
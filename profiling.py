@@ -0,0 +1,153 @@
+import inspect
+import logging
+import os
+import random
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from time import perf_counter
+
+import nodriver as uc
+
+# spans open in the current task, innermost last: [name, start, children time]
+_stack: ContextVar[tuple[list, ...]] = ContextVar("profiling_stack", default=())
+
+
+class CrawlProfiler:
+    """
+    Opt-in span timings of user crawls.
+
+    A `sample_rate` share of users is profiled. For them the crawl phases,
+    every awaited call on the browser, tabs and elements (`cdp.*`), sink
+    calls (`db.*`) and HTML parsing (`parse`) are timed with `perf_counter`.
+    Self times are aggregated per stack and written in the collapsed stack
+    format (`<user>.folded`, one `frame;frame;frame microseconds` per line)
+    read by flamegraph.pl and speedscope, next to a per-span latency table.
+    Unsampled users only cost a random draw.
+    """
+
+    def __init__(
+        self, output_dir: str, sample_rate: float = 1.0, window: int = 10_000
+    ):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.stacks = Counter()
+        self.durations: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+        self.users = 0
+
+    def for_user(self, username: str) -> "UserProfile | None":
+        if random.random() >= self.sample_rate:
+            return None
+        self.users += 1
+        return UserProfile(self, username)
+
+    def _quantile(self, values, q: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def table(self) -> str:
+        """Latency breakdown per span name, slowest total first."""
+        rows = sorted(
+            self.durations.items(), key=lambda item: sum(item[1]), reverse=True
+        )
+        lines = [
+            f"{'span':<32} {'count':>7} {'total s':>9} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"
+        ]
+        for name, values in rows:
+            lines.append(
+                f"{name:<32} {len(values):>7} {sum(values):>9.2f} "
+                f"{self._quantile(values, 0.5) * 1000:>9.1f} "
+                f"{self._quantile(values, 0.95) * 1000:>9.1f} "
+                f"{max(values) * 1000:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def write(self):
+        """Writes the aggregated flame graph and the latency table."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        _write_folded(os.path.join(self.output_dir, "crawl.folded"), self.stacks)
+        with open(os.path.join(self.output_dir, "phases.txt"), "w") as f:
+            f.write(self.table() + "\n")
+        logging.info(f"Profiled {self.users} users:\n{self.table()}")
+
+
+class UserProfile:
+    """Spans of one user crawl, see `CrawlProfiler`."""
+
+    def __init__(self, profiler: CrawlProfiler, username: str):
+        self.profiler = profiler
+        self.username = username
+        self.stacks = Counter()
+
+    @contextmanager
+    def span(self, name: str):
+        stack = _stack.get()
+        frame = [name, perf_counter(), 0.0]
+        token = _stack.set(stack + (frame,))
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - frame[1]
+            _stack.reset(token)
+            if stack:
+                stack[-1][2] += elapsed
+            # concurrent children (gathered tasks) may overlap their parent
+            self_time = max(elapsed - frame[2], 0.0)
+            path = ";".join([self.username, *(f[0] for f in stack), name])
+            self.stacks[path] += int(self_time * 1_000_000)
+            self.profiler.durations[name].append(elapsed)
+
+    def wrap(self, target, prefix: str = "cdp"):
+        """Proxy of `target` whose coroutine methods are timed as spans."""
+        return _Profiled(target, self, prefix)
+
+    def _wrap_result(self, result, prefix: str):
+        if isinstance(result, (uc.Tab, uc.Element)):
+            return self.wrap(result, prefix)
+        if isinstance(result, list) and result and isinstance(result[0], uc.Element):
+            return [self.wrap(r, prefix) for r in result]
+        return result
+
+    def finish(self):
+        """Writes the flame graph of this user and merges it into the totals."""
+        os.makedirs(self.profiler.output_dir, exist_ok=True)
+        path = os.path.join(self.profiler.output_dir, f"{self.username}.folded")
+        _write_folded(path, self.stacks)
+        self.profiler.stacks.update(self.stacks)
+
+
+class _Profiled:
+    __slots__ = ("_target", "_profile", "_prefix")
+
+    def __init__(self, target, profile: UserProfile, prefix: str):
+        self._target = target
+        self._profile = profile
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+        profile, prefix = self._profile, self._prefix
+
+        async def timed(*args, **kwargs):
+            with profile.span(f"{prefix}.{name}"):
+                result = await attr(*args, **kwargs)
+            return profile._wrap_result(result, prefix)
+
+        return timed
+
+
+def span(profile: UserProfile | None, name: str):
+    """`profile.span(name)`, or a no-op when the user is not profiled."""
+    return profile.span(name) if profile is not None else nullcontext()
+
+
+def _write_folded(path: str, stacks: Counter):
+    with open(path, "w") as f:
+        for stack, micros in sorted(stacks.items()):
+            if micros:
+                f.write(f"{stack} {micros}\n")
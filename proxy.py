@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from time import perf_counter
+from urllib.parse import urlsplit
+
+DEFAULT_PORTS = {"socks5": 1080, "http": 80, "https": 443}
+
+SOCKS5_GREETING = b"\x05\x01\x00"  # version 5, one method: "no authentication"
+SOCKS5_ACCEPTED = b"\x05\x00"
+
+
+class Proxy:
+    url: str
+    scheme: str
+    host: str
+    port: int
+    healthy: bool
+    latency: float | None
+    requests: int
+    errors: int
+    consecutive_errors: int
+    assigned: int
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        if not parts.hostname:
+            raise ValueError(f"Invalid proxy url: {url}")
+        self.url = url
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname
+        self.port = parts.port or DEFAULT_PORTS.get(self.scheme, 1080)
+        self.healthy = True
+        self.latency = None
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.assigned = 0
+
+    def record_latency(self, seconds: float, smoothing: float = 0.3):
+        """Exponentially weighted moving average of health check latency."""
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency = smoothing * seconds + (1 - smoothing) * self.latency
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    def __repr__(self):
+        latency = f"{self.latency * 1000:.1f}ms" if self.latency is not None else "n/a"
+        return (
+            f"Proxy(url={self.url}, healthy={self.healthy}, latency={latency}, "
+            f"errors={self.errors}/{self.requests}, assigned={self.assigned})"
+        )
+
+
+class ProxyPool:
+    """
+    A set of egress proxies shared by the crawler workers.
+
+    Each worker (browser) acquires one proxy and keeps it until the proxy is
+    drained. A proxy is drained when it fails a health check or reports
+    `max_consecutive_errors` failed users in a row; workers holding it are
+    expected to release it and acquire another one. Drained proxies return
+    to the pool as soon as a health check succeeds again.
+    """
+
+    proxies: list[Proxy]
+    _changed: asyncio.Condition
+
+    def __init__(
+        self,
+        urls: list[str],
+        max_consecutive_errors: int = 3,
+        check_timeout: float = 5.0,
+    ):
+        if not urls:
+            raise ValueError("At least one proxy url is required")
+        self.proxies = [Proxy(url) for url in urls]
+        self.max_consecutive_errors = max_consecutive_errors
+        self.check_timeout = check_timeout
+        self._changed = asyncio.Condition()
+
+    @classmethod
+    def from_string(cls, urls: str, **kwargs) -> "ProxyPool":
+        """Build a pool from a comma separated list of proxy urls."""
+        return cls([u.strip() for u in urls.split(",") if u.strip()], **kwargs)
+
+    @property
+    def healthy(self) -> list[Proxy]:
+        return [p for p in self.proxies if p.healthy]
+
+    async def acquire(self) -> Proxy:
+        """
+        Assigns the least loaded healthy proxy to a worker.
+        Waits until one becomes healthy if the whole pool is drained.
+        """
+        async with self._changed:
+            await self._changed.wait_for(lambda: bool(self.healthy))
+            proxy = min(
+                self.healthy,
+                key=lambda p: (p.assigned, p.error_rate, p.latency or 0.0),
+            )
+            proxy.assigned += 1
+            return proxy
+
+    def release(self, proxy: Proxy):
+        proxy.assigned = max(proxy.assigned - 1, 0)
+
+    def record_success(self, proxy: Proxy):
+        proxy.requests += 1
+        proxy.consecutive_errors = 0
+
+    def record_error(self, proxy: Proxy):
+        proxy.requests += 1
+        proxy.errors += 1
+        proxy.consecutive_errors += 1
+        if proxy.consecutive_errors >= self.max_consecutive_errors:
+            self.drain(proxy, "too many errors")
+
+    def drain(self, proxy: Proxy, reason: str):
+        """Takes `proxy` out of rotation until a health check succeeds again."""
+        if proxy.healthy:
+            logging.warning(f"Draining proxy {proxy.url}: {reason}")
+            proxy.healthy = False
+
+    async def check(self, proxy: Proxy) -> bool:
+        """
+        Opens a connection to the proxy (and performs SOCKS5 greeting for
+        socks proxies) to make sure it is alive. Updates proxy health.
+        """
+        t0 = perf_counter()
+        try:
+            await asyncio.wait_for(self._probe(proxy), self.check_timeout)
+        except (
+            OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError
+        ) as e:
+            if proxy.healthy:
+                logging.warning(f"Proxy {proxy.url} failed health check: {e!r}")
+            proxy.healthy = False
+            return False
+
+        proxy.record_latency(perf_counter() - t0)
+        if not proxy.healthy:
+            logging.info(f"Proxy {proxy.url} is healthy again")
+            proxy.consecutive_errors = 0
+            proxy.healthy = True
+            async with self._changed:
+                self._changed.notify_all()
+        return True
+
+    async def check_all(self) -> int:
+        """Checks every proxy concurrently. Returns number of healthy ones."""
+        results = await asyncio.gather(*(self.check(p) for p in self.proxies))
+        return sum(results)
+
+    async def run_health_checks(self, interval: float = 30.0):
+        """Background task: periodically re-check every proxy."""
+        while True:
+            await self.check_all()
+            await asyncio.sleep(interval)
+
+    async def _probe(self, proxy: Proxy):
+        reader, writer = await asyncio.open_connection(proxy.host, proxy.port)
+        try:
+            if proxy.scheme.startswith("socks5"):
+                writer.write(SOCKS5_GREETING)
+                await writer.drain()
+                reply = await reader.readexactly(2)
+                if reply != SOCKS5_ACCEPTED:
+                    raise ValueError(f"Unexpected SOCKS5 reply {reply!r}")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    def summary(self) -> str:
+        return "\n".join(repr(p) for p in self.proxies)
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import os
+from time import monotonic
+
+from supervisor import PROC, BrowserSupervisor
+
+
+class HostSample:
+    """Host resource usage since the previous sample."""
+
+    __slots__ = ("cpu", "memory", "swapped_pages", "loop_lag")
+
+    def __init__(
+        self,
+        cpu: float = 0.0,
+        memory: float = 0.0,
+        swapped_pages: int = 0,
+        loop_lag: float = 0.0,
+    ):
+        # busy share of all CPUs and used share of the memory (page cache
+        # counts as free), 0..1
+        self.cpu = cpu
+        self.memory = memory
+        self.swapped_pages = swapped_pages
+        # worst delay of the event loop, in seconds
+        self.loop_lag = loop_lag
+
+    def __repr__(self):
+        return (
+            f"cpu={self.cpu:.0%} memory={self.memory:.0%} "
+            f"swapped_pages={self.swapped_pages} loop_lag={self.loop_lag * 1000:.0f}ms"
+        )
+
+
+def read_cpu_times() -> tuple[int, int]:
+    """(busy, total) clock ticks of all CPUs since boot. Linux only."""
+    with open(f"{PROC}/stat", "r") as f:
+        # cpu user nice system idle iowait irq softirq steal guest guest_nice
+        ticks = [int(v) for v in f.readline().split()[1:9]]
+    idle = ticks[3] + ticks[4]
+    return sum(ticks) - idle, sum(ticks)
+
+
+def read_meminfo() -> dict[str, int]:
+    """/proc/meminfo values, in kB."""
+    info = {}
+    with open(f"{PROC}/meminfo", "r") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            info[key] = int(value.split()[0])
+    return info
+
+
+def read_swapped_pages() -> int:
+    """Pages swapped out since boot."""
+    with open(f"{PROC}/vmstat", "r") as f:
+        for line in f:
+            if line.startswith("pswpout "):
+                return int(line.split()[1])
+    return 0
+
+
+class LoopLagProbe:
+    """Measures how late the event loop wakes up a sleeping task."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            started = monotonic()
+            await asyncio.sleep(self.interval)
+            lag = monotonic() - started - self.interval
+            self.max_lag = max(self.max_lag, lag)
+
+    def take(self) -> float:
+        """Worst lag since the previous call."""
+        lag, self.max_lag = self.max_lag, 0.0
+        return lag
+
+
+class ResourceScheduler:
+    """
+    Chooses how many browsers, tabs per browser and DB connections a crawl
+    runs on this host.
+
+    Every `interval` seconds host CPU and memory usage, swap-outs and event
+    loop lag are compared to the budget. Below it, one browser is added if
+    the measured cost of a browser (see `BrowserSupervisor.sample`) fits in
+    the headroom, or one tab per browser once `max_browsers` run. Above it,
+    or as soon as the host swaps, one tab per browser is shed, then one
+    browser. `max_browsers` defaults to what the host can hold with the
+    `browser_mb` and `browser_cpu` estimates, the DB pool is sized for it.
+    """
+
+    def __init__(
+        self,
+        supervisor: BrowserSupervisor,
+        cpu_budget: float = 0.8,
+        memory_budget: float = 0.85,
+        max_loop_lag: float = 0.5,
+        min_browsers: int = 1,
+        max_browsers: int | None = None,
+        max_tabs: int = 4,
+        browser_mb: float = 750.0,
+        browser_cpu: float = 1.0,
+        interval: float = 30.0,
+    ):
+        self.supervisor = supervisor
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget
+        self.max_loop_lag = max_loop_lag
+        self.min_browsers = min_browsers
+        self.max_tabs = max_tabs
+        self.browser_mb = browser_mb
+        self.browser_cpu = browser_cpu
+        self.interval = interval
+        self._cpus = os.cpu_count() or 1
+        self._memory_mb = read_meminfo()["MemTotal"] / 1024
+        if max_browsers is None:
+            capacity = min(
+                self._cpus * cpu_budget / browser_cpu,
+                self._memory_mb * memory_budget / browser_mb,
+            )
+            max_browsers = int(capacity)
+        self.max_browsers = max(max_browsers, min_browsers)
+        self.browsers = min_browsers
+        self.tabs = 1
+        self._lag = LoopLagProbe()
+        self._cpu_times = read_cpu_times()
+        self._swapped_pages = read_swapped_pages()
+
+    @property
+    def db_connections(self) -> int:
+        """One connection per browser at full scale, plus watcher and frontier."""
+        return self.max_browsers + 2
+
+    def start(self):
+        self._lag.start()
+
+    def stop(self):
+        self._lag.stop()
+
+    def sample(self) -> HostSample:
+        busy, total = read_cpu_times()
+        last_busy, last_total = self._cpu_times
+        self._cpu_times = busy, total
+        swapped = read_swapped_pages()
+        swapped, self._swapped_pages = swapped - self._swapped_pages, swapped
+        meminfo = read_meminfo()
+        return HostSample(
+            cpu=(busy - last_busy) / max(total - last_total, 1),
+            memory=1 - meminfo["MemAvailable"] / meminfo["MemTotal"],
+            swapped_pages=swapped,
+            loop_lag=self._lag.take(),
+        )
+
+    def _costs(self) -> tuple[float, float, float, float]:
+        """
+        Average (MB, CPU cores) of a browser and of one of its processes,
+        which approximates a tab. Estimates until browsers were sampled.
+        """
+        costs = self.supervisor.costs()
+        if not costs:
+            return (
+                self.browser_mb,
+                self.browser_cpu,
+                self.browser_mb / 4,
+                self.browser_cpu / 4,
+            )
+        browser_mb = sum(s.rss_mb for s, _ in costs) / len(costs)
+        browser_cpu = sum(cpu for _, cpu in costs) / len(costs)
+        processes = sum(s.processes for s, _ in costs) / len(costs)
+        return (
+            browser_mb,
+            browser_cpu,
+            browser_mb / max(processes, 1),
+            browser_cpu / max(processes, 1),
+        )
+
+    def decide(self, host: HostSample) -> tuple[int, int]:
+        """Updates and returns the (browsers, tabs per browser) target."""
+        overloaded = (
+            host.swapped_pages > 0
+            or host.cpu > self.cpu_budget
+            or host.memory > self.memory_budget
+            or host.loop_lag > self.max_loop_lag
+        )
+        if overloaded:
+            if self.tabs > 1:
+                self.tabs -= 1
+            elif self.browsers > self.min_browsers:
+                self.browsers -= 1
+            return self.browsers, self.tabs
+
+        browser_mb, browser_cpu, tab_mb, tab_cpu = self._costs()
+        memory_room = (self.memory_budget - host.memory) * self._memory_mb
+        cpu_room = (self.cpu_budget - host.cpu) * self._cpus
+        if self.browsers < self.max_browsers:
+            if memory_room >= browser_mb and cpu_room >= browser_cpu:
+                self.browsers += 1
+        elif self.tabs < self.max_tabs:
+            # a tab more in every browser
+            if (
+                memory_room >= tab_mb * self.browsers
+                and cpu_room >= tab_cpu * self.browsers
+            ):
+                self.tabs += 1
+        return self.browsers, self.tabs
+
+    def update(self) -> tuple[int, int]:
+        """Samples the host and returns the new (browsers, tabs) target."""
+        host = self.sample()
+        target = self.browsers, self.tabs
+        browsers, tabs = self.decide(host)
+        if (browsers, tabs) != target:
+            logging.info(f"Scheduler: {host}, now {browsers} browsers x {tabs} tabs")
+        return browsers, tabs
@@ -0,0 +1,507 @@
+"""
+Hash sharding of the PostgreSQL sink over several databases, so that write
+throughput grows with the number of database servers:
+
+    async with ShardedDatabase(["postgresql://a/ts", "postgresql://b/ts"]) as db:
+        await db.save_posts(batch)
+
+Rows live on the shard of the user they belong to, `jump_hash(user_id)`:
+posts (with their interactions, entities, media and history) on the shard
+of their owner, follower edges on the shard of the followed user, profiles
+on the shard of the user. Any shard may reference any user, so user ids
+must mean the same everywhere: the first database is also the directory
+which allocates them (see `Database.allocate_user_ids`), and shards insert
+every user they write with the directory's id. The directory also keeps
+what is global to the crawl: the parser status of every user, follower
+harvest checkpoints and downloaded media files.
+
+Reads which are not about one user query every shard and merge the
+results: pages by their sort key, counts by summing them, near-duplicates
+by comparing the signatures of every shard at once. Each shard keeps its
+own change feed, offsets of one mean nothing on another, so consumers
+follow the feed of every shard (see api.py). After adding shards,
+`rebalance` moves the rows of the users whose shard changed. Jump
+consistent hashing moves only the rows of 1/n of the users when the n-th
+shard is added.
+"""
+import asyncio
+import heapq
+import logging
+from collections import Counter, OrderedDict, defaultdict
+from datetime import date, datetime
+from itertools import islice
+
+import asyncpg
+
+import dedup
+from database import Database
+from entities import Follower, FollowerBatch, InteractionBatch, Post, PostBatch, User
+from sinks import HarvestCheckpoint, MediaFile, Sink, StagedChunk
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping, Veach 2014): the bucket of `key` among
+    `buckets`. Growing to n + 1 buckets moves 1/(n + 1) of the keys, all
+    of them to the new bucket.
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * (1 << 31) / ((key >> 33) + 1))
+    return bucket
+
+
+def split_chunk(
+    chunk: StagedChunk,
+    user_shards: dict[str, int],
+    post_shards: dict[int, int],
+    shards: int,
+) -> list[StagedChunk]:
+    """
+    Splits the rows of a staged chunk by shard: users, posts, follower
+    edges and avatars by `user_shards` (username -> shard), rows of posts
+    by `post_shards` (post_id -> shard, rows of unknown posts are dropped).
+    Parser statuses and media files go to the directory, shard 0.
+    """
+    parts = [StagedChunk() for _ in range(shards)]
+    for username, row in chunk.users.items():
+        parts[user_shards[username]].users[username] = row[:8] + [None]
+        if row[8] is not None:
+            parts[0].set_status(username, row[8])
+    for post in chunk.posts:
+        parts[user_shards[post[2]]].posts.append(post)
+    for name in ("interactions", "mentions", "hashtags", "links", "media"):
+        for row in getattr(chunk, name):
+            if row[0] in post_shards:
+                getattr(parts[post_shards[row[0]]], name).append(row)
+    for edge in chunk.followers:
+        parts[user_shards[edge[0]]].followers.append(edge)
+    for avatar in chunk.avatars:
+        parts[user_shards[avatar[0]]].avatars.append(avatar)
+    parts[0].media_files = list(chunk.media_files)
+    return parts
+
+
+class ShardedDatabase(Sink):
+    """
+    Sink writing to the `Database` shards of `dsns` by the hash of user
+    ids. Writes of a batch to different shards run concurrently.
+    """
+
+    def __init__(
+        self,
+        dsns: list[str],
+        max_pool_size: int = 10,
+        write_cache_size: int = 100_000,
+        read_only: bool = False,
+    ):
+        super().__init__()
+        self.directory = Database(dsns[0], max_pool_size, write_cache_size, read_only)
+        self.shards = [self.directory] + [
+            Database(
+                dsn,
+                max_pool_size,
+                write_cache_size,
+                read_only,
+                directory=self.directory,
+            )
+            for dsn in dsns[1:]
+        ]
+        for shard in self.shards:
+            shard.write_stats = self.write_stats
+        self._write_cache_size = write_cache_size
+        # post_id -> shard index of recently written posts, for interactions
+        self._post_shards: OrderedDict[int, int] = OrderedDict()
+
+    async def connect(self):
+        await asyncio.gather(*(shard.connect() for shard in self.shards))
+
+    async def close(self):
+        await asyncio.gather(*(shard.close() for shard in self.shards))
+
+    def shard_index(self, user_id: int) -> int:
+        return jump_hash(user_id, len(self.shards))
+
+    def shard_of(self, user_id: int) -> Database:
+        return self.shards[self.shard_index(user_id)]
+
+    async def _user_shards(self, usernames) -> dict[str, int]:
+        """username -> shard index, allocating ids of new users."""
+        ids = await self.directory.allocate_user_ids(usernames)
+        return {username: self.shard_index(i) for username, i in ids.items()}
+
+    async def _home(self, username: str) -> Database:
+        return self.shards[(await self._user_shards([username]))[username]]
+
+    def _remember_posts(self, post_ids, index: int):
+        for post_id in post_ids:
+            self._post_shards[post_id] = index
+            self._post_shards.move_to_end(post_id)
+        while len(self._post_shards) > self._write_cache_size:
+            self._post_shards.popitem(last=False)
+
+    async def _post_shards_of(self, post_ids) -> dict[int, int]:
+        """post_id -> shard index of the stored ones of `post_ids`."""
+        found = {}
+        missing = []
+        for post_id in set(post_ids):
+            if post_id in self._post_shards:
+                found[post_id] = self._post_shards[post_id]
+            else:
+                missing.append(post_id)
+        if missing:
+            stored = await asyncio.gather(
+                *(shard.get_existing_post_ids(missing) for shard in self.shards)
+            )
+            for index, post_ids in enumerate(stored):
+                self._remember_posts(post_ids, index)
+                found.update(dict.fromkeys(post_ids, index))
+        return found
+
+    async def save_user(self, user: User):
+        await (await self._home(user.username)).save_user(user)
+
+    async def save_post(self, post: Post):
+        index = (await self._user_shards([post.owner]))[post.owner]
+        await self.shards[index].save_post(post)
+        self._remember_posts([post.post_id], index)
+
+    async def save_posts(self, batch: PostBatch):
+        if not len(batch):
+            return
+        owners = await self._user_shards(batch.owner)
+        parts = defaultdict(list)
+        for i in range(len(batch)):
+            parts[owners[batch.owner[i]]].append(i)
+        await asyncio.gather(
+            *(
+                self.shards[index].save_posts(PostBatch(batch[i] for i in indices))
+                for index, indices in parts.items()
+            )
+        )
+        for index, indices in parts.items():
+            self._remember_posts((batch.post_id[i] for i in indices), index)
+
+    async def save_follower(self, follower: Follower) -> tuple[int, int]:
+        return await (await self._home(follower.who_to_follow)).save_follower(follower)
+
+    async def save_followers(self, batch: FollowerBatch) -> list[tuple[int, int]]:
+        if not len(batch):
+            return []
+        users = await self._user_shards(batch.who_to_follow)
+        parts = defaultdict(list)
+        for i in range(len(batch)):
+            parts[users[batch.who_to_follow[i]]].append(i)
+        edges = await asyncio.gather(
+            *(
+                self.shards[index].save_followers(FollowerBatch(batch[i] for i in indices))
+                for index, indices in parts.items()
+            )
+        )
+        return sorted(edge for part in edges for edge in part)
+
+    async def save_interactions(self, batch: InteractionBatch):
+        """To the shard of the post; interactions with unknown posts are dropped."""
+        if not len(batch):
+            return
+        posts = await self._post_shards_of(batch.post_id)
+        parts = defaultdict(InteractionBatch)
+        for post_id, username, name, interaction in zip(
+            batch.post_id, batch.username, batch.name, batch.interaction
+        ):
+            if post_id in posts:
+                parts[posts[post_id]].append(post_id, username, interaction, name)
+        await asyncio.gather(
+            *(self.shards[index].save_interactions(part) for index, part in parts.items())
+        )
+
+    async def bulk_load(self, chunk: StagedChunk):
+        """Splits a chunk of a local sink (see `sinks.sync`) by shard."""
+        users = await self._user_shards(chunk.usernames())
+        post_shards = {post[0]: users[post[2]] for post in chunk.posts}
+        referenced = [
+            row[0]
+            for name in ("interactions", "mentions", "hashtags", "links", "media")
+            for row in getattr(chunk, name)
+            if row[0] not in post_shards
+        ]
+        if referenced:
+            post_shards.update(await self._post_shards_of(referenced))
+        parts = split_chunk(chunk, users, post_shards, len(self.shards))
+        await asyncio.gather(
+            *(shard.bulk_load(part) for shard, part in zip(self.shards, parts) if len(part))
+        )
+        for index, part in enumerate(parts):
+            self._remember_posts((post[0] for post in part.posts), index)
+
+    # global state of the crawl lives in the directory
+
+    async def _mark_user(self, username: str, status: str):
+        await self.directory._mark_user(username, status)
+
+    async def get_bunch_of_users(
+        self, start_from_id: int = 1, limit: int = 10
+    ) -> list[tuple[int, str]]:
+        return await self.directory.get_bunch_of_users(start_from_id, limit)
+
+    async def get_harvest_checkpoint(
+        self, username: str, direction: str
+    ) -> HarvestCheckpoint | None:
+        return await self.directory.get_harvest_checkpoint(username, direction)
+
+    async def save_harvest_checkpoint(self, checkpoint: HarvestCheckpoint):
+        await self.directory.save_harvest_checkpoint(checkpoint)
+
+    async def get_unfinished_harvests(self, limit: int = 100) -> list[HarvestCheckpoint]:
+        return await self.directory.get_unfinished_harvests(limit)
+
+    async def get_downloaded_urls(self, urls: list[str]) -> set[str]:
+        return await self.directory.get_downloaded_urls(urls)
+
+    async def save_media_files(self, files: list[MediaFile]):
+        await self.directory.save_media_files(files)
+
+    # reads: of one user on its shard, the others on every shard
+
+    async def _home_of_known(self, username: str) -> Database | None:
+        user = await self.directory.get_user(username)
+        return self.shard_of(user["id"]) if user else None
+
+    async def get_user(self, username: str) -> asyncpg.Record | None:
+        home = await self._home_of_known(username)
+        return await home.get_user(username) if home else None
+
+    async def get_user_posts(self, username: str, *args, **kwargs) -> list[asyncpg.Record]:
+        home = await self._home_of_known(username)
+        return await home.get_user_posts(username, *args, **kwargs) if home else []
+
+    async def get_followers(self, username: str, *args, **kwargs) -> list[asyncpg.Record]:
+        home = await self._home_of_known(username)
+        return await home.get_followers(username, *args, **kwargs) if home else []
+
+    async def get_user_daily_stats(
+        self, username: str, *args, **kwargs
+    ) -> list[asyncpg.Record]:
+        home = await self._home_of_known(username)
+        return await home.get_user_daily_stats(username, *args, **kwargs) if home else []
+
+    async def _gather(self, method: str, *args, **kwargs) -> list:
+        """Results of `method` of every shard, in shard order."""
+        return await asyncio.gather(
+            *(getattr(shard, method)(*args, **kwargs) for shard in self.shards)
+        )
+
+    async def _concat(self, method: str, *args, **kwargs) -> list:
+        """Rows of `method` of every shard, one list."""
+        return [row for rows in await self._gather(method, *args, **kwargs) for row in rows]
+
+    async def _merged(self, method: str, key, limit: int, *args, **kwargs):
+        """First `limit` rows of every shard's `method`, merged by descending `key`."""
+        pages = await self._gather(method, *args, limit=limit, **kwargs)
+        return list(islice(heapq.merge(*pages, key=key, reverse=True), limit))
+
+    async def _top(self, method: str, key, limit: int, *args, **kwargs):
+        """
+        First `limit` rows of every shard's `method` by ascending `key`, for
+        rankings of rows which live on one shard each (users, posts).
+        """
+        pages = await self._gather(method, *args, limit=limit, **kwargs)
+        return sorted((row for page in pages for row in page), key=key)[:limit]
+
+    async def get_posts_by_date(
+        self,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        before: tuple[datetime, int] | None = None,
+        limit: int = 20,
+    ) -> list[asyncpg.Record]:
+        return await self._merged(
+            "get_posts_by_date",
+            lambda r: (r["creation_date"], r["id"]),
+            limit,
+            since,
+            until,
+            before,
+        )
+
+    async def search_posts(
+        self,
+        query: str,
+        user: str | None = None,
+        since: datetime | None = None,
+        limit: int = 20,
+        after: tuple[float | None, int] | None = None,
+        substring: bool = False,
+    ) -> list[asyncpg.Record]:
+        if substring:
+            key = lambda r: r["id"]  # noqa: E731
+        else:
+            key = lambda r: (r["rank"], r["id"])  # noqa: E731
+        return await self._merged(
+            "search_posts",
+            key,
+            limit,
+            query,
+            user=user,
+            since=since,
+            after=after,
+            substring=substring,
+        )
+
+    async def get_posts_mentioning(
+        self, username: str, limit: int = 20, before_id: int | None = None
+    ) -> list[asyncpg.Record]:
+        return await self._merged(
+            "get_posts_mentioning", lambda r: r["id"], limit, username, before_id=before_id
+        )
+
+    async def get_posts_with_hashtag(
+        self,
+        tag: str,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        limit: int = 20,
+    ) -> list[asyncpg.Record]:
+        return await self._merged(
+            "get_posts_with_hashtag",
+            lambda r: (r["creation_date"], r["id"]),
+            limit,
+            tag,
+            since,
+            until,
+        )
+
+    async def get_posts_linking(
+        self, domain: str, limit: int = 20, before_id: int | None = None
+    ) -> list[asyncpg.Record]:
+        return await self._merged(
+            "get_posts_linking", lambda r: r["id"], limit, domain, before_id=before_id
+        )
+
+    async def get_top_hashtags(
+        self, since: datetime, until: datetime | None = None, limit: int | None = 20
+    ) -> list[dict]:
+        """Counts of every shard summed: a tag may be used on all of them."""
+        counts = Counter()
+        for rows in await self._gather("get_top_hashtags", since, until, limit=None):
+            counts.update({row["tag"]: row["posts"] for row in rows})
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return [{"tag": tag, "posts": posts} for tag, posts in ranked[:limit]]
+
+    async def get_most_active_users(
+        self, since: date, until: date | None = None, limit: int = 20
+    ) -> list[asyncpg.Record]:
+        # rollups live with the posts, on the shard of their owner
+        return await self._top(
+            "get_most_active_users",
+            lambda r: (-r["posts"], r["username"]),
+            limit,
+            since,
+            until,
+        )
+
+    async def get_top_growing_posts(
+        self,
+        since: datetime,
+        until: datetime | None = None,
+        metric: str = "likes",
+        limit: int = 20,
+    ) -> list[asyncpg.Record]:
+        return await self._top(
+            "get_top_growing_posts",
+            lambda r: (-r["growth"], r["post_id"]),
+            limit,
+            since,
+            until,
+            metric,
+        )
+
+    async def get_engagement_curve(self, post_id: int) -> list[asyncpg.Record]:
+        return await self._concat("get_engagement_curve", post_id)
+
+    async def get_post_media(self, post_id: int) -> list[asyncpg.Record]:
+        return await self._concat("get_post_media", post_id)
+
+    async def get_thread(self, root_id: int, limit: int = 10_000) -> list[dict]:
+        """
+        Replies live on the shards of their authors: the conversation of
+        every shard is collected and the tree is built here, in the order
+        and with the `depth` and `path` of `Database.get_thread`.
+        """
+        posts = {row["id"]: row for row in await self._concat("get_conversation", root_id)}
+        children = defaultdict(list)
+        for post in posts.values():
+            if post["id"] != root_id and post["parent_id"] is not None:
+                children[post["parent_id"]].append(post["id"])
+        thread = []
+        stack = [[root_id]]
+        while stack and len(thread) < limit:
+            path = stack.pop()
+            if path[-1] in posts:
+                thread.append(dict(posts[path[-1]], depth=len(path) - 1, path=path))
+            stack += [path + [child] for child in sorted(children[path[-1]], reverse=True)]
+        return thread
+
+    async def get_near_duplicates(
+        self, post_id: int, threshold: float = 0.8, limit: int = 100
+    ) -> list[tuple[int, float]]:
+        """Bucket mates of the post on every shard, compared at once."""
+        signature = next(
+            (s for s in await self._gather("get_signature", post_id) if s is not None),
+            None,
+        )
+        if signature is None:
+            return []
+        signatures = {post_id: signature}
+        for rows in await self._gather("get_bucket_mates", signature):
+            signatures.update((row["post_id"], row["signature"]) for row in rows)
+        ids = list(signatures)
+        found = dedup.rank_similar(
+            post_id, ids, dedup.from_bytes(list(signatures.values())), threshold
+        )
+        return found[:limit]
+
+    async def cluster_posts(
+        self, since: datetime, until: datetime, threshold: float = 0.8
+    ) -> list[list[int]]:
+        """Signatures of every shard clustered together: copies span shards."""
+        rows = await self._concat("get_signatures", since, until)
+        if not rows:
+            return []
+        ids = [r["post_id"] for r in rows]
+        signatures = dedup.from_bytes([r["signature"] for r in rows])
+        return await asyncio.to_thread(dedup.cluster, ids, signatures, threshold)
+
+    async def prune_change_feed(self) -> int:
+        return sum(await self._gather("prune_change_feed"))
+
+    async def rebalance(self, batch_size: int = 1000) -> int:
+        """
+        Moves the rows of users stored on another shard than theirs, after
+        shards were added to the list, `batch_size` users at a time. Rows
+        are copied, then deleted from the old shard, so an interrupted run
+        is simply started again. Crawlers must be stopped meanwhile: rows
+        they write to the new shard could be overwritten by older copies.
+        Returns the number of moved users.
+        """
+        moved = 0
+        for index, shard in enumerate(self.shards):
+            leaving = [
+                user_id
+                for user_id in await shard.get_resident_user_ids()
+                if self.shard_index(user_id) != index
+            ]
+            for start in range(0, len(leaving), batch_size):
+                targets = defaultdict(list)
+                for user_id in leaving[start:start + batch_size]:
+                    targets[self.shard_index(user_id)].append(user_id)
+                for target, user_ids in sorted(targets.items()):
+                    rows = await shard.export_user_rows(user_ids)
+                    await self.shards[target].import_user_rows(user_ids, rows)
+                    await shard.delete_user_rows(user_ids)
+            moved += len(leaving)
+            logging.info(f"Rebalance: moved {len(leaving)} users off shard {index}")
+        self._post_shards.clear()
+        return moved
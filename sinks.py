@@ -0,0 +1,1014 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from time import time_ns
+
+from entities import User, PostBatch, FollowerBatch, InteractionBatch
+
+PARSER_STATUSES = ("not parsed", "parsing now", "parsed", "error")
+
+
+class WriteStats:
+    """
+    Rows submitted to a sink vs rows it actually wrote, per entity.
+    The difference are unchanged rows whose rewrite was skipped.
+    """
+
+    def __init__(self):
+        self.submitted = Counter()
+        self.written = Counter()
+
+    def record(self, entity: str, submitted: int, written: int):
+        self.submitted[entity] += submitted
+        self.written[entity] += written
+
+    def skipped(self, entity: str) -> int:
+        return self.submitted[entity] - self.written[entity]
+
+    def summary(self) -> str:
+        return " ".join(
+            f"{entity}: submitted={self.submitted[entity]} "
+            f"written={self.written[entity]} skipped={self.skipped(entity)}"
+            for entity in sorted(self.submitted)
+        )
+
+
+class HarvestCheckpoint:
+    """Progress of a streamed followers/following list, see `harvest.py`."""
+
+    def __init__(
+        self,
+        username: str,
+        direction: str,
+        cursor: str | None = None,
+        harvested: int = 0,
+        finished: bool = False,
+    ):
+        self.username = username
+        self.direction = direction
+        self.cursor = cursor
+        self.harvested = harvested
+        self.finished = finished
+
+    def __repr__(self):
+        return (
+            f"HarvestCheckpoint(@{self.username} {self.direction}, "
+            f"cursor={self.cursor}, harvested={self.harvested}, "
+            f"finished={self.finished})"
+        )
+
+
+class MediaFile:
+    """A downloaded url and the content addressed file it is stored in."""
+
+    __slots__ = ("url", "sha256", "size", "content_type", "path")
+
+    def __init__(
+        self, url: str, sha256: str, size: int, content_type: str | None, path: str
+    ):
+        self.url = url
+        self.sha256 = sha256
+        self.size = size
+        self.content_type = content_type
+        # relative to the root of the media store
+        self.path = path
+
+    def __repr__(self):
+        return f"MediaFile({self.url} -> {self.path}, {self.size} bytes)"
+
+
+class Sink(ABC):
+    """
+    Destination of the parsed entities.
+
+    `database.Database` writes straight to PostgreSQL. Local sinks
+    (`SQLiteSink`, `JsonlSink`) let a crawler node run without a database
+    server; their files are merged into PostgreSQL later with `sync`.
+    Subclasses must implement the abstract methods to be instantiated.
+    """
+
+    write_stats: WriteStats
+
+    def __init__(self):
+        self.write_stats = WriteStats()
+        # (username, direction) -> checkpoint, for sinks without a table for them
+        self._checkpoints: dict[tuple[str, str], HarvestCheckpoint] = {}
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def save_user(self, user: User):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_posts(self, batch: PostBatch):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_followers(self, batch: FollowerBatch) -> list[tuple[int, int]]:
+        """Returns (user_id, follower_id) pairs if the sink assigns user ids."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_interactions(self, batch: InteractionBatch):
+        raise NotImplementedError
+
+    async def get_downloaded_urls(self, urls: list[str]) -> set[str]:
+        """Those of `urls` which were already downloaded."""
+        return set()
+
+    @abstractmethod
+    async def save_media_files(self, files: list[MediaFile]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _mark_user(self, username: str, status: str):
+        raise NotImplementedError
+
+    async def mark_user_parsed(self, username: str):
+        await self._mark_user(username, "parsed")
+
+    async def mark_user_error(self, username: str):
+        await self._mark_user(username, "error")
+
+    async def mark_user_parsing_now(self, username: str):
+        await self._mark_user(username, "parsing now")
+
+    @abstractmethod
+    async def get_bunch_of_users(
+        self, start_from_id: int = 1, limit: int = 10
+    ) -> list[tuple[int, str]]:
+        """(id, username) of users that still have to be parsed."""
+        raise NotImplementedError
+
+    async def get_bunch_of_usernames(
+        self, start_from_id: int = 1, limit: int = 10
+    ) -> list[str]:
+        return [username for _, username in await self.get_bunch_of_users(
+            start_from_id, limit
+        )]
+
+    async def get_harvest_checkpoint(
+        self, username: str, direction: str
+    ) -> HarvestCheckpoint | None:
+        return self._checkpoints.get((username, direction))
+
+    async def save_harvest_checkpoint(self, checkpoint: HarvestCheckpoint):
+        self._checkpoints[(checkpoint.username, checkpoint.direction)] = checkpoint
+
+    async def get_unfinished_harvests(
+        self, limit: int = 100
+    ) -> list[HarvestCheckpoint]:
+        """Checkpoints of follower lists which still have to be continued."""
+        return [c for c in self._checkpoints.values() if not c.finished][:limit]
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    has_profile INTEGER NOT NULL DEFAULT 0,
+    name TEXT,
+    followers INTEGER,
+    following INTEGER,
+    registration_date TEXT,
+    location TEXT,
+    personal_site TEXT,
+    bio TEXT,
+    -- set by the crawl only, NULL for users seen as followers or authors
+    parser_status TEXT
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    post_text TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    reply_to TEXT,
+    likes INTEGER,
+    reposts INTEGER,
+    replies INTEGER,
+    creation_date TEXT NOT NULL,
+    parent_id INTEGER,
+    root_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS post_interactions (
+    post_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    interaction TEXT NOT NULL,
+    PRIMARY KEY (post_id, username, interaction)
+);
+CREATE TABLE IF NOT EXISTS followers (
+    user TEXT NOT NULL,
+    follower TEXT NOT NULL,
+    PRIMARY KEY (user, follower)
+);
+CREATE TABLE IF NOT EXISTS post_mentions (
+    post_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (post_id, username)
+);
+CREATE TABLE IF NOT EXISTS post_hashtags (
+    post_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    creation_date TEXT NOT NULL,
+    PRIMARY KEY (post_id, tag)
+);
+CREATE TABLE IF NOT EXISTS post_links (
+    post_id INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    PRIMARY KEY (post_id, url)
+);
+CREATE TABLE IF NOT EXISTS post_media (
+    post_id INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (post_id, url)
+);
+CREATE TABLE IF NOT EXISTS user_avatars (
+    username TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (username, url)
+);
+CREATE TABLE IF NOT EXISTS media_files (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    content_type TEXT,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS follower_harvests (
+    username TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    cursor TEXT,
+    harvested INTEGER NOT NULL DEFAULT 0,
+    finished INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, direction)
+);
+"""
+
+
+class SQLiteSink(Sink):
+    """
+    Local SQLite file in WAL mode. Every batch is written in a single
+    transaction on a dedicated thread, so the event loop is not blocked.
+    Users are identified by username, there are no global user ids.
+    """
+
+    _conn: sqlite3.Connection
+    _executor: ThreadPoolExecutor
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+
+    async def connect(self):
+        # sqlite connections must be used from the thread that created them
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        await self._run(self._connect)
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SQLITE_SCHEMA)
+
+    async def close(self):
+        await self._run(self._conn.close)
+        self._executor.shutdown()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _transaction(self, statements: list[tuple[str, list]]):
+        def run():
+            with self._conn:
+                for sql, rows in statements:
+                    if rows:
+                        self._conn.executemany(sql, rows)
+
+        await self._run(run)
+
+    async def save_user(self, user: User):
+        await self._transaction(
+            [
+                (
+                    """
+                    INSERT INTO users (username, has_profile, name, followers,
+                        following, registration_date, location, personal_site, bio)
+                    VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (username) DO UPDATE SET
+                        has_profile = 1,
+                        name = excluded.name,
+                        followers = excluded.followers,
+                        following = excluded.following,
+                        registration_date = excluded.registration_date,
+                        location = excluded.location,
+                        personal_site = excluded.personal_site,
+                        bio = excluded.bio
+                    """,
+                    [_user_row(user)],
+                )
+            ]
+        )
+
+    async def save_posts(self, batch: PostBatch):
+        posts = [
+            (
+                batch.post_id[i],
+                batch.text[i],
+                batch.owner[i],
+                batch.reply_to[i],
+                batch.likes[i],
+                batch.reposts[i],
+                batch.replies[i],
+                batch.timestamp[i].isoformat(),
+            )
+            for i in range(len(batch))
+        ]
+        links = [
+            (parent_id, root_id, post_id)
+            for post_id, parent_id, root_id in batch.thread_links()
+        ]
+        mentions, hashtags, post_links = batch.entity_rows()
+        media, avatars = batch.media_rows()
+        reposts = [
+            (batch.post_id[i], batch.who_reposted[i])
+            for i in range(len(batch))
+            if batch.is_repost[i] and batch.who_reposted[i]
+        ]
+        await self._transaction(
+            [
+                (
+                    "INSERT OR IGNORE INTO users (username) VALUES (?)",
+                    [(u,) for u in batch.usernames()],
+                ),
+                (
+                    """
+                    INSERT INTO posts (id, post_text, owner, reply_to,
+                        likes, reposts, replies, creation_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        post_text = excluded.post_text,
+                        owner = excluded.owner,
+                        reply_to = excluded.reply_to,
+                        likes = excluded.likes,
+                        reposts = excluded.reposts,
+                        replies = excluded.replies,
+                        creation_date = excluded.creation_date
+                    """,
+                    posts,
+                ),
+                (
+                    """
+                    UPDATE posts SET parent_id = coalesce(?, parent_id), root_id = ?
+                    WHERE id = ?
+                    """,
+                    links,
+                ),
+                (
+                    """
+                    INSERT OR IGNORE INTO post_interactions (post_id, username, interaction)
+                    VALUES (?, ?, 'reposted')
+                    """,
+                    reposts,
+                ),
+                (
+                    """
+                    INSERT OR IGNORE INTO post_mentions (post_id, username)
+                    VALUES (?, ?)
+                    """,
+                    mentions,
+                ),
+                (
+                    """
+                    INSERT OR IGNORE INTO post_hashtags (post_id, tag, creation_date)
+                    VALUES (?, ?, ?)
+                    """,
+                    [(post_id, tag, ts.isoformat()) for post_id, tag, ts in hashtags],
+                ),
+                (
+                    """
+                    INSERT OR IGNORE INTO post_links (post_id, url, domain)
+                    VALUES (?, ?, ?)
+                    """,
+                    post_links,
+                ),
+                (
+                    """
+                    INSERT OR IGNORE INTO post_media (post_id, url, position)
+                    VALUES (?, ?, ?)
+                    """,
+                    media,
+                ),
+                (
+                    "INSERT OR IGNORE INTO user_avatars (username, url) VALUES (?, ?)",
+                    avatars,
+                ),
+            ]
+        )
+
+    async def save_followers(self, batch: FollowerBatch) -> list[tuple[int, int]]:
+        await self._transaction(
+            [
+                (
+                    "INSERT OR IGNORE INTO users (username) VALUES (?)",
+                    [(u,) for u in set(batch.who_to_follow)],
+                ),
+                (
+                    "INSERT OR IGNORE INTO users (username, name) VALUES (?, ?)",
+                    list(zip(batch.username, batch.name)),
+                ),
+                (
+                    "INSERT OR IGNORE INTO followers (user, follower) VALUES (?, ?)",
+                    list(zip(batch.who_to_follow, batch.username)),
+                ),
+            ]
+        )
+        return []
+
+    async def save_interactions(self, batch: InteractionBatch):
+        await self._transaction(
+            [
+                (
+                    "INSERT OR IGNORE INTO users (username, name) VALUES (?, ?)",
+                    list(zip(batch.username, batch.name)),
+                ),
+                (
+                    """
+                    INSERT OR IGNORE INTO post_interactions (post_id, username, interaction)
+                    VALUES (?, ?, ?)
+                    """,
+                    list(batch),
+                ),
+            ]
+        )
+
+    async def get_downloaded_urls(self, urls: list[str]) -> set[str]:
+        def fetch():
+            found = set()
+            # stays below the sqlite limit of bound parameters
+            for i in range(0, len(urls), 500):
+                part = urls[i:i + 500]
+                found.update(
+                    r[0]
+                    for r in self._conn.execute(
+                        "SELECT url FROM media_files WHERE url IN "
+                        f"({', '.join('?' * len(part))})",
+                        part,
+                    )
+                )
+            return found
+
+        return await self._run(fetch)
+
+    async def save_media_files(self, files: list[MediaFile]):
+        await self._transaction(
+            [
+                (
+                    """
+                    INSERT OR REPLACE INTO media_files
+                        (url, sha256, size, content_type, path)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    [_media_file_row(f) for f in files],
+                )
+            ]
+        )
+
+    async def _mark_user(self, username: str, status: str):
+        await self._transaction(
+            [
+                (
+                    """
+                    INSERT INTO users (username, parser_status) VALUES (?, ?)
+                    ON CONFLICT (username) DO UPDATE SET
+                        parser_status = excluded.parser_status
+                    """,
+                    [(username, status)],
+                )
+            ]
+        )
+
+    async def get_bunch_of_users(
+        self, start_from_id: int = 1, limit: int = 10
+    ) -> list[tuple[int, str]]:
+        def fetch():
+            return self._conn.execute(
+                """
+                SELECT rowid, username FROM users
+                WHERE coalesce(parser_status, 'not parsed') IN ('not parsed', 'error')
+                    AND rowid >= ?
+                LIMIT ?
+                """,
+                (start_from_id, limit),
+            ).fetchall()
+
+        return [(r[0], r[1]) for r in await self._run(fetch)]
+
+    async def get_harvest_checkpoint(
+        self, username: str, direction: str
+    ) -> HarvestCheckpoint | None:
+        def fetch():
+            return self._conn.execute(
+                """
+                SELECT username, direction, cursor, harvested, finished
+                FROM follower_harvests WHERE username = ? AND direction = ?
+                """,
+                (username, direction),
+            ).fetchone()
+
+        row = await self._run(fetch)
+        return HarvestCheckpoint(*row[:4], bool(row[4])) if row else None
+
+    async def save_harvest_checkpoint(self, checkpoint: HarvestCheckpoint):
+        await self._transaction(
+            [
+                (
+                    """
+                    INSERT OR REPLACE INTO follower_harvests
+                        (username, direction, cursor, harvested, finished)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (
+                            checkpoint.username,
+                            checkpoint.direction,
+                            checkpoint.cursor,
+                            checkpoint.harvested,
+                            int(checkpoint.finished),
+                        )
+                    ],
+                )
+            ]
+        )
+
+    async def get_unfinished_harvests(
+        self, limit: int = 100
+    ) -> list[HarvestCheckpoint]:
+        def fetch():
+            return self._conn.execute(
+                """
+                SELECT username, direction, cursor, harvested
+                FROM follower_harvests WHERE NOT finished LIMIT ?
+                """,
+                (limit,),
+            ).fetchall()
+
+        return [HarvestCheckpoint(*row) for row in await self._run(fetch)]
+
+
+class JsonlSink(Sink):
+    """
+    Appends every entity as a JSON line to rotated segment files.
+
+    The segment being written is named `*.jsonl.open` and is renamed to
+    `*.jsonl` when it exceeds `max_segment_bytes` or the sink is closed,
+    so `sync` only picks up complete segments. The crawl frontier and the
+    follower harvest checkpoints are kept in memory and only cover this process.
+    """
+
+    def __init__(self, directory: str, max_segment_bytes: int = 64 * 1024 * 1024):
+        super().__init__()
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self._segment = None
+        self._segment_path = ""
+        self._statuses: dict[str, str] = {}
+
+    async def connect(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._rotate()
+
+    async def close(self):
+        self._close_segment()
+
+    def _rotate(self):
+        self._close_segment()
+        self._segment_path = os.path.join(
+            self.directory, f"segment-{time_ns()}.jsonl.open"
+        )
+        self._segment = open(self._segment_path, "a", encoding="utf-8")
+
+    def _close_segment(self):
+        if self._segment is None:
+            return
+        self._segment.close()
+        self._segment = None
+        os.replace(self._segment_path, self._segment_path.removesuffix(".open"))
+
+    def _write(self, records: list[dict]):
+        self._segment.write(  # type: ignore
+            "".join(json.dumps(r, default=_json_default) + "\n" for r in records)
+        )
+        self._segment.flush()  # type: ignore
+        if self._segment.tell() >= self.max_segment_bytes:  # type: ignore
+            self._rotate()
+
+    def _seen(self, usernames):
+        for username in usernames:
+            self._statuses.setdefault(username, "not parsed")
+
+    async def save_user(self, user: User):
+        self._seen([user.username])
+        self._write([{"type": "user", **_user_dict(user)}])
+
+    async def save_posts(self, batch: PostBatch):
+        self._seen(batch.usernames())
+        self._write(
+            [
+                {
+                    "type": "post",
+                    "id": batch.post_id[i],
+                    "post_text": batch.text[i],
+                    "owner": batch.owner[i],
+                    "reply_to": batch.reply_to[i],
+                    "likes": batch.likes[i],
+                    "reposts": batch.reposts[i],
+                    "replies": batch.replies[i],
+                    "creation_date": batch.timestamp[i],
+                    "who_reposted": batch.who_reposted[i]
+                    if batch.is_repost[i] else None,
+                    "parent_id": batch.parent_id[i],
+                    "root_id": batch.root_id[i],
+                    "mentions": batch.mentions[i],
+                    "hashtags": batch.hashtags[i],
+                    "links": batch.links[i],
+                    "media": batch.media[i],
+                    "avatar_url": batch.avatar_url[i],
+                }
+                for i in range(len(batch))
+            ]
+        )
+
+    async def save_followers(self, batch: FollowerBatch) -> list[tuple[int, int]]:
+        self._seen(batch.username)
+        self._seen(batch.who_to_follow)
+        self._write(
+            [
+                {"type": "follower", "user": user, "follower": follower, "name": name}
+                for user, follower, name in zip(
+                    batch.who_to_follow, batch.username, batch.name
+                )
+            ]
+        )
+        return []
+
+    async def save_interactions(self, batch: InteractionBatch):
+        self._seen(batch.username)
+        self._write(
+            [
+                {
+                    "type": "interaction",
+                    "post_id": post_id,
+                    "username": username,
+                    "name": name,
+                    "interaction": interaction,
+                }
+                for post_id, username, name, interaction in zip(
+                    batch.post_id, batch.username, batch.name, batch.interaction
+                )
+            ]
+        )
+
+    async def save_media_files(self, files: list[MediaFile]):
+        self._write(
+            [
+                {
+                    "type": "media_file",
+                    "url": f.url,
+                    "sha256": f.sha256,
+                    "size": f.size,
+                    "content_type": f.content_type,
+                    "path": f.path,
+                }
+                for f in files
+            ]
+        )
+
+    async def _mark_user(self, username: str, status: str):
+        self._statuses[username] = status
+        self._write([{"type": "status", "username": username, "status": status}])
+
+    async def get_bunch_of_users(
+        self, start_from_id: int = 1, limit: int = 10
+    ) -> list[tuple[int, str]]:
+        pending = [
+            (i, username)
+            for i, (username, status) in enumerate(self._statuses.items(), 1)
+            if i >= start_from_id and status in ("not parsed", "error")
+        ]
+        return pending[:limit]
+
+
+def open_sink(dsn: str, max_pool_size: int = 10, read_only: bool = False) -> Sink:
+    """
+    Creates a sink from a connection string:
+    `postgresql://...` (or `postgres://`), `sqlite:///path/to/file.db`
+    or `jsonl:///path/to/directory`. Several comma separated PostgreSQL
+    URLs are shards of one database, see `sharding.ShardedDatabase`.
+    `read_only` opens read-only PostgreSQL pools.
+    """
+    if dsn.startswith("sqlite://"):
+        return SQLiteSink(dsn.removeprefix("sqlite://"))
+    if dsn.startswith("jsonl://"):
+        return JsonlSink(dsn.removeprefix("jsonl://"))
+    dsns = split_dsns(dsn)
+    if len(dsns) > 1:
+        from sharding import ShardedDatabase
+
+        return ShardedDatabase(dsns, max_pool_size, read_only=read_only)
+    from database import Database
+
+    return Database(dsn, max_pool_size, read_only=read_only)
+
+
+def split_dsns(dsn: str) -> list[str]:
+    """
+    Shard URLs of a comma separated list. Commas of libpq multi-host URLs
+    (`postgresql://host1,host2/db`) do not start a new URL.
+    """
+    return re.split(r",\s*(?=postgres(?:ql)?://)", dsn.strip())
+
+
+def _user_row(user: User) -> tuple:
+    d = _user_dict(user)
+    return (
+        d["username"], d["name"], d["followers"], d["following"],
+        d["registration_date"], d["location"], d["personal_site"], d["bio"],
+    )
+
+
+def _user_dict(user: User) -> dict:
+    return {
+        "username": user.username,
+        "name": user.name,
+        "followers": user.followers_num,
+        "following": user.following_num,
+        "registration_date": user.registration_date.date().isoformat()
+        if user.registration_date else None,
+        "location": user.location,
+        "personal_site": user.personal_site,
+        "bio": user.bio,
+    }
+
+
+def _media_file_row(f: MediaFile) -> tuple:
+    return (f.url, f.sha256, f.size, f.content_type, f.path)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value)}")
+
+
+# --- merging local sink files into PostgreSQL ---
+
+
+class StagedChunk:
+    """Rows of a local sink in the form `Database.bulk_load` expects."""
+
+    def __init__(self):
+        # username -> [has_profile, name, followers, following,
+        #   registration_date, location, personal_site, bio, parser_status]
+        self.users: dict[str, list] = {}
+        self.posts: list[tuple] = []
+        self.interactions: list[tuple] = []
+        self.followers: list[tuple] = []
+        self.mentions: list[tuple] = []
+        self.hashtags: list[tuple] = []
+        self.links: list[tuple] = []
+        self.media: list[tuple] = []
+        self.avatars: list[tuple] = []
+        # (url, sha256, size, content_type, path)
+        self.media_files: list[tuple] = []
+
+    def __len__(self):
+        return (
+            len(self.users) + len(self.posts)
+            + len(self.interactions) + len(self.followers)
+            + len(self.mentions) + len(self.hashtags) + len(self.links)
+            + len(self.media) + len(self.avatars) + len(self.media_files)
+        )
+
+    def user(self, username: str) -> list:
+        return self.users.setdefault(username, [False] + [None] * 8)
+
+    def add_profile(self, d: dict):
+        row = self.user(d["username"])
+        row[:8] = [
+            True, d["name"], d["followers"], d["following"],
+            _parse_date(d["registration_date"]), d["location"],
+            d["personal_site"], d["bio"],
+        ]
+
+    def set_status(self, username: str, status: str):
+        self.user(username)[8] = status
+
+    def user_rows(self) -> list[tuple]:
+        return [(username, *row) for username, row in self.users.items()]
+
+    def usernames(self) -> list[str]:
+        """Every username the rows reference."""
+        names = set(self.users)
+        for post in self.posts:
+            names.add(post[2])
+            if post[3]:
+                names.add(post[3])
+        names.update(r[1] for r in self.interactions)
+        for user, follower in self.followers:
+            names.update((user, follower))
+        names.update(r[1] for r in self.mentions)
+        names.update(r[0] for r in self.avatars)
+        return sorted(names)
+
+
+def _parse_date(value: str | None) -> date | None:
+    return date.fromisoformat(value[:10]) if value else None
+
+
+def read_jsonl_segment(path: str, chunk_size: int = 50_000):
+    """Yields StagedChunks read from a JSONL sink segment."""
+    chunk = StagedChunk()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            r = json.loads(line)
+            kind = r["type"]
+            if kind == "user":
+                chunk.add_profile(r)
+            elif kind == "status":
+                chunk.set_status(r["username"], r["status"])
+            elif kind == "post":
+                chunk.posts.append(
+                    (
+                        r["id"], r["post_text"], r["owner"], r["reply_to"],
+                        r["likes"], r["reposts"], r["replies"],
+                        datetime.fromisoformat(r["creation_date"]),
+                        r.get("parent_id"), r.get("root_id"),
+                    )
+                )
+                if r["who_reposted"]:
+                    chunk.interactions.append((r["id"], r["who_reposted"], "reposted"))
+                created = chunk.posts[-1][7]
+                chunk.mentions += [(r["id"], u) for u in r.get("mentions", ())]
+                chunk.hashtags += [(r["id"], t, created) for t in r.get("hashtags", ())]
+                chunk.links += [(r["id"], *link) for link in r.get("links", ())]
+                chunk.media += [
+                    (r["id"], url, position)
+                    for position, url in enumerate(r.get("media", ()))
+                ]
+                if r.get("avatar_url"):
+                    chunk.avatars.append((r["owner"], r["avatar_url"]))
+            elif kind == "media_file":
+                chunk.media_files.append(
+                    (r["url"], r["sha256"], r["size"], r["content_type"], r["path"])
+                )
+            elif kind == "interaction":
+                chunk.interactions.append(
+                    (r["post_id"], r["username"], r["interaction"])
+                )
+                if r["name"] is not None:
+                    chunk.user(r["username"])[1] = r["name"]
+            elif kind == "follower":
+                chunk.followers.append((r["user"], r["follower"]))
+                chunk.user(r["follower"])[1] = r["name"]
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = StagedChunk()
+    if len(chunk):
+        yield chunk
+
+
+def read_sqlite_file(path: str, chunk_size: int = 50_000):
+    """Yields StagedChunks read from a SQLite sink file, table by table."""
+    conn = sqlite3.connect(path)
+    try:
+        cursor = conn.execute(
+            """
+            SELECT username, has_profile, name, followers, following,
+                registration_date, location, personal_site, bio, parser_status
+            FROM users
+            """
+        )
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = StagedChunk()
+            for r in rows:
+                # files written before the column was nullable default to
+                # 'not parsed', which the crawl never sets
+                status = r[9] if r[9] != "not parsed" else None
+                chunk.users[r[0]] = [
+                    bool(r[1]), r[2], r[3], r[4], _parse_date(r[5]),
+                    r[6], r[7], r[8], status,
+                ]
+            yield chunk
+
+        cursor = conn.execute(
+            """
+            SELECT id, post_text, owner, reply_to, likes, reposts, replies,
+                creation_date, parent_id, root_id
+            FROM posts
+            """
+        )
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = StagedChunk()
+            chunk.posts = [
+                (*r[:7], datetime.fromisoformat(r[7]), *r[8:]) for r in rows
+            ]
+            yield chunk
+
+        cursor = conn.execute(
+            "SELECT post_id, username, interaction FROM post_interactions"
+        )
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = StagedChunk()
+            chunk.interactions = rows
+            yield chunk
+
+        cursor = conn.execute("SELECT user, follower FROM followers")
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = StagedChunk()
+            chunk.followers = rows
+            yield chunk
+
+        cursor = conn.execute("SELECT post_id, username FROM post_mentions")
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = StagedChunk()
+            chunk.mentions = rows
+            yield chunk
+
+        cursor = conn.execute("SELECT post_id, tag, creation_date FROM post_hashtags")
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = StagedChunk()
+            chunk.hashtags = [(*r[:2], datetime.fromisoformat(r[2])) for r in rows]
+            yield chunk
+
+        cursor = conn.execute("SELECT post_id, url, domain FROM post_links")
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = StagedChunk()
+            chunk.links = rows
+            yield chunk
+
+        cursor = conn.execute("SELECT post_id, url, position FROM post_media")
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = StagedChunk()
+            chunk.media = rows
+            yield chunk
+
+        cursor = conn.execute("SELECT username, url FROM user_avatars")
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = StagedChunk()
+            chunk.avatars = rows
+            yield chunk
+
+        cursor = conn.execute(
+            "SELECT url, sha256, size, content_type, path FROM media_files"
+        )
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = StagedChunk()
+            chunk.media_files = rows
+            yield chunk
+    finally:
+        conn.close()
+
+
+async def sync(db, path: str, chunk_size: int = 50_000) -> int:
+    """
+    Merges a SQLite sink file or a directory of JSONL segments into
+    PostgreSQL (`db` is a connected `database.Database`). Every chunk is
+    loaded with COPY in its own transaction. Synced JSONL segments are
+    renamed to `*.jsonl.synced`. Returns the number of merged rows.
+    """
+    total = 0
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if not name.endswith(".jsonl"):
+                continue
+            segment = os.path.join(path, name)
+            for chunk in read_jsonl_segment(segment, chunk_size):
+                await db.bulk_load(chunk)
+                total += len(chunk)
+            os.replace(segment, segment + ".synced")
+            logging.info(f"Synced {segment}")
+    else:
+        for chunk in read_sqlite_file(path, chunk_size):
+            await db.bulk_load(chunk)
+            total += len(chunk)
+    return total
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+from time import monotonic
+
+import nodriver as uc
+
+PROC = "/proc"
+
+
+class ProcessSample:
+    """Resources of a browser process and its descendants (renderers, GPU...)."""
+
+    __slots__ = ("rss", "cpu_seconds", "processes")
+
+    def __init__(self, rss: int = 0, cpu_seconds: float = 0.0, processes: int = 0):
+        self.rss = rss
+        self.cpu_seconds = cpu_seconds
+        self.processes = processes
+
+    @property
+    def rss_mb(self) -> float:
+        return self.rss / 1024 / 1024
+
+
+def _read_stat(pid: str) -> tuple[int, float, int] | None:
+    """(parent pid, cpu seconds, rss bytes) of a process from /proc."""
+    try:
+        with open(f"{PROC}/{pid}/stat", "r") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # the command name may contain spaces, fields after it are space separated
+    fields = stat[stat.rindex(")") + 2:].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpu = (int(fields[11]) + int(fields[12])) / ticks
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return int(fields[1]), cpu, rss
+
+
+def sample_process_tree(pid: int) -> ProcessSample:
+    """Sums memory and CPU time of `pid` and its descendants. Linux only."""
+    stats = {}
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir(PROC):
+        if not entry.isdigit():
+            continue
+        stat = _read_stat(entry)
+        if stat is None:
+            continue
+        stats[int(entry)] = stat
+        children.setdefault(stat[0], []).append(int(entry))
+
+    sample = ProcessSample()
+    todo = [pid] if pid in stats else []
+    while todo:
+        current = todo.pop()
+        _, cpu, rss = stats[current]
+        sample.rss += rss
+        sample.cpu_seconds += cpu
+        sample.processes += 1
+        todo.extend(children.get(current, ()))
+    return sample
+
+
+class _Session:
+    __slots__ = ("started", "users", "last_cpu", "last_sampled", "sample", "cpu")
+
+    def __init__(self):
+        self.started = monotonic()
+        self.users = 0
+        self.last_cpu = 0.0
+        self.last_sampled = self.started
+        # latest resources of the browser, None before its first sample
+        self.sample: ProcessSample | None = None
+        self.cpu = 0.0
+
+
+class BrowserSupervisor:
+    """
+    Decides when a crawler browser has to be replaced.
+
+    Browsers are recycled when Chrome with its renderer processes uses more
+    than `max_rss_mb`, after `max_age` seconds or after `max_users` parsed
+    users, so a long crawl does not slow down as Chrome grows. A browser
+    whose process exited or whose CDP connection does not answer within
+    `probe_timeout` seconds is dead: the user being parsed on it is
+    re-queued instead of being marked as failed.
+    """
+
+    def __init__(
+        self,
+        max_rss_mb: float = 2048,
+        max_age: float = 4 * 3600,
+        max_users: int = 300,
+        probe_timeout: float = 10.0,
+    ):
+        self.max_rss_mb = max_rss_mb
+        self.max_age = max_age
+        self.max_users = max_users
+        self.probe_timeout = probe_timeout
+        self._sessions: dict[int, _Session] = {}
+        self.recycled: dict[str, int] = {}
+
+    def register(self, browser: uc.Browser):
+        self._sessions[id(browser)] = _Session()
+
+    def unregister(self, browser: uc.Browser):
+        self._sessions.pop(id(browser), None)
+
+    def user_done(self, browser: uc.Browser):
+        self._session(browser).users += 1
+
+    def _session(self, browser: uc.Browser) -> _Session:
+        return self._sessions.setdefault(id(browser), _Session())
+
+    async def is_alive(self, browser: uc.Browser) -> bool:
+        if browser.stopped or browser.connection is None:
+            return False
+        try:
+            await asyncio.wait_for(
+                browser.connection.send(uc.cdp.browser.get_version()),
+                self.probe_timeout,
+            )
+            return True
+        except Exception as e:
+            logging.error(f"Browser does not answer over CDP: {e!r}")
+            return False
+
+    def sample(self, browser: uc.Browser) -> tuple[ProcessSample, float]:
+        """
+        Current resources of the browser, and its CPU usage (in cores)
+        since the previous sample.
+        """
+        session = self._session(browser)
+        sample = sample_process_tree(browser._process_pid)
+        now = monotonic()
+        elapsed = max(now - session.last_sampled, 1e-6)
+        cpu = (sample.cpu_seconds - session.last_cpu) / elapsed
+        session.last_cpu, session.last_sampled = sample.cpu_seconds, now
+        session.sample, session.cpu = sample, cpu
+        return sample, cpu
+
+    def costs(self) -> list[tuple[ProcessSample, float]]:
+        """Latest (resources, CPU cores) of every registered browser."""
+        return [
+            (session.sample, session.cpu)
+            for session in self._sessions.values()
+            if session.sample is not None
+        ]
+
+    async def recycle_reason(self, browser: uc.Browser) -> str | None:
+        """Why the browser has to be restarted before the next user, if it has to."""
+        if not await self.is_alive(browser):
+            return self._recycle("dead")
+        session = self._session(browser)
+        sample, cpu = self.sample(browser)
+        logging.info(
+            f"Browser pid {browser._process_pid}: {sample.processes} processes, "
+            f"rss={sample.rss_mb:.0f}MB cpu={cpu:.2f} users={session.users}"
+        )
+        if sample.rss_mb > self.max_rss_mb:
+            return self._recycle("memory")
+        if monotonic() - session.started > self.max_age:
+            return self._recycle("age")
+        if session.users >= self.max_users:
+            return self._recycle("users")
+        return None
+
+    def _recycle(self, reason: str) -> str:
+        self.recycled[reason] = self.recycled.get(reason, 0) + 1
+        return reason
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pandas as pd
+
+import export
+from analytics import TermCounter, count_exported_terms, count_terms, tokenize
+
+
+def make_posts():
+    return pd.DataFrame(
+        {
+            "id": [1, 2, 3],
+            "owner_id": [10, 10, 20],
+            "post_text": ["Hello, world!", "hello again 2025", None],
+            "creation_date": [
+                datetime(2025, 1, 19, 10),
+                datetime(2025, 1, 20, 11),
+                datetime(2025, 1, 20, 12),
+            ],
+        }
+    )
+
+
+def test_tokenize():
+    tokens = tokenize(pd.Series(["Hello, world!", "it's 47 MAGA", None]))
+    assert tokens.tolist() == ["hello", "world", "its", "maga"]
+    assert tokens.index.tolist() == [0, 0, 1, 1]
+
+
+def test_term_counter():
+    counter = TermCounter(stopwords={"again"})
+    counter.update(make_posts())
+    assert counter.frequencies() == {"hello": 2, "world": 1}
+    assert counter.most_common(1) == [("hello", 2)]
+    assert counter.last_id == 3
+    assert counter.posts == 3
+
+
+def test_grouped_counters():
+    by_user = TermCounter(by="user")
+    by_user.update(make_posts())
+    assert by_user.frequencies(10) == {"hello": 2, "world": 1, "again": 1}
+    assert by_user.frequencies(20) == {}
+
+    by_day = TermCounter(by="day")
+    by_day.update(make_posts())
+    assert by_day.frequencies(datetime(2025, 1, 20).date()) == {"hello": 1, "again": 1}
+    assert set(by_day.to_frame().columns) == {"day", "term", "count"}
+
+
+def test_incremental_chunks(tmp_path):
+    posts = make_posts()
+    counter = count_terms([posts.iloc[:1], posts.iloc[1:]])
+    path = str(tmp_path / "counter.pickle")
+    counter.save(path)
+
+    counter = TermCounter.load(path)
+    counter.update(pd.DataFrame({"id": [4], "post_text": ["World peace"]}))
+    assert counter.frequencies()["world"] == 2
+    assert counter.last_id == 4
+
+
+def test_multiprocess_counting():
+    posts = make_posts()
+    chunks = [posts.iloc[i:i + 1] for i in range(len(posts))] * 4
+    counter = count_terms(chunks, by="user", processes=2)
+    assert counter.frequencies(10)["hello"] == 8
+    assert counter.posts == 12
+
+
+def test_count_exported_terms(tmp_path):
+    root = str(tmp_path)
+    rows = [
+        (1, "Hello, world!", 10, None, 0, 0, 0, datetime(2025, 1, 19)),
+        (2, "hello again 2025", 10, None, 0, 0, 0, datetime(2025, 1, 20)),
+    ]
+    export.write_batch(root, "posts", export.records_to_batch(rows, export.POSTS_SCHEMA))
+    counter = count_exported_terms(root, stopwords={"world"})
+    assert counter.frequencies() == {"hello": 2, "again": 1}
+
+    # exported later with a lower id, counted once
+    late = [(0, "Hello late", 10, None, 0, 0, 0, datetime(2025, 1, 18))]
+    export.write_batch(root, "posts", export.records_to_batch(late, export.POSTS_SCHEMA))
+    counter = count_exported_terms(root, counter=counter)
+    assert counter.frequencies() == {"hello": 3, "again": 1, "late": 1}
+    assert count_exported_terms(root, counter=counter).posts == 3
@@ -0,0 +1,193 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import aiohttp
+import pytest
+
+from api import ApiServer, ResponseCache, decode_cursor, encode_cursor
+from bench import bench_api
+
+
+class Record(dict):
+    """Mimics asyncpg.Record: iterates over values, indexable by name."""
+
+    def __iter__(self):
+        return iter(self.values())
+
+
+class FakeDatabase:
+    """Users 1 ("alice") and 2 ("bob"), posts of alice, bob follows alice."""
+
+    def __init__(self):
+        start = datetime(2025, 1, 1)
+        self.users = {
+            "alice": Record(id=1, username="alice", name="Alice"),
+            "bob": Record(id=2, username="bob", name="Bob"),
+        }
+        self.posts = [
+            Record(id=i, owner="alice", post_text=f"post {i}",
+                   creation_date=start + timedelta(hours=i % 3), likes=i)
+            for i in range(1, 8)
+        ]
+        self.followers = {"alice": [Record(id=2, username="bob", name="Bob")]}
+        self.changes = []
+        self.queries = 0
+
+    async def get_user(self, username):
+        self.queries += 1
+        return self.users.get(username)
+
+    async def get_user_posts(self, username, since=None, until=None, before=None, limit=20):
+        return await self.get_posts_by_date(since, until, before, limit)
+
+    async def get_posts_by_date(self, since=None, until=None, before=None, limit=20):
+        self.queries += 1
+        rows = sorted(
+            self.posts, key=lambda p: (p["creation_date"], p["id"]), reverse=True
+        )
+        if before:
+            rows = [p for p in rows if (p["creation_date"], p["id"]) < before]
+        if since:
+            rows = [p for p in rows if p["creation_date"] >= since]
+        return rows[:limit]
+
+    async def get_followers(self, username, after_id=None, limit=100):
+        self.queries += 1
+        rows = self.followers.get(username, [])
+        return [r for r in rows if after_id is None or r["id"] > after_id][:limit]
+
+    async def search_posts(self, query, limit=20, after=None, **filters):
+        self.queries += 1
+        found = [p for p in self.posts if query in p["post_text"]]
+        return [Record(id=p["id"], rank=0.5) for p in found][:limit]
+
+    async def get_change_feed_head(self):
+        return (0, 0)
+
+    async def fetch_changes(self, after=(0, 0), limit=500, entities=None):
+        return [c for c in self.changes if (c["txid"], c["id"]) > after][:limit]
+
+    def change(self, entity, entity_id, payload):
+        self.changes.append(Record(
+            id=len(self.changes) + 1, txid=1000, entity=entity, op="U",
+            entity_id=entity_id, payload=json.dumps(payload), created_at=datetime.now(),
+        ))
+
+
+@asynccontextmanager
+async def running_api():
+    db = FakeDatabase()
+    server = ApiServer(db, page_size=3, poll_interval=0.01)
+    await server.start(port=0)
+    client = aiohttp.ClientSession()
+    url = f"http://127.0.0.1:{server.port}"
+
+    async def get(path):
+        async with client.get(url + path) as response:
+            body = await response.read()
+        return response.status, json.loads(body), response.headers.get("x-cache")
+
+    try:
+        yield db, server, get, url
+    finally:
+        await client.close()
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_keyset_pages():
+    async with running_api() as (db, server, get, _):
+        status, page, _ = await get("/users/alice/posts")
+        assert status == 200
+        ids = [p["id"] for p in page["items"]]
+        while page["next"]:
+            _, page, _ = await get(f"/users/alice/posts?cursor={page['next']}")
+            ids += [p["id"] for p in page["items"]]
+        # newest first, every post once
+        assert ids == [5, 2, 7, 4, 1, 6, 3]
+        assert page["items"][-1]["creation_date"] == "2025-01-01T00:00:00"
+
+        _, page, _ = await get("/users/alice/followers")
+        bob = {"id": 2, "username": "bob", "name": "Bob"}
+        assert page == {"items": [bob], "next": None}
+        _, page, _ = await get("/search?q=post%207")
+        assert page == {"items": [{"id": 7, "rank": 0.5}], "next": None}
+        assert (await get("/users/nobody/posts"))[0] == 404
+        assert (await get("/posts?cursor=garbage"))[0] == 400
+        assert (await get("/posts?limit=10000"))[0] == 400
+        assert (await get("/search"))[0] == 400
+        assert (await get("/nothing"))[0] == 404
+
+
+@pytest.mark.asyncio
+async def test_cache_is_invalidated_by_changes():
+    async with running_api() as (db, server, get, _):
+        assert (await get("/users/alice"))[2] == "MISS"
+        assert (await get("/users/alice"))[2] == "HIT"
+        # parameters in another order are the same request
+        await get("/posts?limit=2&since=2025-01-01")
+        assert (await get("/posts?since=2025-01-01&limit=2"))[2] == "HIT"
+        queries = db.queries
+
+        # a post of alice makes her posts and the global lists stale, not her profile
+        db.posts.append(Record(id=8, owner="alice", post_text="post 8",
+                               creation_date=datetime(2025, 2, 1), likes=0))
+        db.change("post", 8, {"id": 8, "owner_id": 1})
+        await asyncio.sleep(0.1)
+        assert (await get("/users/alice"))[2] == "HIT"
+        status, page, cache = await get("/posts?since=2025-01-01&limit=2")
+        assert cache == "MISS"
+        assert page["items"][0]["id"] == 8
+        assert db.queries == queries + 1
+
+        db.users["alice"]["name"] = "Alice B."
+        db.change("user", 1, {"id": 1, "username": "alice"})
+        await asyncio.sleep(0.1)
+        _, user, cache = await get("/users/alice")
+        assert (user["name"], cache) == ("Alice B.", "MISS")
+
+        stats = (await get("/stats"))[1]
+        assert stats["routes"]["user"]["requests"] == 4
+        assert stats["cache"]["hits"] == 3
+        assert stats["routes"]["posts"]["p99_ms"] >= stats["routes"]["posts"]["p50_ms"]
+
+
+def test_response_cache_bounds():
+    now = [0.0]
+    cache = ResponseCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", b"1", ["posts"])
+    cache.put("b", b"2", ["user:1"])
+    assert cache.get("a") == b"1"
+    # least recently used goes first
+    cache.put("c", b"3", ["user:1"])
+    assert cache.get("b") is None
+    assert cache.invalidate(["user:1"]) == 1
+    assert len(cache) == 1
+
+    # read before the invalidation, may be stale
+    version = cache.version
+    cache.invalidate(["posts"])
+    cache.put("d", b"4", [], version)
+    assert cache.get("d") is None
+
+    cache.put("e", b"5", [])
+    now[0] = 11
+    assert cache.get("e") is None
+    assert len(cache) == 0
+
+
+def test_cursors():
+    cursor = encode_cursor([datetime(2025, 1, 2, 3, 4), 42])
+    assert decode_cursor(cursor) == ["2025-01-02T03:04:00", 42]
+
+
+@pytest.mark.asyncio
+async def test_bench_api():
+    async with running_api() as (_, _, _, url):
+        paths = ["/users/alice", "/posts"]
+        results = await bench_api(url, paths, requests=40, concurrency=4)
+        assert [r.name for r in results] == ["/users/alice", "/posts", "all"]
+        assert results[-1].rows == 40
+        assert "requests/s" in results[-1].summary()
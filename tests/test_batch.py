@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from entities import Follower, Post, PostBatch, FollowerBatch, InteractionBatch
+
+
+def make_post(post_id, is_repost=False):
+    return Post(
+        post_id=post_id,
+        owner="owner",
+        reply_to="replied",
+        timestamp=datetime(2025, 1, 19),
+        is_repost=is_repost,
+        who_reposted="reposter" if is_repost else None,
+        text=f"post {post_id}",
+        likes=post_id * 10,
+    )
+
+
+def test_post_batch_dedup():
+    batch = PostBatch()
+    assert batch.append(make_post(1))
+    assert not batch.append(make_post(1))
+    assert batch.append(make_post(1, is_repost=True))
+    assert batch.append(make_post(2))
+    assert len(batch) == 3
+    assert list(batch.post_id) == [1, 1, 2]
+    assert list(batch.likes) == [10, 10, 20]
+    assert batch.usernames() == ["owner", "replied", "reposter"]
+
+
+def test_post_batch_rows():
+    batch = PostBatch([make_post(1), make_post(2, is_repost=True)])
+    post = batch[1]
+    assert post.post_id == 2
+    assert post.who_reposted == "reposter"
+    assert [p.text for p in batch] == ["post 1", "post 2"]
+
+
+def test_post_batch_entities():
+    post = make_post(1)
+    post.mentions = ["someone"]
+    post.hashtags = ["maga"]
+    post.links = [("https://example.com/a", "example.com")]
+    repost = make_post(1, is_repost=True)
+    repost.hashtags = ["maga"]
+    batch = PostBatch([post, repost, make_post(2)])
+    assert "someone" in batch.usernames()
+    mentions, hashtags, links = batch.entity_rows()
+    assert mentions == [(1, "someone")]
+    assert hashtags == [(1, "maga", datetime(2025, 1, 19))]
+    assert links == [(1, "https://example.com/a", "example.com")]
+    assert batch.entity_rows([2]) == ([], [], [])
+    assert batch[0].hashtags == ["maga"]
+
+
+def test_post_batch_media():
+    post = make_post(1)
+    post.media = ["https://cdn/a.jpg", "https://cdn/b.mp4"]
+    post.avatar_url = "https://cdn/avatar.jpg"
+    batch = PostBatch([post, make_post(2)])
+    media, avatars = batch.media_rows()
+    assert media == [(1, "https://cdn/a.jpg", 0), (1, "https://cdn/b.mp4", 1)]
+    assert avatars == [("owner", "https://cdn/avatar.jpg")]
+    assert batch.media_rows([1]) == ([], [])
+    assert batch.media_urls() == [
+        "https://cdn/a.jpg", "https://cdn/avatar.jpg", "https://cdn/b.mp4"
+    ]
+    assert batch[0].media == post.media
+
+
+def test_follower_batch():
+    batch = FollowerBatch()
+    assert batch.append(Follower("user", username="a", name="A"))
+    assert not batch.append(Follower("user", username="a", name="A"))
+    swapped = Follower("user", username="a", name="A")
+    swapped.swap_direction()
+    assert batch.append(swapped)
+    assert len(batch) == 2
+    assert batch.username == ["a", "user"]
+    assert batch[1].who_to_follow == "a"
+
+
+def test_interaction_batch():
+    accounts = FollowerBatch(
+        [
+            Follower("owner", username="fan", name="Fan"),
+            Follower("owner", username="other"),
+        ]
+    )
+    batch = InteractionBatch()
+    batch.extend(1, accounts, "liked")
+    batch.extend(1, accounts, "liked")
+    batch.extend(1, accounts, "reposted")
+    assert len(batch) == 4
+    assert list(batch)[:2] == [(1, "fan", "liked"), (1, "other", "liked")]
+    assert batch.name[:2] == ["Fan", None]
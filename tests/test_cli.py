@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import cli
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_settings_precedence(tmp_path):
+    config = tmp_path / "crawl.toml"
+    config.write_text('browsers = 2\nthread_posts = 10\ndsn = "sqlite:///file.db"\n')
+    args = cli.build_parser().parse_args(
+        ["--config", str(config), "crawl", "--thread-posts", "20"]
+    )
+    cli.load_settings(args, {"TS_BROWSERS": "5", "TS_FOLLOWER_BUDGET": "300"})
+    assert args.thread_posts == 20
+    assert args.browsers == "2"
+    assert args.follower_budget == 300
+    assert args.dsn == "sqlite:///file.db"
+    assert args.browser_max_age == 4 * 3600
+    assert args.login_username is None
+
+    config.write_text("unknown = 1\n")
+    with pytest.raises(ValueError):
+        cli.load_settings(cli.build_parser().parse_args(["--config", str(config), "bench"]))
+
+
+def test_no_heavy_imports():
+    code = (
+        "import logging, sys, cli, entities, sinks, parser\n"
+        "heavy = {'asyncpg', 'pyquery', 'pandas', 'pyarrow'} & set(sys.modules)\n"
+        "assert not heavy, heavy\n"
+        "assert not logging.getLogger().handlers\n"
+    )
+    env = {k: v for k, v in os.environ.items() if k not in ("DSN", "TS_USERNAME")}
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+
+
+def test_bench(tmp_path, capsys):
+    cli.main(
+        ["--env-file", "", "bench", "--dsn", f"sqlite://{tmp_path}/bench.db", "--posts", "50"]
+    )
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split(":")[0] for line in lines] == ["insert", "unchanged", "update"]
@@ -1,11 +1,20 @@
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 
+import asyncpg
 import pytest
 from dotenv import load_dotenv
 
 from database import Database
-from entities import Post, User
+from entities import (
+    Follower,
+    FollowerBatch,
+    InteractionBatch,
+    Post,
+    PostBatch,
+    User,
+)
+from sinks import MediaFile, SQLiteSink, sync
 
 # load database credentials from .env file
 load_dotenv()
@@ -102,3 +111,474 @@ async def test_save_user_update(sample_user: User):
         assert user is not None
         assert user["name"] == "Updated Test User"
         assert user["bio"] == "Updated test bio"
+
+
+@pytest.mark.asyncio
+async def test_search_posts(sample_post: Post):
+    sample_post.text = "Searching for the unmistakable keyword"
+    async with Database(dsn) as database:
+        await database.save_post(sample_post)
+
+        found = await database.search_posts("unmistakable keywords")
+        assert sample_post.post_id in [row["id"] for row in found]
+        assert found[0]["rank"] > 0
+
+        page = await database.search_posts(
+            "unmistakable", after=(found[-1]["rank"], found[-1]["id"])
+        )
+        assert sample_post.post_id not in [row["id"] for row in page]
+
+        found = await database.search_posts("mistakab", substring=True, user="testuser")
+        assert sample_post.post_id in [row["id"] for row in found]
+
+        found = await database.search_posts("unmistakable", user="nobody")
+        assert found == []
+
+
+@pytest.mark.asyncio
+async def test_save_posts_batch(sample_post: Post):
+    reply = Post(
+        post_id=sample_post.post_id + 1,
+        owner="testuser",
+        reply_to="replieduser",
+        timestamp=datetime.now(),
+        text="This is a reply",
+    )
+    batch = PostBatch([sample_post, reply])
+    async with Database(dsn) as database:
+        await database.save_posts(batch)
+        async with database._pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT id, reply_to_id FROM posts WHERE id = ANY($1::bigint[])",
+                list(batch.post_id),
+            )
+        assert len(rows) == 2
+
+
+@pytest.mark.asyncio
+async def test_save_followers_batch():
+    batch = FollowerBatch(
+        [
+            Follower("testuser", username="follower1", name="Follower One"),
+            Follower("testuser", username="follower2", name="Follower Two"),
+        ]
+    )
+    async with Database(dsn) as database:
+        edges = await database.save_followers(batch)
+        assert len(edges) == 2
+        async with database._pool.acquire() as conn:
+            count = await conn.fetchval(
+                "SELECT count(*) FROM followers WHERE user_id = $1", edges[0][0]
+            )
+        assert count >= 2
+
+
+@pytest.mark.asyncio
+async def test_change_feed(sample_post: Post):
+    from changefeed import ChangeFeedConsumer
+
+    async with Database(dsn) as database:
+        async with ChangeFeedConsumer(database, "test-consumer", ["post"]) as feed:
+            await feed.seek_to_end()
+            sample_post.likes += 1
+            await database.save_post(sample_post)
+
+            changes = await feed.fetch()
+            assert sample_post.post_id in [c.entity_id for c in changes]
+            assert changes[-1].payload["likes"] == sample_post.likes
+            await feed.commit()
+            assert await database.get_consumer_offset("test-consumer") == feed.offset
+
+            # unchanged upsert is not published
+            await database.save_post(sample_post)
+            assert await feed.fetch() == []
+
+
+@pytest.mark.asyncio
+async def test_sync_keeps_parsed_users(tmp_path):
+    path = str(tmp_path / "crawl.db")
+    async with SQLiteSink(path) as sink:
+        # seen as a follower by this crawler, crawled by another one
+        await sink.save_followers(
+            FollowerBatch([Follower("sync_owner", "sync_fan", None)])
+        )
+        await sink.mark_user_error("sync_owner")
+
+    async with Database(dsn) as database:
+        await database.save_followers(
+            FollowerBatch([Follower("sync_owner", "sync_fan", None)])
+        )
+        await database.mark_user_parsed("sync_fan")
+        await database.mark_user_parsed("sync_owner")
+        await sync(database, path)
+        async with database._pool.acquire() as conn:
+            statuses = dict(
+                await conn.fetch(
+                    """
+                    SELECT username, parser_status::text FROM users
+                    WHERE username IN ('sync_owner', 'sync_fan')
+                    """
+                )
+            )
+    assert statuses == {"sync_owner": "parsed", "sync_fan": "parsed"}
+
+
+@pytest.mark.asyncio
+async def test_prune_change_feed(sample_post: Post):
+    async with Database(dsn) as database:
+        sample_post.likes += 1
+        await database.save_post(sample_post)
+        await database.set_consumer_offset(
+            "test-pruner", await database.get_change_feed_head()
+        )
+        assert await database.prune_change_feed() >= 0
+        async with database._pool.acquire() as conn:
+            left = await conn.fetchval(
+                """
+                SELECT count(*) FROM change_feed
+                WHERE (txid, id) <= (
+                    SELECT last_txid, last_id FROM change_feed_offsets
+                    ORDER BY last_txid, last_id
+                    LIMIT 1
+                )
+                """
+            )
+        assert left == 0
+
+
+@pytest.mark.asyncio
+async def test_iter_inserted_posts():
+    async with Database(dsn) as database:
+        offset = start = await database.get_change_feed_horizon()
+        # inserted later, but older than posts inserted before
+        await database.save_posts(
+            PostBatch(
+                Post(post_id=post_id, text="late", owner="testuser", timestamp=datetime.now())
+                for post_id in (800_002, 800_001)
+            )
+        )
+        ids = []
+        async for rows, offset in database.iter_inserted_posts(offset):
+            ids += [row["id"] for row in rows]
+        assert {800_001, 800_002} <= set(ids)
+        rows = [rows async for rows, _ in database.iter_inserted_posts(offset)]
+        assert rows == []
+
+        # inserts seen by a scan are not read again from the feed
+        scanned = []
+        async for rows, snapshot in database.iter_posts_snapshot():
+            scanned += [row["id"] for row in rows]
+        assert {800_001, 800_002} <= set(scanned)
+        ids = []
+        async for rows, _ in database.iter_inserted_posts(start, seen=snapshot):
+            ids += [row["id"] for row in rows]
+        assert not {800_001, 800_002} & set(ids)
+
+
+@pytest.mark.asyncio
+async def test_engagement_snapshots(sample_post: Post):
+    async with Database(dsn) as database:
+        await database.save_post(sample_post)
+        before = len(await database.get_engagement_curve(sample_post.post_id))
+
+        # unchanged counters are not stored again
+        await database.save_post(sample_post)
+        curve = await database.get_engagement_curve(sample_post.post_id)
+        assert len(curve) == before
+
+        sample_post.likes += 100
+        await database.save_posts(PostBatch([sample_post]))
+        curve = await database.get_engagement_curve(sample_post.post_id)
+        assert len(curve) == before + 1
+        assert curve[-1]["likes"] == sample_post.likes
+
+        top = await database.get_top_growing_posts(curve[-1]["observed_at"])
+        assert sample_post.post_id in [row["post_id"] for row in top]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_rows_are_not_rewritten(sample_post: Post, sample_user: User):
+    async with Database(dsn) as database:
+        sample_post.likes += 1
+        await database.save_posts(PostBatch([sample_post]))
+        assert database.write_stats.written["posts"] == 1
+
+        # skipped by the in-process cache
+        await database.save_posts(PostBatch([sample_post]))
+        assert database.write_stats.skipped("posts") == 1
+
+    # a new process does not know the row, the database guard skips it
+    async with Database(dsn) as database:
+        await database.save_posts(PostBatch([sample_post]))
+        await database.save_user(sample_user)
+        await database.save_user(sample_user)
+        assert database.write_stats.written["posts"] == 0
+        assert database.write_stats.skipped("users") >= 1
+
+
+@pytest.mark.asyncio
+async def test_interactions_are_not_duplicated(sample_post: Post):
+    async with Database(dsn) as database:
+        await database.save_post(sample_post)
+        interactions = InteractionBatch()
+        interactions.append(sample_post.post_id, "test_liker", "liked", "Liker")
+        interactions.append(sample_post.post_id, "test_reposter", "reposted")
+        await database.save_interactions(interactions)
+        await database.save_interactions(interactions)
+
+        async with database._pool.acquire() as conn:
+            count = await conn.fetchval(
+                """
+                SELECT count(*) FROM post_interactions i JOIN users u ON u.id = i.user_id
+                WHERE i.post_id = $1 AND u.username IN ('test_liker', 'test_reposter')
+                """,
+                sample_post.post_id,
+            )
+        assert count == 2
+        assert database.write_stats.skipped("interactions") >= 2
+
+
+@pytest.mark.asyncio
+async def test_harvest_checkpoints():
+    from sinks import HarvestCheckpoint
+
+    async with Database(dsn) as database:
+        checkpoint = HarvestCheckpoint("test_star", "followers", "fan1", 500)
+        await database.save_harvest_checkpoint(checkpoint)
+        stored = await database.get_harvest_checkpoint("test_star", "followers")
+        assert (stored.cursor, stored.harvested, stored.finished) == ("fan1", 500, False)
+        assert "test_star" in [
+            c.username for c in await database.get_unfinished_harvests()
+        ]
+
+        checkpoint.finished = True
+        await database.save_harvest_checkpoint(checkpoint)
+        assert "test_star" not in [
+            c.username for c in await database.get_unfinished_harvests()
+        ]
+
+
+@pytest.mark.asyncio
+async def test_get_thread():
+    def post(post_id, parent_id):
+        return Post(
+            post_id=post_id,
+            text=f"thread post {post_id}",
+            owner="testuser",
+            timestamp=datetime.now(),
+            parent_id=parent_id,
+            root_id=900_001,
+        )
+
+    async with Database(dsn) as database:
+        await database.save_posts(
+            PostBatch(
+                [
+                    post(900_001, None),
+                    post(900_002, 900_001),
+                    post(900_003, 900_001),
+                    post(900_004, 900_002),
+                ]
+            )
+        )
+        # an unknown parent does not erase a known one
+        await database.save_posts(PostBatch([post(900_004, None)]))
+
+        thread = await database.get_thread(900_001)
+        assert [row["id"] for row in thread] == [900_001, 900_002, 900_004, 900_003]
+        assert [row["depth"] for row in thread] == [0, 1, 2, 1]
+        conversation = await database.get_conversation(900_001)
+        assert sorted(row["id"] for row in conversation) == sorted(r["id"] for r in thread)
+
+
+@pytest.mark.asyncio
+async def test_post_entities():
+    created = datetime(2025, 3, 1, 12)
+    post = Post(
+        post_id=900_101,
+        text="hello @test_mentioned #Tag example.com",
+        owner="testuser",
+        timestamp=created,
+        mentions=["test_mentioned"],
+        hashtags=["tag"],
+        links=[("https://www.example.com/a", "example.com")],
+    )
+
+    async with Database(dsn) as database:
+        await database.save_posts(PostBatch([post]))
+
+        mentioning = await database.get_posts_mentioning("test_mentioned")
+        assert [row["id"] for row in mentioning] == [900_101]
+        tagged = await database.get_posts_with_hashtag("#Tag", since=created)
+        assert [row["id"] for row in tagged] == [900_101]
+        top = await database.get_top_hashtags(created, created + timedelta(days=1))
+        assert ("tag", 1) in [(row["tag"], row["posts"]) for row in top]
+        linking = await database.get_posts_linking("www.example.com")
+        assert linking[0]["urls"] == ["https://www.example.com/a"]
+
+
+@pytest.mark.asyncio
+async def test_user_daily_stats():
+    def post(post_id, likes, reply_to=None):
+        return Post(
+            post_id=post_id,
+            text=f"daily post {post_id}",
+            owner="test_daily_user",
+            reply_to=reply_to,
+            timestamp=datetime(2025, 2, 1, 10),
+            likes=likes,
+        )
+
+    async with Database(dsn) as database:
+        await database.save_posts(
+            PostBatch([post(900_201, 10), post(900_202, 20, reply_to="testuser")])
+        )
+        # updated counters replace the old ones in the rollup
+        await database.save_posts(PostBatch([post(900_201, 30)]))
+
+        stats = await database.get_user_daily_stats("test_daily_user")
+        day = next(row for row in stats if row["day"] == datetime(2025, 2, 1).date())
+        assert (day["posts"], day["replies_sent"], day["likes"]) == (2, 1, 50)
+        assert day["avg_likes"] == 25
+        assert day["reply_ratio"] == 0.5
+
+        active = await database.get_most_active_users(
+            datetime(2025, 2, 1).date(), datetime(2025, 2, 2).date()
+        )
+        assert "test_daily_user" in [row["username"] for row in active]
+
+
+@pytest.mark.asyncio
+async def test_archive_posts():
+    def post(likes):
+        return Post(
+            post_id=900_301,
+            text="archived post",
+            owner="testuser",
+            timestamp=datetime(2000, 1, 1),
+            likes=likes,
+        )
+
+    async with Database(dsn) as database:
+        await database.save_posts(PostBatch([post(1)]))
+        assert await database.archive_posts(datetime(2000, 1, 2)) >= 1
+        offset = await database.get_change_feed_horizon()
+
+        # a re-crawl updates the archived row instead of re-inserting it
+        await database.save_posts(PostBatch([post(5)]))
+        async with database._pool.acquire() as conn:
+            rows = await conn.fetch("SELECT likes FROM all_posts WHERE id = 900301")
+            hot = await conn.fetchval("SELECT count(*) FROM posts WHERE id = 900301")
+        assert [row["likes"] for row in rows] == [5]
+        assert hot == 0
+
+        changes = await database.fetch_changes(offset, entities=["post"])
+        updates = [c for c in changes if c["entity_id"] == 900_301]
+        assert [c["op"] for c in updates] == ["U"]
+
+        # both tiers are searched
+        found = await database.search_posts("archived", user="testuser")
+        assert 900_301 in [row["id"] for row in found]
+        found = await database.search_posts("rchived po", substring=True)
+        assert 900_301 in [row["id"] for row in found]
+
+
+@pytest.mark.asyncio
+async def test_post_media():
+    post = Post(
+        post_id=900_401,
+        text="post with a picture",
+        owner="testuser",
+        timestamp=datetime(2025, 3, 1),
+        media=["https://cdn.example.com/900401.jpg"],
+        avatar_url="https://cdn.example.com/testuser.jpg",
+    )
+    sha256 = "ab" * 32
+
+    async with Database(dsn) as database:
+        await database.save_posts(PostBatch([post]))
+        assert await database.get_downloaded_urls(post.media) == set()
+        await database.save_media_files(
+            [MediaFile(post.media[0], sha256, 10, "image/jpeg", "ab/ab/x.jpg")]
+        )
+        assert await database.get_downloaded_urls(post.media) == set(post.media)
+
+        rows = await database.get_post_media(900_401)
+        assert [(r["url"], r["sha256"], r["path"]) for r in rows] == [
+            (post.media[0], sha256, "ab/ab/x.jpg")
+        ]
+
+
+@pytest.mark.asyncio
+async def test_near_duplicates():
+    text = "Call your senators today and demand a full audit of the vote in every county"
+
+    def post(post_id, text):
+        return Post(
+            post_id=post_id,
+            text=text,
+            owner="testuser",
+            timestamp=datetime(2025, 4, 1, 12),
+        )
+
+    async with Database(dsn) as database:
+        await database.save_posts(
+            PostBatch(
+                [
+                    post(900_501, text),
+                    post(900_502, text + "!!"),
+                    post(900_503, "Something else entirely, about the weather today"),
+                ]
+            )
+        )
+        duplicates = await database.get_near_duplicates(900_501)
+        assert [post_id for post_id, _ in duplicates] == [900_502]
+        assert duplicates[0][1] >= 0.8
+        mates = await database.get_bucket_mates(await database.get_signature(900_501))
+        assert {900_501, 900_502} <= {row["post_id"] for row in mates}
+
+        clusters = await database.cluster_posts(
+            datetime(2025, 4, 1), datetime(2025, 4, 2)
+        )
+        assert [900_501, 900_502] in clusters
+
+
+@pytest.mark.asyncio
+async def test_query_api_reads(sample_user: User):
+    posts = [
+        Post(
+            post_id=900_601 + i,
+            text=f"Query API post {i}",
+            owner="testuser",
+            timestamp=datetime(2025, 5, 1) + timedelta(hours=i),
+        )
+        for i in range(5)
+    ]
+    async with Database(dsn) as database:
+        await database.save_user(sample_user)
+        await database.save_posts(PostBatch(posts))
+        await database.save_followers(
+            FollowerBatch([Follower("testuser", username="apifollower", name="F")])
+        )
+
+    async with Database(dsn, read_only=True) as database:
+        user = await database.get_user("testuser")
+        assert user["name"] == sample_user.name
+        assert await database.get_user("nobody") is None
+
+        since, until = datetime(2025, 5, 1), datetime(2025, 5, 2)
+        first = await database.get_user_posts("testuser", since, until, limit=3)
+        assert [r["id"] for r in first] == [900_605, 900_604, 900_603]
+        last = first[-1]
+        rest = await database.get_posts_by_date(
+            since, until, before=(last["creation_date"], last["id"])
+        )
+        assert [r["id"] for r in rest] == [900_602, 900_601]
+
+        followers = await database.get_followers("testuser")
+        assert "apifollower" in [r["username"] for r in followers]
+        after = await database.get_followers("testuser", after_id=followers[-1]["id"])
+        assert after == []
+
+        with pytest.raises(asyncpg.ReadOnlySQLTransactionError):
+            await database.save_user(sample_user)
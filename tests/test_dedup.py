@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+
+import dedup
+
+CAMPAIGN = (
+    "Call your senators today and demand a full audit of the vote in every county!"
+)
+
+
+def jaccard(a, b):
+    def shingles(text):
+        text = dedup.normalize(text)
+        return {text[i:i + dedup.SHINGLE] for i in range(len(text) - dedup.SHINGLE + 1)}
+
+    a, b = shingles(a), shingles(b)
+    return len(a & b) / len(a | b)
+
+
+def test_signatures():
+    texts = [
+        CAMPAIGN,
+        "too short",
+        CAMPAIGN.upper() + " https://example.com/?ref=1",
+        CAMPAIGN.replace("senators", "representatives"),
+        "The weather is lovely today, let's all go to the beach",
+    ]
+    kept, sigs = dedup.signatures(texts)
+    assert kept == [0, 2, 3, 4]
+    assert sigs.shape == (4, dedup.NUM_PERM)
+    scores = dedup.similarity(sigs[0], sigs)
+    # case and links are ignored
+    assert scores[1] == 1
+    assert abs(scores[2] - jaccard(texts[0], texts[3])) < 0.15
+    assert scores[3] < 0.1
+    # signatures do not depend on the batch
+    assert (dedup.signatures([texts[3]])[1][0] == sigs[2]).all()
+    assert (dedup.from_bytes([dedup.to_bytes(s) for s in sigs]) == sigs).all()
+
+
+def test_cluster():
+    rng = random.Random(1)
+    words = [f"word{i}" for i in range(2000)]
+    texts, expected = [], []
+    for campaign in range(20):
+        text = " ".join(rng.choice(words) for _ in range(30))
+        expected.append(list(range(len(texts), len(texts) + 5)))
+        texts += [f"{text} {variant}!" for variant in range(5)]
+    texts += [" ".join(rng.choice(words) for _ in range(30)) for _ in range(1000)]
+
+    kept, sigs = dedup.signatures(texts)
+    clusters = dedup.cluster(kept, sigs)
+    assert sorted(clusters) == expected
+
+    keys = dedup.band_keys(sigs)
+    assert keys.shape == (len(texts), dedup.BANDS)
+    assert keys.dtype == np.int64
@@ -0,0 +1,142 @@
+from datetime import datetime
+
+import pyarrow.dataset as ds
+import pytest
+
+import export
+from database import snapshot_visible
+
+
+def post_row(post_id, text, day):
+    return {
+        "id": post_id,
+        "post_text": text,
+        "owner_id": 1,
+        "reply_to_id": None,
+        "likes": 10,
+        "reposts": 2,
+        "replies": 3,
+        "creation_date": datetime(2025, 1, day, 12, 30),
+    }
+
+
+class Record(dict):
+    """Mimics asyncpg.Record: iterates over values, indexable by name."""
+
+    def __iter__(self):
+        return iter(self.values())
+
+
+class FakeDatabase:
+    """
+    Posts, and a change feed with one insert per post, the i-th in
+    transaction i at offset (i, i). Scans see every committed transaction
+    unless `snapshot` is set.
+    """
+
+    def __init__(self, posts):
+        self.posts = []
+        self.feed = []
+        self.offsets = {}
+        self.snapshot = None
+        for p in posts:
+            self.insert(p)
+
+    def insert(self, post):
+        self.posts.append(Record(post))
+        txid = len(self.feed) + 1
+        self.feed.append(((txid, txid), post["id"]))
+
+    async def iter_posts_snapshot(self, chunk_size=100_000):
+        snapshot = self.snapshot or f"{len(self.feed) + 1}:{len(self.feed) + 1}:"
+        visible = {
+            post_id
+            for (txid, _), post_id in self.feed
+            if snapshot_visible(txid, snapshot)
+        }
+        rows = sorted((p for p in self.posts if p["id"] in visible), key=lambda p: p["id"])
+        for i in range(0, max(len(rows), 1), 2):
+            yield rows[i:i + 2], snapshot
+
+    async def iter_inserted_posts(self, after, chunk_size=10_000, seen=None):
+        changes = [c for c in self.feed if c[0] > after]
+        for i in range(0, len(changes), 2):
+            ids = {
+                post_id
+                for (txid, _), post_id in changes[i:i + 2]
+                if not (seen and snapshot_visible(txid, seen))
+            }
+            yield [p for p in self.posts if p["id"] in ids], changes[i:i + 2][-1][0]
+
+    async def get_change_feed_horizon(self):
+        return (1, 0)
+
+    async def set_consumer_offset(self, consumer, offset):
+        self.offsets[consumer] = offset
+
+
+def test_records_to_batch():
+    rows = [Record(post_row(1, "a", 19)), Record(post_row(2, "b", 20))]
+    batch = export.records_to_batch(rows, export.POSTS_SCHEMA)
+    assert batch.num_rows == 2
+    assert batch.column("post_text").to_pylist() == ["a", "b"]
+
+    empty = export.records_to_batch([], export.POSTS_SCHEMA)
+    assert empty.num_rows == 0
+
+
+@pytest.mark.asyncio
+async def test_incremental_posts_export(tmp_path):
+    root = str(tmp_path)
+    db = FakeDatabase([post_row(i, f"post {i}", 18 + i % 3) for i in range(1, 6)])
+
+    state = export.load_state(root)
+    assert await export.export_posts(db, root, state) == 5
+    assert export.load_state(root)["posts_feed"] == [6, 0]
+    assert db.offsets["export"] == (6, 0)
+    # nothing new since the last export
+    assert await export.export_posts(db, root, export.load_state(root)) == 0
+
+    db.insert(post_row(6, "post 6", 20))
+    # older history crawled later has a lower id
+    db.insert(post_row(0, "post 0", 20))
+    assert await export.export_posts(db, root, export.load_state(root)) == 2
+
+    table = export.read_table(root, "posts", columns=["id", "day"])
+    assert sorted(table.column("id").to_pylist()) == [0, 1, 2, 3, 4, 5, 6]
+
+    day = datetime(2025, 1, 20).date()
+    table = export.read_table(root, "posts", filter=ds.field("day") == day)
+    assert sorted(table.column("id").to_pylist()) == [0, 2, 5, 6]
+
+    batches = list(export.iter_batches(root, "posts", ["id"], batch_size=2))
+    assert sum(b.num_rows for b in batches) == 7
+
+
+@pytest.mark.asyncio
+async def test_export_upgrades_id_watermark(tmp_path):
+    root = str(tmp_path)
+    db = FakeDatabase([post_row(i, f"post {i}", 19) for i in (2, 3)])
+    batch = export.records_to_batch(db.posts, export.POSTS_SCHEMA)
+    export.write_batch(root, "posts", batch)
+    export.save_state(root, {"posts": 3, "users": 0, "followers": ["1970-01-01", 0, 0]})
+
+    # post 1 was skipped by the id watermark, the others are not written twice
+    db.insert(post_row(1, "post 1", 19))
+    assert await export.export_posts(db, root, export.load_state(root)) == 1
+    assert "posts" not in export.load_state(root)
+    table = export.read_table(root, "posts", columns=["id"])
+    assert sorted(table.column("id").to_pylist()) == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_posts_committed_during_the_scan_are_exported_once(tmp_path):
+    root = str(tmp_path)
+    db = FakeDatabase([post_row(i, f"post {i}", 19) for i in range(1, 6)])
+    # transaction 4 was still running when the scan's snapshot was taken,
+    # 5 had already committed
+    db.snapshot = "4:6:4"
+    assert await export.export_posts(db, root, export.load_state(root)) == 5
+    table = export.read_table(root, "posts", columns=["id"])
+    assert sorted(table.column("id").to_pylist()) == [1, 2, 3, 4, 5]
+    assert await export.export_posts(db, root, export.load_state(root)) == 0
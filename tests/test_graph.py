@@ -0,0 +1,76 @@
+import numpy as np
+
+from graph import FollowerGraph
+
+
+def make_graph(path=None):
+    # rows of the followers table: (user_id, follower)
+    edges = [(1, 2), (1, 3), (2, 3), (3, 4), (1, 4), (1, 2)]
+    graph = FollowerGraph(path)
+    for user_id, follower_id in edges:
+        graph.add_edge(user_id, follower_id)
+    graph.merge()
+    return graph
+
+
+def test_adjacency():
+    graph = make_graph()
+    assert graph.num_nodes == 5
+    assert graph.num_edges == 5  # duplicate edge is dropped
+    assert sorted(graph.followers(1)) == [2, 3, 4]
+    assert list(graph.following(3)) == [1, 2]
+    assert graph.followers_count(4) == 0
+    assert graph.following_count(4) == 2
+    assert len(graph.followers(100)) == 0
+    assert list(graph.in_degrees()) == [0, 3, 1, 1, 0]
+
+
+def test_incremental_merge():
+    graph = make_graph()
+    graph.add_edges([4, 7], [1, 1])
+    assert graph.pending == 2
+    graph.merge()
+    assert graph.pending == 0
+    assert graph.num_nodes == 8
+    assert list(graph.following(1)) == [4, 7]
+    assert sorted(graph.followers(1)) == [2, 3, 4]
+
+
+def test_merge_threshold():
+    graph = FollowerGraph(merge_threshold=2)
+    graph.add_edge(1, 2)
+    assert graph.pending == 1
+    graph.add_edge(2, 1)
+    assert graph.pending == 0
+    assert graph.num_edges == 2
+
+
+def test_k_hop():
+    graph = make_graph()
+    assert list(graph.k_hop(4, 1)) == [1, 3]
+    assert list(graph.k_hop(4, 2)) == [1, 2, 3]
+    assert list(graph.k_hop(1, 2, direction="in")) == [2, 3, 4]
+    assert len(graph.k_hop(0, 3)) == 0
+
+
+def test_pagerank():
+    graph = make_graph()
+    rank = graph.pagerank()
+    assert np.isclose(rank.sum(), 1.0)
+    # user 1 is followed by everyone
+    assert rank.argmax() == 1
+    scores = graph.scores([1, 4, 1000])
+    assert scores[0] > scores[1]
+    assert scores[2] == 0
+
+
+def test_save_and_mmap_load(tmp_path):
+    make_graph(str(tmp_path))
+    graph = FollowerGraph(str(tmp_path))
+    assert isinstance(graph._out_indices, np.memmap)
+    assert graph.num_edges == 5
+    assert sorted(graph.followers(1)) == [2, 3, 4]
+
+    graph.add_edge(4, 1)
+    graph.merge()
+    assert list(FollowerGraph(str(tmp_path)).followers(4)) == [1]
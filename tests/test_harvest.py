@@ -0,0 +1,128 @@
+import sqlite3
+
+import pytest
+
+from harvest import FollowerHarvester
+from sinks import SQLiteSink
+
+
+def account_html(username):
+    return (
+        f'<div data-testid="account"><a title="{username}" href="/@{username}">'
+        f"{username}</a></div>"
+    )
+
+
+class FakeElement:
+    def __init__(self, html):
+        self.html = html
+
+    async def get_html(self):
+        return self.html
+
+
+class VirtualListTab:
+    """Renders `visible` rows of a long list around the scroll position."""
+
+    def __init__(self, accounts, visible=10, step=4):
+        self.accounts = accounts
+        self.visible = visible
+        self.step = step
+        self.position = 0
+        self.waits = []
+
+    async def wait_for(self, selector):
+        pass
+
+    async def find_all(self, selector):
+        rows = self.accounts[self.position:self.position + self.visible]
+        return [FakeElement(account_html(a)) for a in rows]
+
+    async def scroll_down(self, amount):
+        self.position = min(self.position + self.step, len(self.accounts))
+
+    async def wait(self, seconds):
+        self.waits.append(seconds)
+
+    async def close(self):
+        pass
+
+
+class FakeBrowser:
+    def __init__(self, tab):
+        self.tab = tab
+
+    async def get(self, url, new_tab=False):
+        self.tab.position = 0
+        return self.tab
+
+
+def stored_followers(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [r[0] for r in conn.execute("SELECT follower FROM followers")]
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_harvest_resumes_from_checkpoint(tmp_path):
+    path = str(tmp_path / "crawl.db")
+    accounts = [f"fan{i}" for i in range(95)]
+    browser = FakeBrowser(VirtualListTab(accounts))
+
+    async with SQLiteSink(path) as sink:
+        harvester = FollowerHarvester(
+            sink, "star", chunk_size=7, session_budget=40, stay_tolerance=2
+        )
+        checkpoint = await harvester.run(browser)
+        assert not checkpoint.finished
+        assert checkpoint.harvested == 40
+        assert checkpoint.cursor == "fan39"
+        assert [c.username for c in await sink.get_unfinished_harvests()] == ["star"]
+
+    async with SQLiteSink(path) as sink:
+        harvester = FollowerHarvester(
+            sink, "star", chunk_size=7, session_budget=40, stay_tolerance=2
+        )
+        assert (await harvester.run(browser)).harvested == 80
+        checkpoint = await harvester.run(browser)
+        assert checkpoint.finished
+        assert checkpoint.harvested == 95
+        assert await sink.get_unfinished_harvests() == []
+
+    assert sorted(stored_followers(path)) == sorted(accounts)
+    # end of the list is only accepted after growing waits
+    assert browser.tab.waits[-2:] == [2, 4]
+
+
+@pytest.mark.asyncio
+async def test_harvest_keeps_bounded_window(tmp_path):
+    accounts = [f"fan{i}" for i in range(300)]
+    async with SQLiteSink(str(tmp_path / "crawl.db")) as sink:
+        harvester = FollowerHarvester(
+            sink, "star", window=20, stay_tolerance=1, session_budget=10_000
+        )
+        checkpoint = await harvester.run(FakeBrowser(VirtualListTab(accounts)))
+        assert checkpoint.finished
+        assert checkpoint.harvested == 300
+        assert len(harvester._recent_set) == 20
+
+
+def test_unknown_direction():
+    with pytest.raises(ValueError):
+        FollowerHarvester(SQLiteSink(":memory:"), "star", direction="friends")
+
+
+@pytest.mark.asyncio
+async def test_harvest_is_truncated_after_max_sessions(tmp_path):
+    tab = VirtualListTab([f"fan{i}" for i in range(95)])
+    async with SQLiteSink(str(tmp_path / "crawl.db")) as sink:
+        harvester = FollowerHarvester(
+            sink, "star", session_budget=20, max_sessions=2, stay_tolerance=2
+        )
+        assert not (await harvester.run(FakeBrowser(tab))).finished
+        checkpoint = await harvester.run(FakeBrowser(tab))
+        assert checkpoint.finished
+        assert checkpoint.harvested == 40
+        assert await sink.get_unfinished_harvests() == []
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import socket
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+from media import MediaDownloader, MediaStore
+from proxy import ProxyPool
+from sinks import SQLiteSink, read_sqlite_file
+
+IMAGE = os.urandom(200_000)
+
+
+class Handler(SimpleHTTPRequestHandler):
+    """Static files with keep-alive and Range support, counts what it serves."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("Range")))
+        # absolute urls, as sent to an http proxy
+        self.path = urlsplit(self.path)._replace(scheme="", netloc="").geturl()
+        if self.path == "/error":
+            self.send_error(500)
+            return
+        if self.path == "/moved":
+            self.send_response(302)
+            self.send_header("Location", "/a.jpg")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].removeprefix("bytes=").rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+
+@pytest.fixture
+def server(tmp_path):
+    root = tmp_path / "static"
+    root.mkdir()
+    for name in ("a.jpg", "copy_of_a.jpg"):
+        (root / name).write_bytes(IMAGE)
+    (root / "b.png").write_bytes(b"other content")
+
+    def handler(*args, **kwargs):
+        return Handler(*args, directory=str(root), **kwargs)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    httpd.connections = 0
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def stored_files(root):
+    return sorted(
+        name
+        for directory, _, names in os.walk(root)
+        if "partial" not in directory
+        for name in names
+    )
+
+
+@pytest.mark.asyncio
+async def test_content_addressed_downloads(server, tmp_path):
+    store = MediaStore(str(tmp_path / "media"))
+    urls = [f"{server.url}/{name}" for name in ("a.jpg", "copy_of_a.jpg", "b.png")]
+    async with SQLiteSink(str(tmp_path / "sink.db")) as sink:
+        downloader = MediaDownloader(store, per_host=1)
+        downloader.start(sink)
+        assert downloader.enqueue(urls + urls[:1]) == 3
+        assert downloader.enqueue(urls) == 0
+        await downloader.close()
+        assert downloader.stats["downloaded"] == 3
+        assert downloader.stats["duplicates"] == 1
+        # one pooled connection for every request to the host
+        assert server.connections == 1
+
+        # urls downloaded by an earlier run are not fetched again
+        downloader = MediaDownloader(store)
+        downloader.start(sink)
+        downloader.enqueue(urls)
+        await downloader.close()
+        assert downloader.stats["known"] == 3
+        assert len(server.requests) == 3
+
+    sha256 = hashlib.sha256(IMAGE).hexdigest()
+    assert stored_files(store.root) == sorted(
+        [f"{sha256}.jpg", f"{hashlib.sha256(b'other content').hexdigest()}.png"]
+    )
+    chunks = list(read_sqlite_file(str(tmp_path / "sink.db")))
+    files = sorted(f for chunk in chunks for f in chunk.media_files)
+    assert [f[0] for f in files] == sorted(urls)
+    assert files[0][1:] == (sha256, len(IMAGE), "image/jpeg", store.find(sha256))
+
+
+@pytest.mark.asyncio
+async def test_resumes_partial_download(server, tmp_path):
+    store = MediaStore(str(tmp_path / "media"))
+    url = f"{server.url}/a.jpg"
+    with open(store.partial_path(url), "wb") as f:
+        f.write(IMAGE[:50_000])
+
+    downloader = MediaDownloader(store)
+    downloader.start()
+    downloader.enqueue([url])
+    await downloader.close()
+    assert server.requests == [("/a.jpg", "bytes=50000-")]
+    assert downloader.stats["resumed"] == 1
+    assert downloader.stats["bytes"] == len(IMAGE) - 50_000
+    path = store.find(hashlib.sha256(IMAGE).hexdigest())
+    with open(os.path.join(store.root, path), "rb") as f:
+        assert f.read() == IMAGE
+    assert not os.listdir(os.path.join(store.root, "partial"))
+
+
+@pytest.mark.asyncio
+async def test_redirects_and_errors(server, tmp_path):
+    downloader = MediaDownloader(MediaStore(str(tmp_path / "media")), backoff=0.01)
+    downloader.start()
+    downloader.enqueue([f"{server.url}/{p}" for p in ("moved", "missing.jpg", "error")])
+    await downloader.close()
+    assert downloader.stats["downloaded"] == 1
+    assert downloader.stats["failed"] == 2
+    paths = [path for path, _ in server.requests]
+    # 404 is final, 500 is retried
+    assert paths.count("/missing.jpg") == 1
+    assert paths.count("/error") == downloader.retries + 1
+
+
+@pytest.mark.asyncio
+async def test_downloads_through_proxies(server, tmp_path):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        dead = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    # the test server serves absolute urls like an http proxy
+    pool = ProxyPool([dead, server.url], max_consecutive_errors=1)
+    downloader = MediaDownloader(
+        MediaStore(str(tmp_path / "media")), backoff=0.01, proxy_pool=pool
+    )
+    downloader.start()
+    downloader.enqueue(["http://media.invalid/a.jpg"])
+    await downloader.close()
+    assert downloader.stats["downloaded"] == 1
+    assert server.requests == [("http://media.invalid/a.jpg", None)]
+    dead_proxy, proxy = pool.proxies
+    assert not dead_proxy.healthy
+    assert (proxy.requests, proxy.errors, proxy.assigned) == (1, 0, 0)
@@ -96,4 +96,58 @@ def test_str():
 
 def test_reply_to():
     p = Post(html_data=REPLY_POST)
-    assert p.reply_to == 'realDonaldTrump'
\ No newline at end of file
+    assert p.reply_to == 'realDonaldTrump'
+
+
+def test_html_tree_released():
+    p = Post(html_data=ORDINARY_POST)
+    assert not hasattr(p, "_html_data")
+
+
+def test_entities():
+    html = MULTI_PARAGRAPHS_POST.replace(
+        "<p>:P</p>",
+        '<p>Thanks <span class="h-card"><a href="https://truthsocial.com/@Examore" '
+        'class="u-url mention">@<span>Examore</span></a></span> '
+        '<a href="https://truthsocial.com/tags/MAGA" class="mention hashtag">#<span>MAGA</span></a> '
+        '<a href="https://www.Example.com/news?id=1" rel="nofollow noopener">example.com/news</a> '
+        '<a href="https://truthsocial.com/tags/maga" class="hashtag">#maga</a></p>',
+    )
+    p = Post(html_data=html)
+    assert p.mentions == ["Examore"]
+    assert p.hashtags == ["maga"]
+    assert p.links == [("https://www.Example.com/news?id=1", "example.com")]
+
+    p = Post(html_data=ORDINARY_POST)
+    assert (p.mentions, p.hashtags, p.links) == ([], [], [])
+
+
+def test_external_links_are_not_entities():
+    links = [
+        "https://medium.com/@alice/my-article-123",
+        "https://youtube.com/@chan",
+        "https://example.com/tags/python",
+    ]
+    html = MULTI_PARAGRAPHS_POST.replace(
+        "<p>:P</p>",
+        "<p>" + " ".join(f'<a href="{url}" rel="nofollow">{url}</a>' for url in links)
+        + ' <a href="/@Examore">@Examore</a></p>',
+    )
+    p = Post(html_data=html)
+    assert p.mentions == ["Examore"]
+    assert p.hashtags == []
+    assert [url for url, _ in p.links] == links
+
+
+def test_media():
+    p = Post(html_data=REPOST_POST)
+    assert p.media == [
+        "https://static-assets-1.truthsocial.com/tmtg:prime-ts-assets/media_attachments"
+        "/files/113/851/897/324/428/827/original/7151b1753aeae398.jpg"
+    ]
+    assert p.avatar_url.endswith(
+        "/accounts/avatars/107/866/439/800/573/498/original/d6cc983439b96b5f.jpeg"
+    )
+
+    p = Post(html_data=ORDINARY_POST)
+    assert p.media == []
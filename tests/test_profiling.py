@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from profiling import CrawlProfiler, span
+
+
+class FakeSink:
+    async def save_posts(self, batch):
+        await asyncio.sleep(0.01)
+        return len(batch)
+
+    def name(self):
+        return "fake"
+
+
+@pytest.mark.asyncio
+async def test_spans_and_flame_graph(tmp_path):
+    profiler = CrawlProfiler(str(tmp_path), sample_rate=1.0)
+    profile = profiler.for_user("someone")
+    sink = profile.wrap(FakeSink(), "db")
+
+    with profile.span("download posts"):
+        with profile.span("parse"):
+            pass
+        assert await sink.save_posts([1, 2]) == 2
+        assert sink.name() == "fake"
+    profile.finish()
+    profiler.write()
+
+    with open(tmp_path / "someone.folded") as f:
+        stacks = dict(line.rsplit(" ", 1) for line in f.read().splitlines())
+    assert int(stacks["someone;download posts;db.save_posts"]) >= 10_000
+    assert set(profiler.durations) == {"download posts", "parse", "db.save_posts"}
+    assert (tmp_path / "crawl.folded").exists()
+    table = (tmp_path / "phases.txt").read_text()
+    assert table.splitlines()[1].startswith("download posts")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_spans_are_separate(tmp_path):
+    profile = CrawlProfiler(str(tmp_path)).for_user("someone")
+
+    async def page(name):
+        with profile.span(name):
+            await asyncio.sleep(0.01)
+
+    with profile.span("crawl threads"):
+        await asyncio.gather(page("a"), page("b"))
+    assert "someone;crawl threads;a" in profile.stacks
+    assert "someone;crawl threads;b" in profile.stacks
+    assert not any(";a;b" in stack or ";b;a" in stack for stack in profile.stacks)
+
+
+def test_sampling(tmp_path):
+    profiler = CrawlProfiler(str(tmp_path), sample_rate=0.0)
+    assert profiler.for_user("someone") is None
+    with span(None, "noop"):
+        pass
+    assert profiler.users == 0
@@ -0,0 +1,109 @@
+import asyncio
+import socket
+
+import pytest
+
+from proxy import Proxy, ProxyPool
+
+
+async def start_socks_server(reply: bytes = b"\x05\x00"):
+    """Local stand-in for a SOCKS5 proxy which only answers the greeting."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await reader.readexactly(3)
+        writer.write(reply)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"socks5://127.0.0.1:{port}"
+
+
+def free_port_url() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"socks5://127.0.0.1:{s.getsockname()[1]}"
+
+
+def test_proxy_url_parsing():
+    proxy = Proxy("socks5://localhost:2080")
+    assert proxy.scheme == "socks5"
+    assert proxy.host == "localhost"
+    assert proxy.port == 2080
+    assert proxy.healthy
+
+    with pytest.raises(ValueError):
+        Proxy("not a url")
+
+
+def test_pool_from_string():
+    pool = ProxyPool.from_string("socks5://a:1, socks5://b:2,")
+    assert [p.url for p in pool.proxies] == ["socks5://a:1", "socks5://b:2"]
+
+
+@pytest.mark.asyncio
+async def test_health_check():
+    server, url = await start_socks_server()
+    bad_server, bad_url = await start_socks_server(reply=b"\x05\xff")
+    async with server, bad_server:
+        pool = ProxyPool([url, bad_url, free_port_url()], check_timeout=1)
+        assert await pool.check_all() == 1
+        alive, bad, dead = pool.proxies
+        assert alive.healthy and alive.latency is not None
+        assert not bad.healthy
+        assert not dead.healthy
+
+
+@pytest.mark.asyncio
+async def test_acquire_balances_workers():
+    pool = ProxyPool(["socks5://a:1", "socks5://b:2"])
+    first = await pool.acquire()
+    second = await pool.acquire()
+    assert first is not second
+    pool.release(first)
+    assert await pool.acquire() is first
+
+
+@pytest.mark.asyncio
+async def test_errors_drain_proxy():
+    pool = ProxyPool(["socks5://a:1", "socks5://b:2"], max_consecutive_errors=2)
+    proxy = await pool.acquire()
+    pool.record_error(proxy)
+    pool.record_success(proxy)
+    pool.record_error(proxy)
+    assert proxy.healthy
+    pool.record_error(proxy)
+    assert not proxy.healthy
+    assert proxy.error_rate == 0.75
+
+    pool.release(proxy)
+    other = await pool.acquire()
+    assert other is not proxy
+
+
+@pytest.mark.asyncio
+async def test_drain_failed_proxy():
+    pool = ProxyPool(["socks5://a:1", "socks5://b:2"])
+    proxy = await pool.acquire()
+    pool.drain(proxy, "worker 0 failed")
+    assert not proxy.healthy
+    pool.release(proxy)
+    assert await pool.acquire() is not proxy
+
+
+@pytest.mark.asyncio
+async def test_drained_pool_waits_for_recovery():
+    server, url = await start_socks_server()
+    async with server:
+        pool = ProxyPool([url], max_consecutive_errors=1)
+        proxy = pool.proxies[0]
+        pool.record_error(proxy)
+        assert not pool.healthy
+
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+
+        await pool.check(proxy)
+        assert await asyncio.wait_for(waiter, 1) is proxy
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from scheduler import HostSample, LoopLagProbe, ResourceScheduler
+from supervisor import BrowserSupervisor, ProcessSample
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+
+MB = 1024 * 1024
+
+
+class FakeSupervisor(BrowserSupervisor):
+    def __init__(self, costs):
+        super().__init__()
+        self._costs = costs
+
+    def costs(self):
+        return self._costs
+
+
+def make_scheduler(costs=(), **kwargs):
+    scheduler = ResourceScheduler(FakeSupervisor(list(costs)), **kwargs)
+    # 16 CPUs and 16GB whatever the test host is
+    scheduler._cpus, scheduler._memory_mb = 16, 16 * 1024
+    return scheduler
+
+
+def test_scales_browsers_then_tabs():
+    scheduler = make_scheduler(max_browsers=2, max_tabs=3)
+    idle = HostSample(cpu=0.1, memory=0.2)
+    assert scheduler.decide(idle) == (2, 1)
+    assert scheduler.decide(idle) == (2, 2)
+    assert scheduler.decide(idle) == (2, 3)
+    assert scheduler.decide(idle) == (2, 3)
+    assert scheduler.db_connections == 4
+
+
+def test_sheds_tabs_then_browsers():
+    scheduler = make_scheduler(max_browsers=4)
+    scheduler.browsers, scheduler.tabs = 3, 2
+    assert scheduler.decide(HostSample(swapped_pages=10)) == (3, 1)
+    assert scheduler.decide(HostSample(cpu=0.95)) == (2, 1)
+    assert scheduler.decide(HostSample(loop_lag=2.0)) == (1, 1)
+    assert scheduler.decide(HostSample(memory=0.99)) == (1, 1)
+
+
+def test_measured_browser_cost_limits_scale_up():
+    # 4GB browsers, 1GB of headroom below the budget
+    heavy = [(ProcessSample(rss=4096 * MB, processes=8), 0.5)]
+    scheduler = make_scheduler(heavy, max_browsers=10)
+    assert scheduler.decide(HostSample(cpu=0.1, memory=0.79)) == (1, 1)
+    assert scheduler.decide(HostSample(cpu=0.1, memory=0.5)) == (2, 1)
+
+
+def test_host_sample():
+    scheduler = ResourceScheduler(BrowserSupervisor())
+    assert scheduler.max_browsers >= 1
+    time.sleep(0.05)
+    host = scheduler.sample()
+    assert 0 <= host.cpu <= 1
+    assert 0 < host.memory < 1
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_probe():
+    probe = LoopLagProbe(interval=0.01)
+    probe.start()
+    await asyncio.sleep(0.02)
+    time.sleep(0.1)  # blocks the loop
+    await asyncio.sleep(0.02)
+    probe.stop()
+    assert probe.take() >= 0.05
+    assert probe.take() == 0
@@ -0,0 +1,251 @@
+import os
+from collections import Counter
+from datetime import datetime
+
+import pytest
+from dotenv import load_dotenv
+
+import dedup
+from entities import Follower, FollowerBatch, InteractionBatch, Post, PostBatch
+from sharding import ShardedDatabase, jump_hash, split_chunk
+from sinks import StagedChunk, split_dsns
+
+load_dotenv()
+# comma separated URLs of empty databases, e.g. two local PostgreSQL servers
+shard_dsns = os.environ.get("TEST_SHARD_DSNS")
+
+
+def make_post(post_id, owner):
+    return Post(
+        post_id=post_id,
+        owner=owner,
+        reply_to=None,
+        timestamp=datetime(2025, 1, 19),
+        is_repost=False,
+        who_reposted=None,
+        text=f"post {post_id}",
+        likes=post_id,
+    )
+
+
+class FakeShard:
+    """Records writes; as the directory, allocates ids 1, 2, ... by username."""
+
+    def __init__(self):
+        self.ids = {}
+        self.posts = []
+        self.followers = []
+        self.interactions = []
+        self.chunks = []
+        # rows of the reads
+        self.conversation = []
+        self.hashtags = Counter()
+        self.active_users = []
+        self.signatures = {}
+
+    async def allocate_user_ids(self, usernames):
+        for username in sorted(set(usernames)):
+            self.ids.setdefault(username, len(self.ids) + 1)
+        return {username: self.ids[username] for username in usernames}
+
+    async def save_posts(self, batch):
+        self.posts += batch.post_id
+
+    async def save_followers(self, batch):
+        self.followers += batch.username
+        return [(1, i) for i in range(len(batch))]
+
+    async def save_interactions(self, batch):
+        self.interactions += batch.post_id
+
+    async def get_existing_post_ids(self, post_ids):
+        return set(self.posts) & set(post_ids)
+
+    async def bulk_load(self, chunk):
+        self.chunks.append(chunk)
+
+    async def get_conversation(self, root_id):
+        return self.conversation
+
+    async def get_top_hashtags(self, since, until, limit):
+        rows = [{"tag": tag, "posts": posts} for tag, posts in self.hashtags.most_common()]
+        return rows[:limit]
+
+    async def get_most_active_users(self, since, until, limit):
+        return self.active_users[:limit]
+
+    async def get_signature(self, post_id):
+        return self.signatures.get(post_id)
+
+    async def get_bucket_mates(self, signature):
+        keys = set(dedup.band_keys(dedup.from_bytes([signature]))[0].tolist())
+        return [
+            {"post_id": post_id, "signature": other}
+            for post_id, other in self.signatures.items()
+            if keys & set(dedup.band_keys(dedup.from_bytes([other]))[0].tolist())
+        ]
+
+    async def get_signatures(self, since, until):
+        return [{"post_id": i, "signature": s} for i, s in self.signatures.items()]
+
+
+def sharded(shards=3):
+    db = ShardedDatabase([f"postgresql://localhost/shard{i}" for i in range(shards)])
+    db.shards = [FakeShard() for _ in range(shards)]
+    db.directory = db.shards[0]
+    return db
+
+
+def test_jump_hash():
+    assert [jump_hash(key, 1) for key in range(100)] == [0] * 100
+    counts = Counter(jump_hash(key, 4) for key in range(40_000))
+    assert sorted(counts) == [0, 1, 2, 3]
+    assert min(counts.values()) > 9_000
+    # a new bucket takes keys only from the others, about 1/5 of them
+    moved = [key for key in range(40_000) if jump_hash(key, 5) != jump_hash(key, 4)]
+    assert {jump_hash(key, 5) for key in moved} == {4}
+    assert 7_000 < len(moved) < 9_000
+
+
+def test_split_dsns():
+    assert split_dsns("postgresql://a/ts, postgres://b/ts") == [
+        "postgresql://a/ts",
+        "postgres://b/ts",
+    ]
+    assert split_dsns("postgresql://h1,h2/ts") == ["postgresql://h1,h2/ts"]
+
+
+@pytest.mark.asyncio
+async def test_writes_are_routed_by_user():
+    db = sharded()
+    owners = [f"user{i}" for i in range(30)]
+    await db.save_posts(PostBatch(make_post(i, owner) for i, owner in enumerate(owners)))
+    ids = db.directory.ids
+    for index, shard in enumerate(db.shards):
+        assert all(db.shard_index(ids[owners[i]]) == index for i in shard.posts)
+    assert sorted(i for shard in db.shards for i in shard.posts) == list(range(30))
+
+    edges = FollowerBatch(Follower("user3", f"fan{i}", None) for i in range(5))
+    assert len(await db.save_followers(edges)) == 5
+    assert db.shard_of(ids["user3"]).followers == [f"fan{i}" for i in range(5)]
+
+    interactions = InteractionBatch()
+    interactions.append(7, "fan1", "like")
+    interactions.append(12, "fan2", "repost")
+    interactions.append(999, "fan3", "like")
+    db._post_shards.clear()
+    await db.save_interactions(interactions)
+    # interactions follow their post, those of unknown posts are dropped
+    assert db.shard_of(ids["user7"]).interactions.count(7) == 1
+    assert db.shard_of(ids["user12"]).interactions.count(12) == 1
+    assert sum(len(shard.interactions) for shard in db.shards) == 2
+
+
+@pytest.mark.asyncio
+async def test_thread_spans_shards():
+    db = sharded()
+
+    def post(post_id, parent_id):
+        return {"id": post_id, "parent_id": parent_id, "owner": f"user{post_id}"}
+
+    db.shards[0].conversation = [post(1, None), post(4, 1)]
+    # 5 replies to a post which was not crawled
+    db.shards[1].conversation = [post(2, 1), post(5, 99)]
+    db.shards[2].conversation = [post(3, 2)]
+    thread = await db.get_thread(1)
+    assert [(p["id"], p["depth"], p["path"]) for p in thread] == [
+        (1, 0, [1]),
+        (2, 1, [1, 2]),
+        (3, 2, [1, 2, 3]),
+        (4, 1, [1, 4]),
+    ]
+    assert [p["id"] for p in await db.get_thread(1, limit=2)] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_counts_and_rankings_are_merged():
+    db = sharded()
+    db.shards[0].hashtags.update({"maga": 3, "usa": 1})
+    db.shards[1].hashtags.update({"maga": 2, "news": 4, "usa": 1})
+    top = await db.get_top_hashtags(datetime(2025, 1, 1), limit=2)
+    assert [(row["tag"], row["posts"]) for row in top] == [("maga", 5), ("news", 4)]
+
+    db.shards[0].active_users = [
+        {"username": "a", "posts": 9},
+        {"username": "c", "posts": 1},
+    ]
+    db.shards[2].active_users = [{"username": "b", "posts": 9}]
+    active = await db.get_most_active_users(datetime(2025, 1, 1).date(), limit=2)
+    assert [row["username"] for row in active] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_near_duplicates_span_shards():
+    text = "Call your senators today and demand a full audit of the vote in every county"
+    texts = [text, text + "!!", "Something else entirely, nothing alike"]
+    _, signatures = dedup.signatures(texts)
+    db = sharded()
+    for shard, post_id, signature in zip(db.shards, (1, 2, 3), signatures):
+        shard.signatures[post_id] = dedup.to_bytes(signature)
+
+    found = await db.get_near_duplicates(1)
+    assert [post_id for post_id, _ in found] == [2]
+    assert await db.get_near_duplicates(404) == []
+    clusters = await db.cluster_posts(datetime(2025, 1, 1), datetime(2025, 2, 1))
+    assert clusters == [[1, 2]]
+
+
+def test_split_chunk():
+    chunk = StagedChunk()
+    chunk.add_profile({
+        "username": "alice", "name": "Alice", "followers": 1, "following": 2,
+        "registration_date": None, "location": None, "personal_site": None, "bio": "",
+    })
+    chunk.set_status("alice", "parsed")
+    chunk.posts.append((1, "hi", "alice", None, 0, 0, 0, datetime(2025, 1, 1), None, None))
+    chunk.mentions.append((1, "bob"))
+    chunk.mentions.append((2, "bob"))
+    chunk.followers.append(("bob", "alice"))
+    chunk.media_files.append(("http://x/a.jpg", "ab", 1, "image/jpeg", "ab.jpg"))
+
+    parts = split_chunk(chunk, {"alice": 1, "bob": 2}, {1: 1}, 3)
+    assert parts[1].users["alice"][:2] == [True, "Alice"]
+    assert parts[1].users["alice"][8] is None
+    assert parts[0].users["alice"][8] == "parsed"
+    assert len(parts[1].posts) == 1
+    # post 2 is on no shard
+    assert parts[1].mentions == [(1, "bob")]
+    assert parts[2].followers == [("bob", "alice")]
+    assert len(parts[0].media_files) == 1
+    assert not parts[0].mentions and not parts[2].mentions
+
+
+@pytest.mark.skipif(not shard_dsns, reason="TEST_SHARD_DSNS is not set")
+@pytest.mark.asyncio
+async def test_sharded_database_rebalance():
+    import db_manage
+
+    dsns = split_dsns(shard_dsns)
+    await db_manage.drop_tables(shard_dsns, confirm=False)
+    await db_manage.create_tables(shard_dsns)
+
+    owners = [f"user{i}" for i in range(20)]
+    batch = PostBatch(make_post(i, owner) for i, owner in enumerate(owners, 1))
+    async with ShardedDatabase(dsns[:1]) as db:
+        await db.save_posts(batch)
+        await db.save_followers(FollowerBatch(Follower("user1", "fan", None) for _ in "x"))
+
+    async with ShardedDatabase(dsns) as db:
+        moved = await db.rebalance()
+        assert 0 < moved < 20
+        resident = [await shard.get_resident_user_ids() for shard in db.shards]
+        for index, user_ids in enumerate(resident):
+            assert all(db.shard_index(user_id) == index for user_id in user_ids)
+        # again, nothing left to move
+        assert await db.rebalance() == 0
+
+        posts = await db.get_posts_by_date(limit=50)
+        assert [p["id"] for p in posts] == list(range(20, 0, -1))
+        assert [f["username"] for f in await db.get_followers("user1")] == ["fan"]
+        user = await db.get_user("user5")
+        assert user["id"] == (await db.directory.get_user("user5"))["id"]
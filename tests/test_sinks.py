@@ -0,0 +1,167 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from entities import (
+    Follower,
+    FollowerBatch,
+    InteractionBatch,
+    Post,
+    PostBatch,
+    User,
+)
+from sinks import (
+    JsonlSink,
+    Sink,
+    SQLiteSink,
+    WriteStats,
+    open_sink,
+    read_jsonl_segment,
+    read_sqlite_file,
+)
+
+
+def make_posts():
+    return PostBatch(
+        [
+            Post(
+                post_id=1,
+                owner="owner",
+                reply_to="replied",
+                timestamp=datetime(2025, 1, 19, 10, 28),
+                text="first",
+                likes=5,
+                media=["https://cdn/a.jpg"],
+                avatar_url="https://cdn/owner.jpg",
+            ),
+            Post(
+                post_id=2,
+                owner="author",
+                timestamp=datetime(2025, 1, 19, 11),
+                is_repost=True,
+                who_reposted="owner",
+                text="second",
+            ),
+        ]
+    )
+
+
+def make_user():
+    return User(
+        username="owner",
+        name="Owner",
+        followers_num=10,
+        following_num=2,
+        registration_date=datetime(2022, 5, 1),
+    )
+
+
+def make_followers():
+    return FollowerBatch([Follower("owner", username="fan", name="Fan")])
+
+
+def make_interactions():
+    batch = InteractionBatch()
+    batch.append(1, "fan", "liked", "Fan")
+    batch.append(2, "owner", "reposted")
+    return batch
+
+
+def test_open_sink(tmp_path):
+    assert isinstance(open_sink(f"sqlite://{tmp_path}/crawl.db"), SQLiteSink)
+    assert isinstance(open_sink(f"jsonl://{tmp_path}/crawl"), JsonlSink)
+
+
+def test_incomplete_sink_is_rejected():
+    class PostsOnly(Sink):
+        async def save_posts(self, batch):
+            pass
+
+    with pytest.raises(TypeError, match="save_user"):
+        PostsOnly()
+
+
+def test_write_stats():
+    stats = WriteStats()
+    stats.record("posts", 10, 4)
+    stats.record("posts", 5, 0)
+    stats.record("users", 1, 1)
+    assert stats.skipped("posts") == 11
+    assert stats.skipped("users") == 0
+    assert stats.summary() == (
+        "posts: submitted=15 written=4 skipped=11 "
+        "users: submitted=1 written=1 skipped=0"
+    )
+
+
+@pytest.mark.asyncio
+async def test_sqlite_sink(tmp_path):
+    path = str(tmp_path / "crawl.db")
+    async with SQLiteSink(path) as sink:
+        await sink.save_posts(make_posts())
+        await sink.save_posts(make_posts())
+        await sink.save_user(make_user())
+        assert await sink.save_followers(make_followers()) == []
+        await sink.save_interactions(make_interactions())
+        await sink.mark_user_parsed("owner")
+        pending = await sink.get_bunch_of_usernames(limit=10)
+        assert sorted(pending) == ["author", "fan", "replied"]
+
+    chunks = list(read_sqlite_file(path, chunk_size=2))
+    users = {}
+    posts, interactions, followers, media, avatars = [], [], [], [], []
+    for chunk in chunks:
+        users.update(chunk.users)
+        posts += chunk.posts
+        interactions += chunk.interactions
+        followers += chunk.followers
+        media += chunk.media
+        avatars += chunk.avatars
+    assert users["owner"][0] is True
+    assert users["owner"][8] == "parsed"
+    assert users["fan"][1] == "Fan"
+    # only seen as a follower, no status to merge
+    assert users["fan"][8] is None
+    assert [p[0] for p in posts] == [1, 2]
+    assert posts[0][7] == datetime(2025, 1, 19, 10, 28)
+    assert sorted(interactions) == [(1, "fan", "liked"), (2, "owner", "reposted")]
+    assert followers == [("owner", "fan")]
+    assert media == [(1, "https://cdn/a.jpg", 0)]
+    assert avatars == [("owner", "https://cdn/owner.jpg")]
+
+
+@pytest.mark.asyncio
+async def test_jsonl_sink_rotation(tmp_path):
+    directory = str(tmp_path / "crawl")
+    async with JsonlSink(directory, max_segment_bytes=200) as sink:
+        await sink.save_user(make_user())
+        await sink.save_posts(make_posts())
+        await sink.save_followers(make_followers())
+        await sink.save_interactions(make_interactions())
+        await sink.mark_user_parsed("owner")
+        assert "owner" not in await sink.get_bunch_of_usernames(limit=10)
+        assert "fan" in await sink.get_bunch_of_usernames(limit=10)
+
+    segments = sorted(os.listdir(directory))
+    assert len(segments) > 1
+    assert all(name.endswith(".jsonl") for name in segments)
+
+    users = []
+    posts, interactions, followers, media = [], [], [], []
+    for name in segments:
+        for chunk in read_jsonl_segment(os.path.join(directory, name)):
+            users += chunk.user_rows()
+            posts += chunk.posts
+            interactions += chunk.interactions
+            followers += chunk.followers
+            media += chunk.media + chunk.avatars
+    profile = next(u for u in users if u[0] == "owner" and u[1])
+    assert profile[5] == datetime(2022, 5, 1).date()
+    assert ("owner", False, *[None] * 7, "parsed") in users
+    assert [p[0] for p in posts] == [1, 2]
+    assert interactions == [
+        (2, "owner", "reposted"), (1, "fan", "liked"), (2, "owner", "reposted")
+    ]
+    assert followers == [("owner", "fan")]
+    assert media == [(1, "https://cdn/a.jpg", 0), ("owner", "https://cdn/owner.jpg")]
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from supervisor import BrowserSupervisor, sample_process_tree
+
+
+class FakeBrowser:
+    def __init__(self, pid, stopped=False):
+        self._process_pid = pid
+        self.stopped = stopped
+        self.connection = None if stopped else FakeConnection()
+
+
+class FakeConnection:
+    async def send(self, command):
+        return "Chrome/120"
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+def test_sample_process_tree():
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(5)"])
+    try:
+        sample = sample_process_tree(os.getpid())
+        assert sample.processes >= 2
+        assert sample.rss > sample_process_tree(child.pid).rss > 0
+    finally:
+        child.kill()
+        child.wait()
+    assert sample_process_tree(2**22 + 1).processes == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+async def test_recycle_reasons():
+    browser = FakeBrowser(os.getpid())
+    supervisor = BrowserSupervisor(max_users=2)
+    supervisor.register(browser)
+    assert await supervisor.recycle_reason(browser) is None
+    supervisor.user_done(browser)
+    supervisor.user_done(browser)
+    assert await supervisor.recycle_reason(browser) == "users"
+
+    dead = FakeBrowser(os.getpid(), stopped=True)
+    assert await supervisor.recycle_reason(dead) == "dead"
+    supervisor = BrowserSupervisor(max_rss_mb=1)
+    assert await supervisor.recycle_reason(browser) == "memory"
+    assert supervisor.recycled == {"memory": 1}
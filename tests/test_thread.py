@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+
+from entities import Post
+from test_post import ORDINARY_POST
+from thread import ThreadCrawler, link_thread
+
+ORDINARY_POST_ID = "113853838355066029"
+
+
+def post_html(post_id):
+    return ORDINARY_POST.replace(ORDINARY_POST_ID, str(post_id))
+
+
+def make_post(post_id):
+    return Post(post_id=post_id, owner="owner", timestamp=datetime(2025, 1, 1))
+
+
+class FakeElement:
+    def __init__(self, html):
+        self.html = html
+
+    async def get_html(self):
+        return self.html
+
+
+class FakeTab:
+    def __init__(self, posts):
+        self.posts = posts
+
+    async def wait_for(self, selector):
+        pass
+
+    async def find_all(self, selector):
+        return [FakeElement(post_html(i)) for i in self.posts]
+
+    async def close(self):
+        pass
+
+
+class FakeBrowser:
+    """Thread pages of the conversation 1 -> (2 -> 4, 3)."""
+
+    pages = {1: [1, 2, 4, 3], 2: [1, 2, 4], 3: [1, 3], 4: [1, 2, 4]}
+
+    def __init__(self):
+        self.opened = []
+
+    async def get(self, url, new_tab=False):
+        post_id = int(url.rsplit("/", 1)[1])
+        self.opened.append(post_id)
+        return FakeTab(self.pages[post_id])
+
+
+class RecordingSink:
+    def __init__(self):
+        self.links = {}
+
+    async def save_posts(self, batch):
+        for post_id, parent_id, root_id in batch.thread_links():
+            known = self.links.get(post_id, (None, None))[0]
+            self.links[post_id] = (parent_id or known, root_id)
+
+
+def test_link_thread():
+    posts = [make_post(i) for i in (1, 2, 4, 5)]
+    replies = link_thread(posts, 4)
+    assert [(p.parent_id, p.root_id) for p in posts] == [
+        (None, 1), (1, 1), (2, 1), (None, 1)
+    ]
+    assert [p.post_id for p in replies] == [5]
+
+    with pytest.raises(ValueError):
+        link_thread(posts, 6)
+
+
+@pytest.mark.asyncio
+async def test_thread_crawler():
+    browser, sink = FakeBrowser(), RecordingSink()
+    opened = await ThreadCrawler(browser, sink).crawl("owner", 1)
+    assert opened == 4
+    assert sorted(browser.opened) == [1, 2, 3, 4]
+    assert sink.links == {1: (None, 1), 2: (1, 1), 3: (1, 1), 4: (2, 1)}
+
+    browser = FakeBrowser()
+    assert await ThreadCrawler(browser, RecordingSink(), max_posts=2).crawl(
+        "owner", 1
+    ) == 2
+
+
+@pytest.mark.asyncio
+async def test_thread_crawler_starts_from_root():
+    browser, sink = FakeBrowser(), RecordingSink()
+    crawler = ThreadCrawler(browser, sink)
+    # a reply deep in the thread, the sibling branch of 3 is crawled too
+    assert await crawler.crawl("owner", 4) == 4
+    assert sink.links == {1: (None, 1), 2: (1, 1), 3: (1, 1), 4: (2, 1)}
+    # another reply to the same conversation opens nothing again
+    assert await crawler.crawl("owner", 3) == 0
+    assert sorted(browser.opened) == [1, 2, 3, 4]
@@ -0,0 +1,83 @@
+import pytest
+
+from entities import PostBatch
+from test_post import MULTI_PARAGRAPHS_POST, ORDINARY_POST
+from watch import AccountWatcher, WatchStats
+
+
+class FakeElement:
+    def __init__(self, html):
+        self.html = html
+
+    async def get_html(self):
+        return self.html
+
+
+class FakeTab:
+    def __init__(self, feed):
+        self.feed = feed
+        self.reloads = 0
+
+    async def reload(self):
+        self.reloads += 1
+
+    async def wait_for(self, selector):
+        pass
+
+    async def find_all(self, selector):
+        return [FakeElement(html) for html in self.feed]
+
+    async def close(self):
+        pass
+
+
+class FakeBrowser:
+    def __init__(self, tab):
+        self.tab = tab
+
+    async def get(self, url, new_tab=False):
+        return self.tab
+
+
+class FakeSink:
+    def __init__(self):
+        self.saved: list[PostBatch] = []
+
+    async def save_posts(self, batch):
+        self.saved.append(batch)
+
+
+@pytest.mark.asyncio
+async def test_detects_new_posts_on_top():
+    tab = FakeTab([ORDINARY_POST])
+    sink = FakeSink()
+    stats = WatchStats()
+    watcher = AccountWatcher(
+        "examore", sink, stats, min_interval=5, max_interval=60, backoff=2
+    )
+    browser = FakeBrowser(tab)
+
+    # first poll only learns what is already on the page
+    assert await watcher.poll(browser) == 0
+    assert watcher.interval == 10
+    assert await watcher.poll(browser) == 0
+    assert tab.reloads == 1
+    assert watcher.interval == 20
+
+    tab.feed = [MULTI_PARAGRAPHS_POST, ORDINARY_POST]
+    assert await watcher.poll(browser) == 1
+    assert watcher.interval == 10
+    assert list(sink.saved[-1].post_id) == [113856066939503017]
+    assert stats.detected == 1
+    assert stats.polls == 3
+    assert len(stats.post_age) == 1
+
+    assert await watcher.poll(browser) == 0
+    assert len(sink.saved) == 2
+
+
+def test_stats_summary():
+    stats = WatchStats()
+    for age in (1, 2, 3, 4):
+        stats.record(age, age / 2)
+    assert "p50=3.0s" in stats.summary()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+import nodriver as uc
+
+from constants import BASE_URL, THREAD_POST_SELECTOR
+from entities import Post, PostBatch
+from sinks import Sink
+
+
+def link_thread(posts: list[Post], focused_id: int) -> list[Post]:
+    """
+    Sets `parent_id` and `root_id` of the posts of a thread page.
+
+    A thread page renders the ancestors of the opened post from the root
+    down, then the post itself, then its replies. Ancestors and the opened
+    post form a chain, replies only get the root: their parent is known once
+    their own page is opened. Returns the replies.
+    """
+    ids = [post.post_id for post in posts]
+    if focused_id not in ids:
+        raise ValueError(f"Post {focused_id} not found on its thread page")
+    focused = ids.index(focused_id)
+    root_id = ids[0]
+    for i, post in enumerate(posts):
+        post.root_id = root_id
+        if 0 < i <= focused:
+            post.parent_id = ids[i - 1]
+    return posts[focused + 1:]
+
+
+class ThreadCrawler:
+    """
+    Crawls conversations page by page.
+
+    Every opened post page links the post to its parent, and its replies are
+    opened next, at most `max_concurrent_tabs` pages at a time, until the
+    whole conversation or `max_posts` pages of it are crawled. The root of
+    the conversation is opened too, so branches beside the crawled post
+    are linked as well. Pages opened by an earlier `crawl` of the same
+    crawler are not opened again, so replies to one conversation cost one
+    crawl.
+    """
+
+    def __init__(
+        self,
+        browser: uc.Browser,
+        sink: Sink,
+        max_posts: int = 100,
+        max_concurrent_tabs: int = 3,
+    ):
+        self.browser = browser
+        self.sink = sink
+        self.max_posts = max_posts
+        self._tabs = asyncio.Semaphore(max_concurrent_tabs)
+        self._visited: set[int] = set()
+
+    async def fetch(self, owner: str, post_id: int) -> tuple[PostBatch, list[Post]]:
+        """Opens a post page. Returns every post of the page and the replies."""
+        async with self._tabs:
+            tab = await self.browser.get(
+                f"{BASE_URL}/@{owner}/posts/{post_id}", new_tab=True
+            )
+            try:
+                await tab.wait_for(THREAD_POST_SELECTOR)
+                found = await tab.find_all(THREAD_POST_SELECTOR)
+                posts = [Post(html_data=await element.get_html()) for element in found]
+            finally:
+                await tab.close()
+        replies = link_thread(posts, post_id)
+        return PostBatch(posts), replies
+
+    async def crawl(self, owner: str, post_id: int) -> int:
+        """Crawls the conversation of a post. Returns the number of opened pages."""
+        visited = self._visited
+        if post_id in visited:
+            return 0
+        visited.add(post_id)
+        level = [(owner, post_id)]
+        opened = 0
+        while level and opened < self.max_posts:
+            level = level[:self.max_posts - opened]
+            opened += len(level)
+            results = await asyncio.gather(
+                *(self.fetch(o, i) for o, i in level), return_exceptions=True
+            )
+            next_level = []
+            for (o, i), result in zip(level, results):
+                if isinstance(result, (TimeoutError, ValueError)):
+                    logging.error(f"Failed to crawl thread page {i} of @{o}: {result}")
+                    continue
+                if isinstance(result, BaseException):
+                    raise result
+                batch, replies = result
+                await self.sink.save_posts(batch)
+                # the first post of a page is the root, the ancestors of
+                # the post and their other replies are reached from it
+                root = (batch.owner[0], batch.post_id[0])
+                for page in [root, *((r.owner, r.post_id) for r in replies)]:
+                    if page[1] not in visited:
+                        visited.add(page[1])
+                        next_level.append(page)
+            level = next_level
+        return opened
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from time import monotonic
+
+import nodriver as uc
+
+from constants import BASE_URL, POST_SELECTOR
+from entities import Post, PostBatch
+from sinks import Sink
+
+
+class WatchStats:
+    """
+    Detection latency of new posts.
+
+    `post_age` is the time between the post timestamp and its detection.
+    Post timestamps have minute resolution, so `poll_gap` (time since the
+    previous poll of the account, an upper bound of the detection delay)
+    is reported as well.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.post_age: deque[float] = deque(maxlen=window)
+        self.poll_gap: deque[float] = deque(maxlen=window)
+        self.polls = 0
+        self.detected = 0
+
+    def record(self, post_age: float, poll_gap: float):
+        self.post_age.append(post_age)
+        self.poll_gap.append(poll_gap)
+        self.detected += 1
+
+    @staticmethod
+    def _quantile(values, q: float) -> float:
+        if not values:
+            return float("nan")
+        ordered = sorted(values)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def summary(self) -> str:
+        return (
+            f"polls={self.polls} new_posts={self.detected} "
+            f"post_age p50={self._quantile(self.post_age, 0.5):.1f}s "
+            f"p95={self._quantile(self.post_age, 0.95):.1f}s "
+            f"poll_gap p50={self._quantile(self.poll_gap, 0.5):.1f}s "
+            f"p95={self._quantile(self.poll_gap, 0.95):.1f}s"
+        )
+
+
+class AccountWatcher:
+    """
+    Keeps a tab open on one account and reloads it on an adaptive interval.
+
+    Only the posts already rendered at the top of the feed are read, there is
+    no scrolling. The interval halves (down to `min_interval`) every time a new
+    post is found and grows by `backoff` (up to `max_interval`) when nothing
+    changed, so active accounts are polled more often.
+    """
+
+    tab: uc.Tab | None
+
+    def __init__(
+        self,
+        username: str,
+        sink: Sink,
+        stats: WatchStats,
+        min_interval: float = 5.0,
+        max_interval: float = 120.0,
+        backoff: float = 1.5,
+        top_posts: int = 5,
+    ):
+        self.username = username
+        self.sink = sink
+        self.stats = stats
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.top_posts = top_posts
+        self.interval = min_interval
+        self.tab = None
+        self._seen: set[int] = set()
+        self._last_poll: float | None = None
+
+    async def poll(self, browser: uc.Browser) -> int:
+        """Reloads the feed and saves new posts. Returns number of new posts."""
+        if self.tab is None:
+            self.tab = await browser.get(f"{BASE_URL}/@{self.username}", new_tab=True)
+        else:
+            await self.tab.reload()
+        await self.tab.wait_for(POST_SELECTOR)
+        found = await self.tab.find_all(POST_SELECTOR)
+
+        new_posts = PostBatch()
+        for element in found[:self.top_posts]:
+            post = Post(html_data=await element.get_html())
+            if post.post_id not in self._seen:
+                new_posts.append(post)
+
+        now, detected_at = monotonic(), datetime.now()
+        first_poll = self._last_poll is None
+        poll_gap = now - self._last_poll if self._last_poll is not None else 0.0
+        self._last_poll = now
+        self.stats.polls += 1
+
+        if len(new_posts):
+            await self.sink.save_posts(new_posts)
+            self._seen.update(new_posts.post_id)
+        # everything found on the first poll is already known, not new
+        if first_poll or not len(new_posts):
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+            return 0
+
+        for ts in new_posts.timestamp:
+            self.stats.record((detected_at - ts).total_seconds(), poll_gap)
+        logging.info(f"@{self.username}: {len(new_posts)} new posts")
+        self.interval = max(self.interval / 2, self.min_interval)
+        return len(new_posts)
+
+    async def close(self):
+        if self.tab is not None:
+            await self.tab.close()
+            self.tab = None
+
+
+class Watcher:
+    """
+    Watches a hot set of accounts with one persistent tab per account.
+
+    At most `max_concurrent_polls` tabs reload at the same time, which bounds
+    the load the watcher puts on its browser and proxy. It is meant to run on
+    its own browser next to the bulk crawl workers.
+    """
+
+    def __init__(
+        self,
+        browser: uc.Browser,
+        usernames: list[str],
+        sink: Sink,
+        max_concurrent_polls: int = 3,
+        report_interval: float = 60.0,
+        **watcher_kwargs,
+    ):
+        self.browser = browser
+        self.stats = WatchStats()
+        self.accounts = [
+            AccountWatcher(u, sink, self.stats, **watcher_kwargs) for u in usernames
+        ]
+        self.report_interval = report_interval
+        self._polls = asyncio.Semaphore(max_concurrent_polls)
+
+    async def run(self):
+        tasks = [asyncio.create_task(self._watch(a)) for a in self.accounts]
+        tasks.append(asyncio.create_task(self._report()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for account in self.accounts:
+                await account.close()
+            logging.info(f"Watch stats: {self.stats.summary()}")
+
+    async def _watch(self, account: AccountWatcher):
+        while True:
+            async with self._polls:
+                try:
+                    await account.poll(self.browser)
+                except (TimeoutError, ValueError) as e:
+                    logging.error(f"Failed to poll @{account.username}: {e}")
+                    account.interval = min(
+                        account.interval * account.backoff, account.max_interval
+                    )
+            await asyncio.sleep(account.interval)
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            logging.info(f"Watch stats: {self.stats.summary()}")